@@ -3,8 +3,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_migrate import Migrate
 from config import Config
+from .routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 
 def create_app(config_class=Config):
@@ -18,6 +19,50 @@ def create_app(config_class=Config):
   migrate.init_app(app, db)
   CORS(app)
 
+  # orjson を使うJSONエンコーダー
+  from .serializers import init_serializers
+  init_serializers(app)
+
+  # 読み取りのレプリカへの振り分け
+  from .routing import init_routing
+  init_routing(app)
+
+  # リクエストごとのクエリ数・DB時間の計測
+  from .instrumentation import init_instrumentation
+  init_instrumentation(app)
+
+  # Server-Timingヘッダーと /metrics（Prometheus）
+  from .metrics import init_metrics
+  init_metrics(app)
+
+  # 読み取りキャッシュ
+  from .cache import init_cache
+  init_cache(app)
+
+  # 同時に来た同じ読み取りリクエストを1回の計算にまとめる
+  from .coalescing import init_coalescing
+  init_coalescing(app)
+
+  # スタンプ通知の配信
+  from .pubsub import init_pubsub
+  init_pubsub(app)
+
+  # Accept-Encoding に応じたレスポンスの圧縮（gzip / brotli）
+  from .compression import init_compression
+  init_compression(app)
+
+  # 今日・今週の水分補給量ランキング
+  from .leaderboard import init_leaderboard
+  init_leaderboard(app)
+
+  # 水分記録のINSERTをまとめてコミットする書き込みバッファ（WRITE_BUFFER_ENABLED の場合）
+  from .write_buffer import init_write_buffer
+  init_write_buffer(app)
+
+  # ETag / If-None-Match による条件付きGET
+  from .conditional import init_conditional_get
+  init_conditional_get(app)
+
   # Blueprintsの登録
   # Users
   from .routes.users import users_bp
@@ -31,4 +76,16 @@ def create_app(config_class=Config):
   from .routes.stamps import stamps_bp
   app.register_blueprint(stamps_bp, url_prefix='/api/v1/stamps')
 
+  # Home
+  from .routes.home import home_bp
+  app.register_blueprint(home_bp, url_prefix='/api/v1/home')
+
+  # Leaderboard
+  from .routes.leaderboard import leaderboard_bp
+  app.register_blueprint(leaderboard_bp, url_prefix='/api/v1/leaderboard')
+
+  # CLIコマンドの登録
+  from .commands import register_commands
+  register_commands(app)
+
   return app
\ No newline at end of file
@@ -0,0 +1,249 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash
+
+from app import db, geo
+from app.daily_totals import rebuild_daily_totals
+from app.nearby import rebuild_latest_positions
+from app.models import Stamp, User, UserStamp, WaterRecord
+
+bench_cli = AppGroup('bench', help='Seed benchmark data and run a load test against the v1 API.')
+
+# 記録の位置の中心にする都市（緯度, 経度）
+CITY_CENTERS = [
+    (35.6812, 139.7671),  # 東京
+    (34.7025, 135.4959),  # 大阪
+    (35.1709, 136.8815),  # 名古屋
+    (33.5902, 130.4017),  # 福岡
+    (43.0687, 141.3508),  # 札幌
+]
+
+WATER_TYPES = ['水', 'お茶', '牛乳', 'コーヒー', 'スポーツドリンク']
+
+
+# メートルをおおよその緯度・経度の差に変換する
+def _offset(lat, lon, sigma_m):
+    return (
+        lat + random.gauss(0, sigma_m) / geo.METERS_PER_DEGREE,
+        lon + random.gauss(0, sigma_m) / geo.METERS_PER_DEGREE,
+    )
+
+
+def _insert_batches(table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(table), rows[start:start + batch_size])
+        db.session.commit()
+
+
+# flask bench seed
+# ユーザー・水分記録（期間と地域に分散）・スタンプのやり取りを一括で投入する
+@bench_cli.command('seed')
+@click.option('--users', default=1000, show_default=True, help='Number of users to create.')
+@click.option('--records-per-user', default=100, show_default=True, help='Average water records per user.')
+@click.option('--days', default=90, show_default=True, help='Spread records over this many past days.')
+@click.option('--stamps-per-user', default=10, show_default=True, help='Average stamps received per user.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT batch.')
+@click.option('--seed', 'random_seed', default=None, type=int, help='Random seed for reproducible data.')
+def seed(users, records_per_user, days, stamps_per_user, batch_size, random_seed):
+    random.seed(random_seed)
+    db.create_all()
+    started = time.perf_counter()
+
+    # スタンプのカタログ
+    if not Stamp.query.first():
+        db.session.add_all([
+            Stamp(message='水分補給して！', image_url='💧'),
+            Stamp(message='がんばって！', image_url='💪'),
+            Stamp(message='おつかれさま！', image_url='🎉'),
+        ])
+        db.session.commit()
+    stamp_ids = [stamp_id for stamp_id, in db.session.query(Stamp.stamp_id)]
+
+    # ユーザー（パスワードハッシュの計算は重いので共通にする）
+    first_user_id = (db.session.query(db.func.max(User.user_id)).scalar() or 0) + 1
+    password_hash = generate_password_hash('password123')
+    _insert_batches(User, [{
+        'user_name': f'bench_user{first_user_id + i}',
+        'password_hash': password_hash,
+        'bio': None,
+    } for i in range(users)], batch_size)
+    user_ids = [user_id for user_id, in db.session.query(User.user_id).filter(User.user_id >= first_user_id)]
+    click.echo(f'users: {len(user_ids)}')
+
+    # 水分記録（ユーザーごとに生活圏を決め、その周辺にばらつかせる）
+    now = datetime.now()
+    rows = []
+    record_count = 0
+    for user_id in user_ids:
+        home_lat, home_lon = _offset(*random.choice(CITY_CENTERS), 5000)
+        for _ in range(max(0, int(random.gauss(records_per_user, records_per_user / 4)))):
+            lat, lon = _offset(home_lat, home_lon, 500)
+            rows.append({
+                'user_id': user_id,
+                'water_date': now - timedelta(seconds=random.uniform(0, days * 86400)),
+                'water_type': random.choice(WATER_TYPES),
+                'water_amount': random.choice([100, 150, 200, 250, 300, 350, 500]),
+                'lat': lat,
+                'lon': lon,
+                'comment': None,
+            })
+            if len(rows) >= batch_size:
+                _insert_batches(WaterRecord, rows, batch_size)
+                record_count += len(rows)
+                rows = []
+    _insert_batches(WaterRecord, rows, batch_size)
+    record_count += len(rows)
+    click.echo(f'water records: {record_count}')
+
+    # スタンプのやり取り
+    rows = []
+    for _ in range(len(user_ids) * stamps_per_user):
+        sender_id, receiver_id = random.sample(user_ids, 2) if len(user_ids) > 1 else (user_ids[0], user_ids[0])
+        created_at = now - timedelta(seconds=random.uniform(0, days * 86400))
+        rows.append({
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'stamp_id': random.choice(stamp_ids),
+            'after_stamp': random.random() < 0.5,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+    _insert_batches(UserStamp, rows, batch_size)
+    click.echo(f'user stamps: {len(rows)}')
+
+    rebuild_daily_totals()
+    rebuild_latest_positions()
+    db.session.commit()
+    click.echo(f'seeded in {time.perf_counter() - started:.1f}s')
+
+
+# 実際のv1エンドポイントの負荷の比率（名前, 重み, リクエストを作る関数）
+def _traffic_mix(user_ids, stamp_ids):
+    def user_id():
+        return random.choice(user_ids)
+
+    def new_record():
+        lat, lon = _offset(*random.choice(CITY_CENTERS), 5000)
+        return {'water_amount': random.choice([100, 200, 300]), 'lat': lat, 'lon': lon, 'water_type': '水'}
+
+    return [
+        ('home.get_home', 15, lambda c: c.get(f'/api/v1/home/{user_id()}')),
+        ('users.get_user', 10, lambda c: c.get(f'/api/v1/users/{user_id()}')),
+        ('users.get_nearby_users', 10, lambda c: c.get(f'/api/v1/users/nearby/{user_id()}')),
+        ('water_records.get_water_records', 10, lambda c: c.get(f'/api/v1/water_records/{user_id()}')),
+        ('water_records.get_today_water_records', 8, lambda c: c.get(f'/api/v1/water_records/today/{user_id()}')),
+        ('water_records.get_now_water_records', 8, lambda c: c.get(f'/api/v1/water_records/now/{user_id()}')),
+        ('stamps.get_stamps', 5, lambda c: c.get('/api/v1/stamps/')),
+        ('stamps.get_send_stamps', 15, lambda c: c.get(f'/api/v1/stamps/send/{user_id()}?unreplied=true')),
+        ('water_records.create_water_record', 8, lambda c: c.post(f'/api/v1/water_records/{user_id()}', json=new_record())),
+        ('stamps.send_stamp', 4, lambda c: c.post('/api/v1/stamps/send', json={
+            'sender_id': user_id(), 'receiver_id': user_id(), 'stamp_id': random.choice(stamp_ids)
+        })),
+    ]
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+# flask bench run
+# 複数のクライアント（スレッド）から create_app() に重み付きのリクエストを送り、
+# ルートごとのスループットと p50/p95/p99 のレイテンシを報告する
+@bench_cli.command('run')
+@click.option('--clients', default=16, show_default=True, help='Number of concurrent clients.')
+@click.option('--duration', default=30.0, show_default=True, help='Test duration in seconds.')
+@click.option('--warmup', default=3.0, show_default=True, help='Seconds of traffic excluded from the results.')
+@click.option('--output', default=None, help='JSON result file (default: benchmark-<timestamp>.json).')
+@click.option('--seed', 'random_seed', default=None, type=int, help='Random seed for the request mix.')
+def run(clients, duration, warmup, output, random_seed):
+    random.seed(random_seed)
+    user_ids = [user_id for user_id, in db.session.query(User.user_id)]
+    stamp_ids = [stamp_id for stamp_id, in db.session.query(Stamp.stamp_id)]
+    if not user_ids or not stamp_ids:
+        raise click.ClickException('Seed the database first: flask bench seed')
+    db.session.remove()
+
+    mix = _traffic_mix(user_ids, stamp_ids)
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    requests_by_name = {name: make_request for name, _, make_request in mix}
+
+    app = current_app._get_current_object()
+    samples = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    started_at = datetime.now()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    def client_loop():
+        client = app.test_client()
+        local_samples = []
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            name = random.choices(names, weights)[0]
+            begin = time.perf_counter()
+            response = requests_by_name[name](client)
+            elapsed = time.perf_counter() - begin
+            if begin >= measure_from:
+                local_samples.append((name, elapsed, response.status_code))
+        with lock:
+            for name, elapsed, status in local_samples:
+                samples[name].append(elapsed)
+                statuses[name][status] += 1
+
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    routes = {}
+    total = 0
+    for name in names:
+        latencies = sorted(samples[name])
+        total += len(latencies)
+        routes[name] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / duration, 2),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'statuses': dict(statuses[name]),
+        }
+
+    result = {
+        'started_at': started_at.isoformat(),
+        'database': db.engine.dialect.name,
+        'clients': clients,
+        'duration_s': duration,
+        'warmup_s': warmup,
+        'total_requests': total,
+        'throughput_rps': round(total / duration, 2),
+        'routes': routes,
+    }
+
+    click.echo(f'{"route":45} {"req":>7} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8}  statuses')
+    for name, stats in routes.items():
+        p50, p95, p99 = (f'{stats[k]:.1f}' if stats[k] is not None else '-' for k in ('p50_ms', 'p95_ms', 'p99_ms'))
+        click.echo(f'{name:45} {stats["requests"]:>7} {stats["throughput_rps"]:>8} {p50:>8} {p95:>8} {p99:>8}  {stats["statuses"]}')
+    click.echo(f'total: {total} requests, {result["throughput_rps"]} req/s')
+
+    output = output or f'benchmark-{datetime.now():%Y%m%d-%H%M%S}.json'
+    with open(output, 'w') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    click.echo(f'saved {output}')
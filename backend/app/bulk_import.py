@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+
+from app import db
+from app.daily_totals import rebuild_daily_totals
+from app.models import User, WaterRecord
+from app.nearby import rebuild_latest_positions
+from app.serializers import parse_datetime
+
+# 取り込む列
+IMPORT_COLUMNS = ['user_id', 'water_date', 'water_type', 'water_amount', 'lat', 'lon', 'comment']
+
+
+def _read_csv(f):
+    for line_no, item in enumerate(csv.DictReader(f), start=2):
+        yield line_no, item
+
+
+def _read_ndjson(f):
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            raise click.ClickException(f'line {line_no}: invalid JSON ({e})')
+
+
+def _optional(value, convert):
+    if value is None or value == '':
+        return None
+    return convert(value)
+
+
+# 文字列の列の長さの上限（超えるとDBでエラーになる）
+_STRING_LENGTHS = {
+    name: WaterRecord.__table__.c[name].type.length for name in ('water_type', 'comment')
+}
+
+
+def _parse_row(line_no, item):
+    try:
+        lat = float(item['lat'])
+        lon = float(item['lon'])
+        row = {
+            'user_id': int(item['user_id']),
+            'water_date': parse_datetime(item['water_date']),
+            'water_type': _optional(item.get('water_type'), str),
+            'water_amount': _optional(item.get('water_amount'), int),
+            'lat': lat,
+            'lon': lon,
+            'comment': _optional(item.get('comment'), str),
+        }
+    except KeyError as e:
+        raise click.ClickException(f'line {line_no}: missing field {e}')
+    except (TypeError, ValueError) as e:
+        raise click.ClickException(f'line {line_no}: {e}')
+
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise click.ClickException(f'line {line_no}: lat/lon out of range')
+    for name, length in _STRING_LENGTHS.items():
+        if row[name] is not None and len(row[name]) > length:
+            raise click.ClickException(f'line {line_no}: {name} is longer than {length} characters')
+    return row
+
+
+def _read_items(path, file_format):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from _read_ndjson(f) if file_format == 'ndjson' else _read_csv(f)
+
+
+# 途中で失敗して一部だけ取り込まれないよう、書き込む前にファイル全体を検証する
+# 戻り値は行数。存在しないユーザーの記録があれば失敗する
+def _validate(path, file_format):
+    count = 0
+    user_ids = set()
+    for line_no, item in _read_items(path, file_format):
+        user_ids.add(_parse_row(line_no, item)['user_id'])
+        count += 1
+
+    found = set()
+    user_id_list = sorted(user_ids)
+    for i in range(0, len(user_id_list), 1000):
+        found.update(db.session.scalars(
+            db.select(User.user_id).where(User.user_id.in_(user_id_list[i:i + 1000]))
+        ))
+    missing = user_ids - found
+    if missing:
+        raise click.ClickException(f'unknown user_id: {", ".join(map(str, sorted(missing)[:10]))}')
+    return count
+
+
+def _batches(items, batch_size):
+    batch = []
+    for line_no, item in items:
+        batch.append(_parse_row(line_no, item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# PostgreSQLではCOPYで流し込む
+def _copy_batch(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([
+            '' if row[column] is None else
+            row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+            for column in IMPORT_COLUMNS
+        ])
+    buf.seek(0)
+
+    raw = db.session.connection().connection.driver_connection
+    with raw.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {WaterRecord.__tablename__} ({", ".join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+            buf
+        )
+
+
+def _insert_batch(rows):
+    db.session.execute(db.insert(WaterRecord), rows)
+
+
+# 主キー以外のインデックス（取り込み中は落としておき、最後にまとめて作り直す）
+def _secondary_indexes():
+    return sorted(WaterRecord.__table__.indexes, key=lambda index: index.name)
+
+
+# flask import-water-records FILE
+# CSV/NDJSONの水分記録を一括で取り込む（PostgreSQLはCOPY、それ以外はexecutemany）
+# 列: user_id, water_date(ISO形式), water_type, water_amount, lat, lon, comment
+@click.command('import-water-records')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per transaction.')
+@click.option('--defer-indexes/--keep-indexes', default=False, show_default=True,
+              help='Drop secondary indexes during the load and rebuild them afterwards '
+                   '(only for an offline table: reads fall back to full scans meanwhile).')
+@click.option('--rebuild-totals/--no-rebuild-totals', default=True, show_default=True,
+              help='Rebuild the daily totals and latest positions after the load.')
+def import_water_records(path, file_format, batch_size, defer_indexes, rebuild_totals):
+    if file_format is None:
+        file_format = 'ndjson' if os.path.splitext(path)[1].lower() in ('.ndjson', '.jsonl') else 'csv'
+    dialect = db.engine.dialect.name
+    load_batch = _copy_batch if dialect == 'postgresql' else _insert_batch
+
+    click.echo(f'validated {_validate(path, file_format)} rows')
+    db.session.rollback()
+
+    indexes = _secondary_indexes() if defer_indexes else []
+    for index in indexes:
+        index.drop(db.session.connection(), checkfirst=True)
+    db.session.commit()
+
+    started = time.perf_counter()
+    total = 0
+    try:
+        for rows in _batches(_read_items(path, file_format), batch_size):
+            load_batch(rows)
+            db.session.commit()
+            total += len(rows)
+            elapsed = time.perf_counter() - started
+            click.echo(f'{total} rows ({total / elapsed:.0f} rows/s)')
+    finally:
+        db.session.rollback()
+        if indexes:
+            index_started = time.perf_counter()
+            for index in indexes:
+                index.create(db.session.connection(), checkfirst=True)
+            db.session.commit()
+            click.echo(f'rebuilt {len(indexes)} indexes in {time.perf_counter() - index_started:.1f}s')
+        # DBのエラーで途中で止まった場合も、コミット済みのバッチに集計を合わせる
+        if rebuild_totals and total:
+            rebuild_daily_totals()
+            rebuild_latest_positions()
+            db.session.commit()
+
+    load_elapsed = time.perf_counter() - started
+    if dialect == 'postgresql':
+        # 大量に増えた行数をプランナーに反映させる
+        with db.engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql(
+                f'ANALYZE {WaterRecord.__tablename__}'
+            )
+
+    click.echo(f'imported {total} rows in {load_elapsed:.1f}s ({total / load_elapsed:.0f} rows/s)')
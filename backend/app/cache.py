@@ -0,0 +1,209 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from werkzeug.http import generate_etag
+
+from app import db
+from app.coalescing import coalesce
+from app.routing import in_primary_window
+from app.models import Stamp, User, WaterRecord
+
+
+# プロセス内のLRU+TTLキャッシュ（ワーカーごとに独立）
+class LocalCache:
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # タグの世代番号はLRUで追い出されると古いエントリが復活するので別に持つ
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, tag):
+        with self._lock:
+            return self._versions.get(tag, 0)
+
+    def bump_version(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+# Redisを使うキャッシュ（複数ワーカーで共有、無効化も全ワーカーに効く）
+class RedisCache:
+
+    def __init__(self, url, prefix='hicoder:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package')
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, pickle.dumps(value), ex=ttl)
+
+    def get_version(self, tag):
+        return int(self._client.get(self._prefix + 'version:' + tag) or 0)
+
+    def bump_version(self, tag):
+        self._client.incr(self._prefix + 'version:' + tag)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+
+def _create_backend(app):
+    backend = app.config['CACHE_BACKEND']
+    if backend == 'local':
+        return LocalCache(app.config['CACHE_MAX_ENTRIES'])
+    if backend == 'redis':
+        return RedisCache(app.config['CACHE_URL'])
+    if backend == 'none':
+        return None
+    raise RuntimeError(f'Unknown CACHE_BACKEND: {backend}')
+
+
+def init_cache(app):
+    app.config.setdefault('CACHE_BACKEND', 'local')
+    app.config.setdefault('CACHE_URL', None)
+    app.config.setdefault('CACHE_TTL', 60)
+    app.config.setdefault('CACHE_MAX_ENTRIES', 10000)
+    app.extensions['cache'] = _create_backend(app)
+
+
+def get_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('cache')
+
+
+# ユーザー単位・カタログ単位のキャッシュタグ
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def water_records_tag(user_id):
+    return f'water_records:{user_id}'
+
+
+STAMPS_TAG = 'stamps'
+
+
+# GETのレスポンスをキャッシュするデコレーター
+# tag はビューの引数からタグを返す関数。タグの世代番号がキーに含まれるので、
+# 書き込みで世代番号が上がると古いエントリは参照されなくなる
+# ETagも一緒に保存し、ヒット時はボディを再計算せずに条件付きGETに答える
+# 書き込み直後のクライアントは、他のワーカーのキャッシュ（CACHE_BACKEND=local）に古い値が残っていても
+# 自分の書き込みが読めるよう、キャッシュを使わずに計算する
+def cached(tag):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or in_primary_window():
+                return coalesce(lambda: view(*args, **kwargs))
+
+            # 世代番号はクエリより先に読む（計算中に書き込まれても古い世代に保存されるだけ）
+            cache_tag = tag(**kwargs)
+            key = f'{request.endpoint}:{cache_tag}:{cache.get_version(cache_tag)}:{request.full_path}'
+            hit = cache.get(key)
+            if hit is not None:
+                body, status, etag = hit
+                response = current_app.response_class(body, status=status, mimetype='application/json')
+                response.set_etag(etag)
+                return response
+
+            def compute():
+                # レプリカの遅延で古いデータをキャッシュしないよう、キャッシュに載せる値はプライマリから読む
+                db.session.info['primary'] = True
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code in (200, 404) and response.is_json:
+                    body = response.get_data()
+                    etag = generate_etag(body)
+                    response.set_etag(etag)
+                    cache.set(key, (body, response.status_code, etag), current_app.config['CACHE_TTL'])
+                return response
+
+            # 同時に来た同じミスは1回だけ計算する（キーに世代番号を含むので書き込み後のリクエストは相乗りしない）
+            return coalesce(compute, key)
+        return wrapper
+    return decorator
+
+
+# コミット後に無効化するタグを登録する（ORMを通さない一括書き込み用）
+def invalidate(session, *tags):
+    session.info.setdefault('cache_invalidate', set()).update(tags)
+
+
+def _history_values(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return set(history.added) | set(history.deleted) | set(history.unchanged)
+
+
+def _tags_for(obj):
+    if isinstance(obj, User):
+        return {user_tag(obj.user_id)}
+    if isinstance(obj, WaterRecord):
+        # user_idが変わった場合は変更前のユーザーも無効化する
+        return {water_records_tag(user_id) for user_id in _history_values(obj, 'user_id')}
+    if isinstance(obj, Stamp):
+        return {STAMPS_TAG}
+    return set()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_invalidations(session, flush_context):
+    tags = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags |= _tags_for(obj)
+    if tags:
+        invalidate(session, *tags)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    tags = session.info.pop('cache_invalidate', None)
+    cache = get_cache()
+    if tags and cache is not None:
+        for tag in tags:
+            cache.bump_version(tag)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('cache_invalidate', None)
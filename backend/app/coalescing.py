@@ -0,0 +1,110 @@
+import threading
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException
+
+from app.metrics import get_metrics
+from app.routing import in_primary_window
+
+
+class _Call:
+    __slots__ = ('done', 'snapshot', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        # 共有するレスポンスの (ボディ, ステータス, ヘッダー)。共有できない場合はNone
+        self.snapshot = None
+        self.error = None
+
+
+# 実行中の計算をキーごとに1つだけ持つ（ワーカー内、スレッド間で共有）
+class Coalescer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    # (呼び出し, 自分が計算するか) を返す。同じキーの計算が実行中ならそれに相乗りする
+    def join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+
+
+def init_coalescing(app):
+    app.config.setdefault('COALESCE_ENABLED', True)
+    app.config.setdefault('COALESCE_TIMEOUT', 10)
+    app.extensions['coalescing'] = Coalescer() if app.config['COALESCE_ENABLED'] else None
+
+
+# ストリーミングやサーバーエラーのレスポンスは共有しない
+def _snapshot(response):
+    if response.is_streamed or response.direct_passthrough or response.status_code >= 500:
+        return None
+    return response.get_data(), response.status, list(response.headers.items())
+
+
+def _restore(snapshot):
+    body, status, headers = snapshot
+    return current_app.response_class(body, status=status, headers=headers)
+
+
+# 同じキーの同時リクエストを1回の計算にまとめ、結果のレスポンスを共有する
+# key を省略するとエンドポイントとパス・クエリ文字列をキーにする
+# 後から来たリクエストは先に始まった計算の結果を受け取るので、その計算の開始時点より古い結果になりうる
+def coalesce(compute, key=None):
+    coalescer = current_app.extensions.get('coalescing')
+    if coalescer is None or request.method != 'GET':
+        return current_app.make_response(compute())
+
+    metrics = get_metrics().coalesced
+    endpoint = request.endpoint
+    # 書き込み直後のクライアントは自分の書き込みが読めるよう単独で計算する
+    if in_primary_window():
+        metrics.inc((endpoint, 'bypass'))
+        return current_app.make_response(compute())
+
+    key = key or f'{request.endpoint}:{request.full_path}'
+    call, leader = coalescer.join(key)
+    if leader:
+        metrics.inc((endpoint, 'leader'))
+        try:
+            response = current_app.make_response(compute())
+            call.snapshot = _snapshot(response)
+            return response
+        except HTTPException as e:
+            # abort(404) などは待っているリクエストにも同じ応答を返す
+            call.error = e
+            raise
+        finally:
+            coalescer.finish(key, call)
+
+    if not call.done.wait(current_app.config['COALESCE_TIMEOUT']):
+        metrics.inc((endpoint, 'timeout'))
+        return current_app.make_response(compute())
+    if call.error is not None:
+        metrics.inc((endpoint, 'follower'))
+        raise call.error
+    if call.snapshot is None:
+        # DBエラーなどで共有できる結果がない場合は自分で計算する
+        metrics.inc((endpoint, 'fallback'))
+        return current_app.make_response(compute())
+    metrics.inc((endpoint, 'follower'))
+    return _restore(call.snapshot)
+
+
+# 読み取りのビューに付けるデコレーター
+def coalesced(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return coalesce(lambda: view(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,209 @@
+import re
+import sys
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import event
+
+from app import db
+from app.benchmark import bench_cli
+from app.bulk_import import import_water_records
+from app.partitions import partitions_cli
+from app.instrumentation import count_queries
+from app.models import User, WaterRecord, UserStamp
+
+
+def register_commands(app):
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(check_query_counts)
+    app.cli.add_command(bench_cli)
+    app.cli.add_command(import_water_records)
+    app.cli.add_command(partitions_cli)
+
+
+# シード済みのデータから、チェック対象のルート（エンドポイント名, URL, 許容クエリ数）を作る
+def sample_routes():
+    record = WaterRecord.query.order_by(WaterRecord.water_date.desc()).first()
+    user_stamp = UserStamp.query.first()
+    user = User.query.first()
+    if not record or not user_stamp or not user:
+        raise click.ClickException('Seed the database first (users, water records and stamps are required)')
+
+    routes = [
+        ('users.get_user', f'/api/v1/users/{user.user_id}', 1),
+        ('users.get_all_users', '/api/v1/users/', 1),
+        ('users.get_nearby_users', f'/api/v1/users/nearby/{record.user_id}', 2),
+        ('water_records.get_water_records', f'/api/v1/water_records/{record.user_id}', 1),
+        ('water_records.get_all_water_records', '/api/v1/water_records/', 1),
+        ('water_records.get_today_water_records', f'/api/v1/water_records/today/{record.user_id}', 1),
+        ('water_records.get_today_water_total', f'/api/v1/water_records/today/total/{record.user_id}', 1),
+        ('water_records.get_now_water_records', f'/api/v1/water_records/now/{record.user_id}', 1),
+        ('water_records.get_water_stats',
+         f'/api/v1/water_records/stats/{record.user_id}?bucket=week&from={record.water_date.date() - timedelta(weeks=12)}', 1),
+        ('stamps.get_stamps', '/api/v1/stamps/', 1),
+        ('stamps.get_stamp', f'/api/v1/stamps/{user_stamp.stamp_id}', 1),
+        ('stamps.get_send_stamps', f'/api/v1/stamps/send/{user_stamp.receiver_id}', 1),
+        ('home.get_home', f'/api/v1/home/{record.user_id}', 3),
+        ('leaderboard.get_ranking', f'/api/v1/leaderboard/{record.user_id}?period=week', 2),
+    ]
+    db.session.remove()
+    return routes
+
+
+# 各ルートの実行時に発行されるSELECT文を記録する
+def capture_statements(client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response, statements
+
+
+# 全件走査（条件で範囲を絞らずにテーブルかインデックスを最初から読むもの）
+# table: テーブル名（PostgreSQLのパーティションは親のテーブル名）
+# index_order: インデックスの順に読む走査か（LIMITで途中で止まる一覧の1ページ目など。許可リストに載せられる）
+class FullScan:
+
+    def __init__(self, table, index_order, detail):
+        self.table = table
+        self.index_order = index_order
+        self.detail = detail
+
+    def __repr__(self):
+        return self.detail
+
+
+# water_record の月別パーティション（water_record_p2025_08, water_record_default）を親のテーブル名にする
+def _parent_table(name):
+    return re.sub(r'_(p\d{4}_\d{2}|default)$', '', name)
+
+
+def _postgres_full_scans(plan):
+    nodes = [plan]
+    found = []
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', []))
+        relation = node.get('Relation Name')
+        if relation is None or 'Index Cond' in node or 'Recheck Cond' in node:
+            continue
+        node_type = node.get('Node Type')
+        index_order = node_type in ('Index Scan', 'Index Only Scan')
+        detail = f'{node_type} on {relation}' + (f" using {node['Index Name']}" if index_order else '')
+        found.append(FullScan(_parent_table(relation), index_order, detail))
+    return found
+
+
+_SQLITE_SCAN = re.compile(r'SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?')
+
+
+def explain_full_scans(conn, statement, parameters):
+    if conn.dialect.name == 'postgresql':
+        # プランナーの設定は変えない（本番と同じプランを確認する）
+        plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        return _postgres_full_scans(plan[0]['Plan'])
+
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        # "SEARCH" は条件で範囲を絞った検索、"SCAN" は（USING INDEX でも）最初から最後まで読む走査
+        found = []
+        for row in rows:
+            match = _SQLITE_SCAN.fullmatch(row[-1])
+            if match:
+                found.append(FullScan(match.group(1), ' USING ' in row[-1], row[-1]))
+        return found
+
+    raise click.ClickException(f'Unsupported database: {conn.dialect.name}')
+
+
+# 一覧全体を返すルートは全件走査が前提なのでプランのチェックから除く
+FULL_LIST_ENDPOINTS = {'users.get_all_users', 'stamps.get_stamps'}
+
+# 許可するインデックスの順の走査 {(エンドポイント名, テーブル名)}（テーブルの全件走査は許可しない）
+ALLOWED_INDEX_SCANS = {
+    # 全ユーザーの記録一覧の1ページ目は (water_date DESC, water_id DESC) のインデックスを先頭から limit+1 件だけ読む
+    ('water_records.get_all_water_records', 'water_record'),
+}
+
+
+def is_allowed(endpoint, scan):
+    return scan.index_order and (endpoint, scan.table) in ALLOWED_INDEX_SCANS
+
+
+# URLにGETしたときに発行されたSELECT文をEXPLAINし、(レスポンス, 文のリスト, [(全件走査, 文)]) を返す
+# 許可リストに載っている走査は除く
+def find_full_scans(client, endpoint, url):
+    response, statements = capture_statements(client, url)
+    full_scans = []
+    with db.engine.begin() as conn:
+        for statement, parameters in statements:
+            for scan in explain_full_scans(conn, statement, parameters):
+                if not is_allowed(endpoint, scan):
+                    full_scans.append((scan, statement))
+    return response, statements, full_scans
+
+
+# flask check-query-plans
+# 一覧全体以外のGETルートのクエリをEXPLAINし、全件走査があれば失敗する（CI用）
+@click.command('check-query-plans')
+def check_query_plans():
+    client = current_app.test_client()
+    failures = 0
+    for endpoint, url, _ in sample_routes():
+        if endpoint in FULL_LIST_ENDPOINTS:
+            continue
+
+        response, statements, full_scans = find_full_scans(client, endpoint, url)
+        if response.status_code >= 500:
+            click.echo(f'FAIL {endpoint}: {url} returned {response.status_code}')
+            failures += 1
+            continue
+
+        if full_scans:
+            failures += 1
+            for scan, statement in full_scans:
+                click.echo(f'FAIL {endpoint}: full scan ({scan.detail})')
+                click.echo(f'  {" ".join(statement.split())}')
+        else:
+            click.echo(f'ok   {endpoint} ({len(statements)} queries)')
+
+    if failures:
+        sys.exit(1)
+
+
+# flask check-query-counts
+# GETルートごとのクエリ数が上限を超えるか、同じ形のSQLが繰り返されていれば失敗する（N+1検出、CI用）
+@click.command('check-query-counts')
+def check_query_counts():
+    threshold = current_app.config['QUERY_REPEAT_THRESHOLD']
+    client = current_app.test_client()
+    failures = 0
+    for endpoint, url, max_queries in sample_routes():
+        with count_queries() as stats:
+            response = client.get(url)
+
+        problems = []
+        if response.status_code >= 500:
+            problems.append(f'{url} returned {response.status_code}')
+        if stats.count > max_queries:
+            problems.append(f'{stats.count} queries, expected at most {max_queries}')
+        for shape, n in stats.repeated(threshold):
+            problems.append(f'statement executed {n} times: {shape}')
+
+        if problems:
+            failures += 1
+            for problem in problems:
+                click.echo(f'FAIL {endpoint}: {problem}')
+        else:
+            click.echo(f'ok   {endpoint} ({stats.count} queries, {stats.duration * 1000:.1f} ms)')
+
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,129 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮するレスポンスの種類（JSON・NDJSON・テキスト）
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+
+
+class _GzipCompressor:
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    # ストリーミングでは送り出すチャンクごとにフラッシュして、届いた分だけ展開できるようにする
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _BrotliCompressor:
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self, data=b''):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        return _BrotliCompressor(current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return _GzipCompressor(current_app.config['COMPRESS_LEVEL'])
+
+
+# Accept-Encoding から使う圧縮方式を選ぶ（同じ優先度ならbrotliを優先）
+def _negotiate():
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# NDJSONの1行ごとにフラッシュすると圧縮率が下がり小さなチャンクが増えるので、
+# buffer_size バイトたまるごとに1回だけフラッシュして送り出す
+def _compress_stream(chunks, compressor, buffer_size):
+    try:
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                yield compressor.compress(b''.join(buffered)) + compressor.flush()
+                buffered = []
+                size = 0
+        yield compressor.finish(b''.join(buffered))
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _compress_response(response):
+    if (
+        response.status_code < 200 or response.status_code == 204
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or not (response.mimetype in COMPRESSIBLE_MIMETYPES or response.mimetype.startswith('text/'))
+    ):
+        return response
+
+    # 304も200と同じ Vary・ETag を返す（キャッシュが保存済みの表現を選び直せるように）
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+
+    # 圧縮した表現は別の表現なので弱いETagにする（If-None-Matchは弱い比較なので304はそのまま効く）
+    # ボディのない304でも同じETagになるよう、サイズで圧縮しなかった場合も圧縮方式を選べたなら弱いETagにする
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    if response.status_code == 304:
+        return response
+
+    if response.is_streamed:
+        # サイズが分からないので常に圧縮し、チャンクごとに送り出す
+        response.response = _compress_stream(
+            response.response, _compressor(encoding), current_app.config['COMPRESS_STREAM_BUFFER_SIZE']
+        )
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(_compressor(encoding).finish(data))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+    app.config.setdefault('COMPRESS_STREAM_BUFFER_SIZE', 16384)
+    # after_request は登録と逆順に呼ばれるので、ETagを付けた後（init_conditional_get より先に登録）に圧縮される
+    app.after_request(_compress_response)
@@ -0,0 +1,25 @@
+from flask import request
+
+# ETagを付けるBlueprint
+CONDITIONAL_BLUEPRINTS = {'users', 'water_records', 'stamps', 'home', 'leaderboard'}
+# ETagを付けないエンドポイント（ロングポーリングはURLごとに1回しか使わないので再検証されない）
+CONDITIONAL_EXCLUDED_ENDPOINTS = {'stamps.poll_stamp_events'}
+
+
+def init_conditional_get(app):
+    app.after_request(_make_conditional)
+
+
+# GETのJSONレスポンスに強いETagを付け、If-None-Matchが一致すれば304を返す
+def _make_conditional(response):
+    if request.method != 'GET' or request.blueprint not in CONDITIONAL_BLUEPRINTS:
+        return response
+    if request.endpoint in CONDITIONAL_EXCLUDED_ENDPOINTS:
+        return response
+    if response.status_code != 200 or response.is_streamed or not response.is_json:
+        return response
+
+    # キャッシュから返したレスポンスには保存済みのETagが付いている
+    if response.get_etag()[0] is None:
+        response.add_etag()
+    return response.make_conditional(request)
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.leaderboard import record_amount
+from app.models import DailyWaterTotal, WaterRecord
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+# UPSERT（INSERT ... ON CONFLICT）ができる insert を返す（使えないDBではNone）
+def upsert_insert():
+    return _INSERTS.get(db.session.get_bind().dialect.name)
+
+
+# 日ごとの集計に水分量・件数を加算する（減算は負の値を渡す）
+# 呼び出し側のトランザクション内で実行され、コミットは呼び出し側で行う
+def add_to_daily_total(user_id, water_date, amount, count=1):
+    day = water_date.date() if isinstance(water_date, datetime) else water_date
+    amount = amount or 0
+    # ランキングもコミット後に同じ量だけ更新する
+    record_amount(db.session, user_id, day, amount)
+
+    insert = upsert_insert()
+    if insert is None:
+        # UPSERTが使えないDBでは行ロックを取って更新する
+        total = DailyWaterTotal.query.filter_by(user_id=user_id, day=day).with_for_update().first()
+        if total is None:
+            db.session.add(DailyWaterTotal(user_id=user_id, day=day, total_amount=amount, record_count=count))
+        else:
+            total.total_amount += amount
+            total.record_count += count
+        return
+
+    stmt = insert(DailyWaterTotal).values(user_id=user_id, day=day, total_amount=amount, record_count=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyWaterTotal.user_id, DailyWaterTotal.day],
+        set_={
+            'total_amount': DailyWaterTotal.total_amount + stmt.excluded.total_amount,
+            'record_count': DailyWaterTotal.record_count + stmt.excluded.record_count
+        }
+    )
+    db.session.execute(stmt)
+
+
+# 水分記録から集計テーブルを作り直す（初期データ投入や不整合の修復用）
+def rebuild_daily_totals():
+    day = db.func.date(WaterRecord.water_date)
+    db.session.execute(db.delete(DailyWaterTotal))
+    db.session.execute(db.insert(DailyWaterTotal).from_select(
+        ['user_id', 'day', 'total_amount', 'record_count'],
+        db.select(
+            WaterRecord.user_id,
+            day,
+            db.func.coalesce(db.func.sum(WaterRecord.water_amount), 0),
+            db.func.count(WaterRecord.water_id)
+        ).group_by(WaterRecord.user_id, day)
+    ))
@@ -0,0 +1,117 @@
+import math
+
+# geohashで使用する32進数の文字
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE_MAP = {c: i for i, c in enumerate(_BASE32)}
+
+# user_location.geohash に保存する桁数（9桁でおよそ5m四方）
+GEOHASH_PRECISION = 9
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        # 偶数ビットは経度、奇数ビットは緯度
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            bit = 0
+            ch = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _DECODE_MAP[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def cell_size(precision):
+    # 指定した桁数のセルの高さ・幅（度）
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+# 近傍検索で1回に調べるセルの最大数
+COVER_MAX_CELLS = 16
+
+
+def _cell_index(value, origin, size, count):
+    return min(max(int((value - origin) // size), 0), count - 1)
+
+
+def covering_cells(lat, lon, radius_m, max_cells=COVER_MAX_CELLS):
+    # (lat, lon) から半径 radius_m 以内を覆うgeohashセルを返す
+    # 円の外接矩形に重なるセルが max_cells 個以下になる最も細かい桁数を選び、そのセルをすべて列挙する
+    d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat = max(lat - d_lat, -90.0)
+    max_lat = min(lat + d_lat, 90.0)
+    # 経度1度の長さは極に近い側で最も短くなる
+    lon_scale = max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 1e-6)
+    d_lon = math.degrees(radius_m / (EARTH_RADIUS_M * lon_scale))
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        lat_count = round(180.0 / height)
+        lon_count = round(360.0 / width)
+        first_row = _cell_index(min_lat, -90.0, height, lat_count)
+        last_row = _cell_index(max_lat, -90.0, height, lat_count)
+        # 日付変更線をまたぐ場合は列番号が範囲外になるので、列挙するときに折り返す
+        first_col = int((lon - d_lon + 180.0) // width)
+        last_col = int((lon + d_lon + 180.0) // width)
+        cols = min(last_col - first_col + 1, lon_count)
+        if (last_row - first_row + 1) * cols <= max_cells:
+            break
+
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        cell_lat = -90.0 + (row + 0.5) * height
+        for col in range(first_col, first_col + cols):
+            cell_lon = -180.0 + (col % lon_count + 0.5) * width
+            cells.add(encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+def prefix_range(prefix):
+    # プレフィックス検索をインデックスの範囲検索に変換する
+    # （geohashは[0-9a-z]のみなので照合順序に依存しない）
+    return prefix, prefix + _BASE32[-1] * (GEOHASH_PRECISION - len(prefix))
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (math.sin(d_phi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
@@ -0,0 +1,207 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# assert_max_queries などでリクエスト外から記録するためのスレッドローカル
+_local = threading.local()
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN \((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'\bVALUES (\([^()]*\))(?:, \([^()]*\))+', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w$%])-?\d+(?:\.\d+)?\b')
+
+# EXPLAINを取得済みの文の形（ワーカーごと、上限を超えたら忘れて取り直す）
+_EXPLAINED_MAX = 1000
+_explained = set()
+_explained_lock = threading.Lock()
+
+# EXPLAINできる文
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+# ログに出すパラメータの最大文字数
+_PARAMS_MAX_CHARS = 500
+
+
+# パラメータやIN句の要素数が違うだけの文を同じ形として扱えるように正規化する
+def normalize_sql(statement):
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    shape = _VALUES_LIST.sub(r'VALUES \1, ...', shape)
+    return shape
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[normalize_sql(statement)] += 1
+
+    # 同じ形の文が threshold 回以上実行されていれば N+1 の疑いがある
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def _active_stats():
+    stats = list(getattr(_local, 'recorders', ()))
+    if has_app_context():
+        request_stats = g.get('_query_stats')
+        if request_stats is not None:
+            stats.append(request_stats)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    for stats in _active_stats():
+        stats.record(statement, duration)
+
+    if has_app_context():
+        config = current_app.config
+        if (duration * 1000 >= config['SLOW_QUERY_THRESHOLD_MS']
+                and random.random() < config['SLOW_QUERY_SAMPLE_RATE']):
+            _log_slow_query(conn, cursor, statement, parameters, executemany, duration)
+
+
+# PostgreSQLで実行計画を取得する（ANALYZEなしなので文は実行されない）
+# 同じDBAPI接続の別カーソルで実行し、失敗してもトランザクションを壊さないようセーブポイントで囲む
+def _explain(cursor, statement, parameters):
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            explain_cursor.execute('EXPLAIN (ANALYZE off) ' + statement, parameters)
+            plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+        finally:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    finally:
+        explain_cursor.close()
+
+
+def _log_slow_query(conn, cursor, statement, parameters, executemany, duration):
+    shape = normalize_sql(statement)
+    endpoint = request.endpoint if has_request_context() else None
+    params = repr(parameters)
+    if len(params) > _PARAMS_MAX_CHARS:
+        params = params[:_PARAMS_MAX_CHARS] + '...'
+    logger.warning('slow query (%.1f ms) in %s: %s params=%s', duration * 1000, endpoint, shape, params)
+
+    if (conn.dialect.name != 'postgresql' or not current_app.config['SLOW_QUERY_EXPLAIN']
+            or not shape.upper().startswith(_EXPLAINABLE)):
+        return
+    with _explained_lock:
+        if shape in _explained:
+            return
+        if len(_explained) >= _EXPLAINED_MAX:
+            _explained.clear()
+        _explained.add(shape)
+
+    try:
+        # executemany の場合は最初の1組のパラメータで取得する
+        plan = _explain(cursor, statement, parameters[0] if executemany else parameters)
+    except Exception as e:
+        logger.debug('could not explain slow query: %s', e)
+        return
+    logger.warning('plan for slow query in %s: %s\n%s', endpoint, shape, plan)
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        start_times = context.connection.info.get('query_start_time')
+        if start_times:
+            start_times.pop()
+
+
+def _start_request():
+    g._query_stats = QueryStats()
+
+
+def _finish_request(response):
+    stats = get_request_stats()
+    if stats is None:
+        return response
+
+    logger.debug('%s: %d queries in %.1f ms', request.endpoint, stats.count, stats.duration * 1000)
+    for shape, n in stats.repeated(current_app.config['QUERY_REPEAT_THRESHOLD']):
+        logger.warning('%s: possible N+1, statement executed %d times: %s', request.endpoint, n, shape)
+    return response
+
+
+# 現在のリクエストで実行されたクエリの統計（リクエスト外ではNone）
+def get_request_stats():
+    if not has_app_context():
+        return None
+    return g.get('_query_stats')
+
+
+def init_instrumentation(app):
+    app.config.setdefault('QUERY_REPEAT_THRESHOLD', 3)
+    app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+    app.config.setdefault('SLOW_QUERY_SAMPLE_RATE', 1.0)
+    app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+
+    from app import db
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+# ブロック内で実行されたクエリを数える
+@contextmanager
+def count_queries():
+    stats = QueryStats()
+    recorders = _local.__dict__.setdefault('recorders', [])
+    recorders.append(stats)
+    try:
+        yield stats
+    finally:
+        recorders.remove(stats)
+
+
+# テスト・CI用: ブロック内のクエリ数が上限を超えたら AssertionError
+#   with assert_max_queries(2):
+#       client.get('/api/v1/stamps/send/1')
+@contextmanager
+def assert_max_queries(max_queries, repeat_threshold=None):
+    with count_queries() as stats:
+        yield stats
+
+    problems = []
+    if stats.count > max_queries:
+        problems.append(f'{stats.count} queries executed, expected at most {max_queries}')
+    if repeat_threshold is not None:
+        for shape, n in stats.repeated(repeat_threshold):
+            problems.append(f'statement executed {n} times: {shape}')
+    if problems:
+        raise AssertionError('\n'.join(problems))
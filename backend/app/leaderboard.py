@@ -0,0 +1,299 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import DailyWaterTotal
+
+# ランキングの期間（day: 今日 / week: 今週、月曜始まり）
+LEADERBOARD_PERIODS = ('day', 'week')
+
+_MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, height):
+        self.key = key
+        self.next = [None] * height
+        # 各レベルで次のノードまでに最下段で何ノード進むか（次がない場合は末尾までの距離）
+        self.width = [1] * height
+
+
+# 順位つき集合（インデックス付きスキップリスト）
+# 追加・削除・順位の取得は O(log n)、先頭からk件の取得は O(log n + k)
+class RankedSet:
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    # key より小さい最後のノードを各レベルについて求める（位置は先頭を0とする）
+    def _find(self, key):
+        chain = [None] * _MAX_LEVEL
+        positions = [0] * _MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def add(self, key):
+        chain, positions = self._find(key)
+        height = 1
+        while height < _MAX_LEVEL and random.random() < 0.5:
+            height += 1
+
+        new = _Node(key, height)
+        position = positions[0] + 1
+        for level in range(height):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = positions[level] + prev.width[level] + 1 - position
+            prev.width[level] = position - positions[level]
+        for level in range(height, _MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._find(key)
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(_MAX_LEVEL):
+            prev = chain[level]
+            if prev.next[level] is target:
+                prev.width[level] += target.width[level] - 1
+                prev.next[level] = target.next[level]
+            else:
+                prev.width[level] -= 1
+        self._size -= 1
+
+    # 0始まりの順位（なければNone）
+    def index(self, key):
+        chain, positions = self._find(key)
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            return None
+        return positions[0]
+
+    # 先頭から k 件
+    def head(self, k):
+        items = []
+        node = self._head.next[0]
+        while node is not None and len(items) < k:
+            items.append(node.key)
+            node = node.next[0]
+        return items
+
+
+# ワーカー内のランキング（LEADERBOARD_REFRESH_SECONDS ごとにDBから作り直すので、
+# 他のワーカーでの記録も一定時間内に反映される）
+class LocalLeaderboard:
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        # ボード名 -> (スコアの辞書, RankedSet, 読み込んだ時刻)
+        self._boards = {}
+
+    def needs_load(self, board):
+        with self._lock:
+            entry = self._boards.get(board)
+            return entry is None or entry[2] + self.refresh_seconds <= time.monotonic()
+
+    def load(self, board, scores, keep=()):
+        ranked = RankedSet()
+        scores = {user_id: score for user_id, score in scores.items() if score > 0}
+        for user_id, score in scores.items():
+            ranked.add((-score, user_id))
+        with self._lock:
+            # 期間が過ぎたボードは捨てる
+            for name in list(self._boards):
+                if name != board and name not in keep:
+                    del self._boards[name]
+            self._boards[board] = (scores, ranked, time.monotonic())
+
+    def add(self, board, user_id, amount):
+        with self._lock:
+            entry = self._boards.get(board)
+            # 読み込まれていないボードは、読み込むときにDBから反映される
+            if entry is None:
+                return
+            scores, ranked, _ = entry
+            old = scores.get(user_id, 0)
+            new = old + amount
+            if old > 0:
+                ranked.remove((-old, user_id))
+            if new > 0:
+                ranked.add((-new, user_id))
+                scores[user_id] = new
+            else:
+                scores.pop(user_id, None)
+
+    # 上位 k 件の (user_id, スコア)
+    def top(self, board, k):
+        with self._lock:
+            _, ranked, _ = self._boards[board]
+            return [(user_id, -score) for score, user_id in ranked.head(k)]
+
+    # (0始まりの順位, スコア)。記録がなければ (None, 0)
+    def rank(self, board, user_id):
+        with self._lock:
+            scores, ranked, _ = self._boards[board]
+            score = scores.get(user_id)
+            if score is None:
+                return None, 0
+            return ranked.index((-score, user_id)), score
+
+    def scores(self, board, user_ids):
+        with self._lock:
+            scores = self._boards[board][0]
+            return {user_id: scores[user_id] for user_id in user_ids if user_id in scores}
+
+
+# Redisのソート済みセットを使うランキング（複数ワーカーで共有）
+class RedisLeaderboard:
+
+    def __init__(self, url, refresh_seconds=60, prefix='hicoder:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('LEADERBOARD_BACKEND=redis requires the redis package')
+        self.refresh_seconds = refresh_seconds
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, board):
+        return f'{self._prefix}leaderboard:{board}'
+
+    def needs_load(self, board):
+        return not self._client.exists(self._key(board) + ':loaded')
+
+    def load(self, board, scores, keep=()):
+        key = self._key(board)
+        pipe = self._client.pipeline()
+        pipe.delete(key)
+        scores = {user_id: score for user_id, score in scores.items() if score > 0}
+        if scores:
+            pipe.zadd(key, scores)
+        # 期間が過ぎたボードは自然に消えるようにする
+        pipe.expire(key, 8 * 24 * 3600)
+        pipe.set(key + ':loaded', 1, ex=self.refresh_seconds)
+        pipe.execute()
+
+    def add(self, board, user_id, amount):
+        key = self._key(board)
+        if not self._client.exists(key):
+            return
+        pipe = self._client.pipeline()
+        pipe.zincrby(key, amount, user_id)
+        pipe.zremrangebyscore(key, '-inf', 0)
+        pipe.execute()
+
+    def top(self, board, k):
+        return [(int(user_id), int(score))
+                for user_id, score in self._client.zrevrange(self._key(board), 0, k - 1, withscores=True)]
+
+    def rank(self, board, user_id):
+        pipe = self._client.pipeline()
+        pipe.zrevrank(self._key(board), user_id)
+        pipe.zscore(self._key(board), user_id)
+        rank, score = pipe.execute()
+        return rank, int(score or 0)
+
+    def scores(self, board, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        values = self._client.zmscore(self._key(board), user_ids)
+        return {user_id: int(score) for user_id, score in zip(user_ids, values) if score is not None}
+
+
+def init_leaderboard(app):
+    app.config.setdefault('LEADERBOARD_BACKEND', 'local')
+    app.config.setdefault('LEADERBOARD_URL', None)
+    app.config.setdefault('LEADERBOARD_REFRESH_SECONDS', 60)
+
+    backend = app.config['LEADERBOARD_BACKEND']
+    refresh_seconds = app.config['LEADERBOARD_REFRESH_SECONDS']
+    if backend == 'local':
+        leaderboard = LocalLeaderboard(refresh_seconds)
+    elif backend == 'redis':
+        leaderboard = RedisLeaderboard(app.config['LEADERBOARD_URL'], refresh_seconds)
+    else:
+        raise RuntimeError(f'Unknown LEADERBOARD_BACKEND: {backend}')
+    app.extensions['leaderboard'] = leaderboard
+
+
+def get_leaderboard():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('leaderboard')
+
+
+def period_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def board_name(period, day):
+    return f'{period}:{period_start(period, day).isoformat()}'
+
+
+# 日ごとの集計からボードのスコアを読み込む（water_record は走査しない）
+def _load_scores(period, start):
+    end = start + timedelta(days=6) if period == 'week' else start
+    rows = db.session.execute(
+        db.select(DailyWaterTotal.user_id, db.func.sum(DailyWaterTotal.total_amount))
+        .where(DailyWaterTotal.day.between(start, end))
+        .group_by(DailyWaterTotal.user_id)
+    ).all()
+    return {user_id: int(total or 0) for user_id, total in rows}
+
+
+# 今日・今週のボード名を返す。ワーカーの起動後最初の参照時と、一定時間ごとにDBから作り直す
+def current_board(period):
+    today = date.today()
+    board = board_name(period, today)
+    leaderboard = get_leaderboard()
+    if leaderboard.needs_load(board):
+        # レプリカの遅延で直前の記録を取りこぼさないようプライマリから読む
+        db.session.info['primary'] = True
+        scores = _load_scores(period, period_start(period, today))
+        leaderboard.load(board, scores, keep={board_name(p, today) for p in LEADERBOARD_PERIODS})
+    return board
+
+
+# コミット後にランキングへ水分量を加算する（減算は負の値を渡す）
+def record_amount(session, user_id, day, amount):
+    session.info.setdefault('leaderboard_updates', []).append((user_id, day, amount))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_updates(session):
+    updates = session.info.pop('leaderboard_updates', None)
+    leaderboard = get_leaderboard()
+    if updates and leaderboard is not None:
+        for user_id, day, amount in updates:
+            for period in LEADERBOARD_PERIODS:
+                leaderboard.add(board_name(period, day), user_id, amount)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_updates(session):
+    session.info.pop('leaderboard_updates', None)
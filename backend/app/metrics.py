@@ -0,0 +1,196 @@
+import threading
+import time
+
+from flask import Response, current_app, g, request
+
+from app.instrumentation import get_request_stats
+
+# ヒストグラムのバケット（レイテンシ・DB時間は秒、サイズはバイト、バッチは行数）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# ルートに一致しなかったリクエストのラベル
+UNMATCHED_ENDPOINT = 'unmatched'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Prometheusのテキスト形式で出力する最小限のメトリクス（ワーカーごとに集計される）
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, labels, amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            # バケットごとの件数（累積ではない）, 合計
+            counts, total = self._values.get(labels, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[labels] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, labels, [('le', _format_value(bound))]),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.labelnames, labels), total
+            yield self.name + '_count', _format_labels(self.labelnames, labels), cumulative
+
+
+class Metrics:
+
+    def __init__(self):
+        self.requests = Counter(
+            'http_requests_total', 'Total HTTP requests.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram(
+            'http_request_duration_seconds', 'Request latency.', ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.db_time = Histogram(
+            'http_request_db_duration_seconds', 'Time spent in database queries per request.',
+            ('endpoint',), LATENCY_BUCKETS)
+        self.db_queries = Histogram(
+            'http_request_db_queries', 'Database queries per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.response_size = Histogram(
+            'http_response_size_bytes', 'Response body size (after compression).', ('endpoint',), SIZE_BUCKETS)
+        self.in_progress = Gauge(
+            'http_requests_in_progress', 'Requests currently being handled.', ('endpoint',))
+        self.coalesced = Counter(
+            'http_coalesced_requests_total',
+            'Coalesced read requests by role (leader computed, follower shared an in-flight result).',
+            ('endpoint', 'role'))
+        self.write_batch_rows = Histogram(
+            'water_record_write_batch_rows', 'Water records committed per buffered batch.', (), BATCH_SIZE_BUCKETS)
+        self.write_batch_duration = Histogram(
+            'water_record_write_batch_duration_seconds', 'Time to insert and commit a buffered batch.', (),
+            LATENCY_BUCKETS)
+
+    def all(self):
+        return [self.requests, self.latency, self.db_time, self.db_queries, self.response_size, self.in_progress,
+                self.coalesced, self.write_batch_rows, self.write_batch_duration]
+
+    def render(self):
+        lines = []
+        for metric in self.all():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+
+def _endpoint():
+    return request.endpoint or UNMATCHED_ENDPOINT
+
+
+def _start_timer():
+    g._metrics_start = time.perf_counter()
+    g._metrics_endpoint = _endpoint()
+    get_metrics().in_progress.inc((g._metrics_endpoint,))
+
+
+# 計測結果をServer-Timingヘッダーとメトリクスに記録する
+def _record_response(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    duration = time.perf_counter() - start
+    endpoint = _endpoint()
+    metrics = get_metrics()
+
+    timings = [f'app;dur={duration * 1000:.1f}']
+    stats = get_request_stats()
+    if stats is not None:
+        timings.append(f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+        metrics.db_time.observe((endpoint,), stats.duration)
+        metrics.db_queries.observe((endpoint,), stats.count)
+    response.headers.add('Server-Timing', ', '.join(timings))
+
+    metrics.requests.inc((endpoint, request.method, str(response.status_code)))
+    metrics.latency.observe((endpoint, request.method), duration)
+    # ストリーミングのレスポンスはサイズが分からないので記録しない
+    if response.content_length is not None:
+        metrics.response_size.observe((endpoint,), response.content_length)
+    return response
+
+
+def _finish_request(exc):
+    endpoint = g.pop('_metrics_endpoint', None)
+    if endpoint is not None:
+        get_metrics().in_progress.dec((endpoint,))
+
+
+# GET /metrics
+# Prometheusのテキスト形式でメトリクスを返す
+def metrics_view():
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    app.extensions['metrics'] = Metrics()
+    app.before_request(_start_timer)
+    # after_request は登録と逆順に呼ばれるので、圧縮などの後の最終的なレスポンスを記録する
+    app.after_request(_record_response)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
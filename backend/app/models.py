@@ -56,3 +56,30 @@ class UserStamp(db.Model):
   sender_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
   receiver_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
   stamp_id = db.Column(db.Integer, db.ForeignKey('stamp.stamp_id'), nullable=False)
+
+# ユーザー・日ごとの水分補給量の集計（水分記録の作成・更新と同じトランザクションで更新）
+class DailyWaterTotal(db.Model):
+  __tablename__ = 'daily_water_total'
+
+  user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+  day = db.Column(db.Date, primary_key=True)
+  total_amount = db.Column(db.Integer, nullable=False, default=0)
+  record_count = db.Column(db.Integer, nullable=False, default=0)
+
+# ユーザーごとの最新の水分記録の位置（近傍検索用。水分記録の作成・更新と同じトランザクションで更新）
+class UserLocation(db.Model):
+  __tablename__ = 'user_location'
+
+  user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+  water_date = db.Column(db.DateTime, nullable=False)
+  lat = db.Column(db.Float, nullable=False)
+  lon = db.Column(db.Float, nullable=False)
+  geohash = db.Column(db.String(12), nullable=False, index=True)
+
+# よく使う「ユーザーで絞り込んで日時の新しい順」の検索用の複合インデックス
+db.Index('ix_water_record_user_id_water_date', WaterRecord.user_id, WaterRecord.water_date.desc())
+db.Index('ix_user_stamp_receiver_id_created_at', UserStamp.receiver_id, UserStamp.created_at.desc())
+# 全ユーザーの記録一覧（新しい順のキーセットページネーション）用
+db.Index('ix_water_record_water_date_water_id', WaterRecord.water_date.desc(), WaterRecord.water_id.desc())
+# ランキングの読み込み（期間内の全ユーザーの集計）用
+db.Index('ix_daily_water_total_day_user_id', DailyWaterTotal.day, DailyWaterTotal.user_id)
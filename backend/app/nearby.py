@@ -0,0 +1,105 @@
+from app import db, geo
+from app.daily_totals import upsert_insert
+from app.models import User, UserLocation, WaterRecord
+
+# 近傍検索のデフォルト値と上限（半径はメートル）
+NEARBY_DEFAULT_RADIUS = 1000
+NEARBY_MAX_RADIUS = 20000
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 200
+
+
+# ユーザーの最新の位置（記録がなければNone）
+def latest_position(user_id):
+    return db.session.execute(
+        db.select(UserLocation.lat, UserLocation.lon).where(UserLocation.user_id == user_id)
+    ).first()
+
+
+# ユーザーの最新の記録の日時（スカラーサブクエリ、記録がなければNULL）
+# water_record を最新の記録だけ読む検索の下限に使う（PostgreSQLでは実行時に最新の月以外のパーティションが除外される）
+def latest_date_subquery(user_id):
+    return db.select(UserLocation.water_date).where(UserLocation.user_id == user_id).scalar_subquery()
+
+
+# (lat, lon) から radius メートル以内のユーザーを距離順で返す
+# 戻り値は (距離, 位置) のリスト。位置は user_id, lat, lon, water_date を持つ
+def find_nearby_users(lat, lon, radius, limit, exclude_user_id=None):
+    # 半径を覆うgeohashセルの範囲だけを、ユーザーごとの最新の位置（1ユーザー1行）からインデックスで検索
+    cells = geo.covering_cells(lat, lon, radius)
+    query = db.select(
+        UserLocation.user_id, UserLocation.lat, UserLocation.lon, UserLocation.water_date
+    ).where(
+        db.or_(*[UserLocation.geohash.between(*geo.prefix_range(cell)) for cell in cells])
+    )
+    if exclude_user_id is not None:
+        query = query.where(UserLocation.user_id != exclude_user_id)
+
+    nearby = []
+    for info in db.session.execute(query):
+        distance = geo.distance_m(lat, lon, info.lat, info.lon)
+        if distance <= radius:
+            nearby.append((distance, info))
+
+    # 距離順に並べる
+    nearby.sort(key=lambda item: item[0])
+    return nearby[:limit]
+
+
+# 記録がユーザーの最新の位置より新しければ置き換える
+# 呼び出し側のトランザクション内で実行され、コミットは呼び出し側で行う
+def update_latest_position(user_id, water_date, lat, lon):
+    values = {'user_id': user_id, 'water_date': water_date, 'lat': lat, 'lon': lon, 'geohash': geo.encode(lat, lon)}
+
+    insert = upsert_insert()
+    if insert is None:
+        # UPSERTが使えないDBでは行ロックを取って更新する
+        location = db.session.get(UserLocation, user_id, with_for_update=True)
+        if location is None:
+            db.session.add(UserLocation(**values))
+        elif location.water_date <= water_date:
+            for key, value in values.items():
+                setattr(location, key, value)
+        return
+
+    stmt = insert(UserLocation).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserLocation.user_id],
+        set_={key: stmt.excluded[key] for key in ('water_date', 'lat', 'lon', 'geohash')},
+        where=UserLocation.water_date <= stmt.excluded.water_date
+    )
+    db.session.execute(stmt)
+
+
+# ユーザーの最新の位置を水分記録から求め直す（記録の日時・位置・ユーザーを変更した場合）
+def refresh_latest_position(user_id):
+    latest = db.session.execute(
+        db.select(WaterRecord.water_date, WaterRecord.lat, WaterRecord.lon)
+        .where(WaterRecord.user_id == user_id)
+        .order_by(WaterRecord.water_date.desc(), WaterRecord.water_id.desc())
+        .limit(1)
+    ).first()
+    db.session.execute(db.delete(UserLocation).where(UserLocation.user_id == user_id))
+    if latest:
+        update_latest_position(user_id, latest.water_date, latest.lat, latest.lon)
+
+
+# 水分記録から最新の位置を作り直す（初期データ投入や不整合の修復用）
+def rebuild_latest_positions():
+    # ユーザーごとに複合インデックスで最新の1行を引く
+    latest = db.aliased(WaterRecord)
+    latest_id = db.select(latest.water_id).where(
+        latest.user_id == User.user_id
+    ).order_by(latest.water_date.desc(), latest.water_id.desc()).limit(1).correlate(User).scalar_subquery()
+    rows = db.session.execute(
+        db.select(User.user_id, WaterRecord.water_date, WaterRecord.lat, WaterRecord.lon)
+        .join(WaterRecord, WaterRecord.water_id == latest_id)
+    ).all()
+    db.session.execute(db.delete(UserLocation))
+    # geohashは水分記録には保存しないので、1ユーザー1行の最新の位置についてだけ計算する
+    if rows:
+        db.session.execute(db.insert(UserLocation), [
+            {'user_id': row.user_id, 'water_date': row.water_date, 'lat': row.lat, 'lon': row.lon,
+             'geohash': geo.encode(row.lat, row.lon)}
+            for row in rows
+        ])
@@ -0,0 +1,73 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import DateTime, tuple_
+
+from app.serializers import parse_datetime
+
+# 1ページあたりの件数のデフォルト値と上限
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        # 日時はISO形式の文字列から戻す
+        return [
+            parse_datetime(v) if isinstance(key.type, DateTime) else v
+            for key, v in zip(keys, values)
+        ]
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+# ?limit=&cursor= によるキーセットページネーション
+# keys は並び順のキーとなるカラム（最後のカラムは一意であること）
+def paginate(query, keys, descending=False):
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit <= 0 or limit > MAX_LIMIT:
+        raise PaginationError(f'limit must be between 1 and {MAX_LIMIT}')
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        # 先頭のキーだけの条件も付ける（行値の比較ではPostgreSQLのパーティションの除外が効かないため）
+        if descending:
+            query = query.filter(tuple_(*keys) < tuple_(*values), keys[0] <= values[0])
+        else:
+            query = query.filter(tuple_(*keys) > tuple_(*values), keys[0] >= values[0])
+
+    order = [key.desc() if descending else key.asc() for key in keys]
+    # 次のページがあるかを知るために1件多く取得する
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+    return rows, limit, next_cursor
+
+
+def page_response(items, limit, next_cursor):
+    return {
+        'items': items,
+        'limit': limit,
+        'next_cursor': next_cursor
+    }
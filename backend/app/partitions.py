@@ -0,0 +1,224 @@
+import csv
+import gzip
+import os
+from datetime import date
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.models import WaterRecord
+
+partitions_cli = AppGroup('partitions', help='Manage monthly partitions of water_record (PostgreSQL).')
+
+TABLE = WaterRecord.__tablename__
+DEFAULT_PARTITION = f'{TABLE}_default'
+COLUMNS = ', '.join(column.name for column in WaterRecord.__table__.columns)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise click.BadParameter(f'expected YYYY-MM, got {value!r}')
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def archive_path(directory, month):
+    return os.path.join(directory, f'{partition_name(month)}.csv.gz')
+
+
+def _require_partitioned(conn):
+    if conn.dialect.name != 'postgresql':
+        raise click.ClickException('Partitioning requires PostgreSQL')
+    partitioned = conn.exec_driver_sql(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+        (TABLE,)
+    ).scalar()
+    if not partitioned:
+        raise click.ClickException(f'{TABLE} is not partitioned; run flask db upgrade first')
+
+
+# 接続中の月別パーティション {月: 推定行数}
+def attached_partitions(conn):
+    rows = conn.exec_driver_sql(
+        'SELECT c.relname, c.reltuples FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent '
+        'WHERE p.relname = %s',
+        (TABLE,)
+    ).all()
+    prefix = f'{TABLE}_p'
+    partitions = {}
+    for name, reltuples in rows:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split('_')
+            partitions[date(int(year), int(month), 1)] = max(int(reltuples), 0)
+    return partitions
+
+
+def _range(month):
+    return month.isoformat(), add_months(month, 1).isoformat()
+
+
+# 月のパーティションを作成して接続する
+# デフォルトパーティションにその月の記録があれば、新しいパーティションへ移してから接続する
+def create_partition(conn, month):
+    name = partition_name(month)
+    start, end = _range(month)
+    in_default = conn.exec_driver_sql(
+        f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE water_date >= %s AND water_date < %s LIMIT 1',
+        (start, end)
+    ).scalar()
+    if not in_default:
+        conn.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{start}') TO ('{end}')")
+        return 0
+
+    conn.exec_driver_sql(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    moved = conn.exec_driver_sql(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE water_date >= %s AND water_date < %s RETURNING {COLUMNS}) '
+        f'INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM moved',
+        (start, end)
+    ).rowcount
+    conn.exec_driver_sql(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    return moved
+
+
+# flask partitions create --ahead 3
+# 今月から ahead か月先までのパーティションを作成する（cronなどで定期的に実行する）
+@partitions_cli.command('create')
+@click.option('--ahead', default=None, type=int, help='Months ahead to create (default: PARTITION_MONTHS_AHEAD).')
+def create(ahead):
+    if ahead is None:
+        ahead = current_app.config['PARTITION_MONTHS_AHEAD']
+    with db.engine.begin() as conn:
+        _require_partitioned(conn)
+        existing = attached_partitions(conn)
+        current = month_start(date.today())
+        for i in range(ahead + 1):
+            month = add_months(current, i)
+            if month in existing:
+                continue
+            moved = create_partition(conn, month)
+            click.echo(f'created {partition_name(month)}' + (f' ({moved} rows moved from default)' if moved else ''))
+
+
+# flask partitions list
+@partitions_cli.command('list')
+def list_partitions():
+    directory = current_app.config['PARTITION_ARCHIVE_DIR']
+    with db.engine.connect() as conn:
+        _require_partitioned(conn)
+        partitions = attached_partitions(conn)
+        in_default = conn.exec_driver_sql(f'SELECT count(*) FROM {DEFAULT_PARTITION}').scalar()
+
+    for month, rows in sorted(partitions.items()):
+        click.echo(f'{partition_name(month)}  attached  ~{rows} rows')
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(f'{TABLE}_p') and filename.endswith('.csv.gz'):
+                click.echo(f'{filename[:-len(".csv.gz")]}  archived  {os.path.join(directory, filename)}')
+    click.echo(f'{DEFAULT_PARTITION}  {in_default} rows')
+
+
+# flask partitions archive --before 2025-01
+# 指定した月より前のパーティションをgzip圧縮したCSVに書き出し、切り離して削除する
+@partitions_cli.command('archive')
+@click.option('--before', 'before', required=True, help='Archive partitions for months before YYYY-MM.')
+@click.option('--dir', 'directory', default=None, help='Archive directory (default: PARTITION_ARCHIVE_DIR).')
+def archive(before, directory):
+    before = parse_month(before)
+    directory = directory or current_app.config['PARTITION_ARCHIVE_DIR']
+    if before > month_start(date.today()):
+        raise click.ClickException('Only months before the current month can be archived')
+    os.makedirs(directory, exist_ok=True)
+
+    with db.engine.connect() as conn:
+        _require_partitioned(conn)
+        months = sorted(month for month in attached_partitions(conn) if month < before)
+
+    for month in months:
+        name = partition_name(month)
+        path = archive_path(directory, month)
+        if os.path.exists(path):
+            raise click.ClickException(f'{path} already exists')
+
+        with db.engine.begin() as conn:
+            # 書き出し中に記録が増減しないようロックする
+            conn.exec_driver_sql(f'LOCK TABLE {name} IN SHARE MODE')
+            count = conn.exec_driver_sql(f'SELECT count(*) FROM {name}').scalar()
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                with conn.connection.driver_connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f'COPY (SELECT {COLUMNS} FROM {name} ORDER BY water_id) TO STDOUT WITH (FORMAT csv, HEADER true)',
+                        f
+                    )
+            # 書き出した件数を確認してから削除する
+            with gzip.open(tmp_path, 'rt', encoding='utf-8', newline='') as f:
+                written = sum(1 for _ in csv.reader(f)) - 1
+            if written != count:
+                os.remove(tmp_path)
+                raise click.ClickException(f'{name}: wrote {written} of {count} rows, aborted')
+            os.replace(tmp_path, path)
+
+            conn.exec_driver_sql(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            conn.exec_driver_sql(f'DROP TABLE {name}')
+        click.echo(f'archived {name}: {count} rows -> {path}')
+
+
+# flask partitions restore 2024-12
+# アーカイブしたパーティションを読み込んで再び接続する
+@partitions_cli.command('restore')
+@click.argument('month')
+@click.option('--dir', 'directory', default=None, help='Archive directory (default: PARTITION_ARCHIVE_DIR).')
+def restore(month, directory):
+    month = parse_month(month)
+    directory = directory or current_app.config['PARTITION_ARCHIVE_DIR']
+    name = partition_name(month)
+    path = archive_path(directory, month)
+    if not os.path.exists(path):
+        raise click.ClickException(f'{path} not found')
+
+    with db.engine.begin() as conn:
+        _require_partitioned(conn)
+        if month in attached_partitions(conn):
+            raise click.ClickException(f'{name} is already attached')
+
+        conn.exec_driver_sql(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            # アーカイブの列はヘッダーから読む（今はない列（以前の geohash など）は一時的に追加して読み込み、最後に削除する）
+            header = next(csv.reader([f.readline()]))
+            if not all(column.isidentifier() for column in header):
+                raise click.ClickException(f'{path}: invalid header {header}')
+            removed = [column for column in header if column not in WaterRecord.__table__.columns]
+            for column in removed:
+                conn.exec_driver_sql(f'ALTER TABLE {name} ADD COLUMN {column} TEXT')
+            with conn.connection.driver_connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY {name} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", f)
+            for column in removed:
+                conn.exec_driver_sql(f'ALTER TABLE {name} DROP COLUMN {column}')
+        count = conn.exec_driver_sql(f'SELECT count(*) FROM {name}').scalar()
+
+        # アーカイブ後にデフォルトパーティションに入った同じ月の記録も移す
+        start, end = _range(month)
+        moved = conn.exec_driver_sql(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE water_date >= %s AND water_date < %s RETURNING {COLUMNS}) '
+            f'INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM moved',
+            (start, end)
+        ).rowcount
+        conn.exec_driver_sql(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    click.echo(f'restored {name}: {count + moved} rows from {path}')
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+# ワーカー内でのイベント配信（ワーカーが1つの場合）
+# イベントには全体で単調増加する番号を振り、ユーザーごとに直近のものだけを保持する
+# 最後のイベントから ttl 秒たったユーザーのイベントは捨てる
+class LocalBroker:
+
+    def __init__(self, buffer_size=100, ttl=600):
+        self.buffer_size = buffer_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 待っているユーザーごとの [Condition, 待っている数]（誰も待たなくなったら消す）
+        self._waiters = {}
+        # ユーザーごとの [直近のイベント, 最後に追加した時刻]
+        self._events = {}
+        self._seq = 0
+        # 捨てたイベントの最大の番号（それより前から待っているクライアントにはリセットを通知する）
+        self._expired_seq = 0
+        self._pruned_at = time.monotonic()
+
+    def publish(self, user_id, payload):
+        with self._lock:
+            self._seq += 1
+            now = time.monotonic()
+            entry = self._events.get(user_id)
+            if entry is None:
+                entry = self._events[user_id] = [deque(maxlen=self.buffer_size), now]
+            entry[0].append((self._seq, payload))
+            entry[1] = now
+            waiter = self._waiters.get(user_id)
+            if waiter is not None:
+                waiter[0].notify_all()
+            self._prune(now)
+
+    # 期限切れのユーザーのイベントを捨てる（ttl/2 秒に1回まとめて調べる）
+    def _prune(self, now):
+        if now - self._pruned_at < self.ttl / 2:
+            return
+        self._pruned_at = now
+        for user_id, (events, updated) in list(self._events.items()):
+            if updated + self.ttl <= now:
+                self._expired_seq = max(self._expired_seq, events[-1][0])
+                del self._events[user_id]
+
+    def _read(self, user_id, since):
+        entry = self._events.get(user_id)
+        events = entry[0] if entry is not None else ()
+        # 番号が巻き戻った（再起動）か、取りこぼし・期限切れで捨てたイベントがある場合はリセットを通知する
+        reset = since > self._seq or since < self._expired_seq or (
+            len(events) == self.buffer_size and events[0][0] > since + 1
+        )
+        return [(seq, payload) for seq, payload in events if seq > since], self._seq, reset
+
+    # since より新しいイベントを待つ。timeout 秒経っても来なければ空のリストを返す
+    def wait(self, user_id, since, timeout):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            waiter = self._waiters.get(user_id)
+            if waiter is None:
+                waiter = self._waiters[user_id] = [threading.Condition(self._lock), 0]
+            waiter[1] += 1
+            try:
+                while True:
+                    events, latest, reset = self._read(user_id, since)
+                    remaining = deadline - time.monotonic()
+                    if events or reset or remaining <= 0:
+                        return events, latest, reset
+                    waiter[0].wait(remaining)
+            finally:
+                waiter[1] -= 1
+                if waiter[1] == 0:
+                    del self._waiters[user_id]
+
+    def latest(self):
+        with self._lock:
+            return self._seq
+
+
+# Redisを使うイベント配信（複数ワーカー用）
+class RedisBroker:
+
+    def __init__(self, url, buffer_size=100, ttl=600, prefix='hicoder:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('PUBSUB_BACKEND=redis requires the redis package')
+        self.buffer_size = buffer_size
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, user_id):
+        return f'{self._prefix}events:{user_id}'
+
+    def publish(self, user_id, payload):
+        seq = self._client.incr(self._prefix + 'events:seq')
+        pipe = self._client.pipeline()
+        pipe.rpush(self._key(user_id), json.dumps([seq, payload]))
+        pipe.ltrim(self._key(user_id), -self.buffer_size, -1)
+        # 最後のイベントから ttl 秒たったユーザーのイベントは消える
+        pipe.expire(self._key(user_id), self.ttl)
+        pipe.publish(self._key(user_id), seq)
+        pipe.execute()
+
+    def _read(self, user_id, since):
+        latest = int(self._client.get(self._prefix + 'events:seq') or 0)
+        events = [json.loads(raw) for raw in self._client.lrange(self._key(user_id), 0, -1)]
+        reset = since > latest or (
+            len(events) == self.buffer_size and events[0][0] > since + 1
+        )
+        return [(seq, payload) for seq, payload in events if seq > since], latest, reset
+
+    def wait(self, user_id, since, timeout):
+        deadline = time.monotonic() + timeout
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        # 取りこぼさないように、購読してから読み直す
+        pubsub.subscribe(self._key(user_id))
+        try:
+            while True:
+                events, latest, reset = self._read(user_id, since)
+                remaining = deadline - time.monotonic()
+                if events or reset or remaining <= 0:
+                    return events, latest, reset
+                pubsub.get_message(timeout=remaining)
+        finally:
+            pubsub.close()
+
+    def latest(self):
+        return int(self._client.get(self._prefix + 'events:seq') or 0)
+
+
+def init_pubsub(app):
+    app.config.setdefault('PUBSUB_BACKEND', 'local')
+    app.config.setdefault('PUBSUB_URL', None)
+    app.config.setdefault('PUBSUB_BUFFER_SIZE', 100)
+    app.config.setdefault('PUBSUB_EVENT_TTL', 600)
+    app.config.setdefault('POLL_MAX_WAITERS', 8)
+    app.config.setdefault('POLL_RETRY_AFTER', 5)
+
+    backend = app.config['PUBSUB_BACKEND']
+    if backend == 'local':
+        broker = LocalBroker(app.config['PUBSUB_BUFFER_SIZE'], app.config['PUBSUB_EVENT_TTL'])
+    elif backend == 'redis':
+        broker = RedisBroker(app.config['PUBSUB_URL'], app.config['PUBSUB_BUFFER_SIZE'], app.config['PUBSUB_EVENT_TTL'])
+    else:
+        raise RuntimeError(f'Unknown PUBSUB_BACKEND: {backend}')
+    app.extensions['pubsub'] = broker
+    # ロングポーリングで同時に待てるリクエスト数（ワーカーごと）
+    app.extensions['poll_waiters'] = threading.BoundedSemaphore(app.config['POLL_MAX_WAITERS'])
+
+
+def get_broker():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('pubsub')
+
+
+def get_poll_waiters():
+    return current_app.extensions['poll_waiters']
+
+
+# コミット後にユーザーへ通知するイベントを登録する
+def notify(session, user_id, payload):
+    session.info.setdefault('pubsub_events', []).append((user_id, payload))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_events(session):
+    events = session.info.pop('pubsub_events', None)
+    broker = get_broker()
+    if events and broker is not None:
+        for user_id, payload in events:
+            broker.publish(user_id, payload)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('pubsub_events', None)
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from flask import Blueprint, current_app, jsonify, request
+from app.models import DailyWaterTotal, User, UserStamp, WaterRecord
+from app import db
+from app.coalescing import coalesced
+from app.nearby import (
+    NEARBY_DEFAULT_LIMIT, NEARBY_DEFAULT_RADIUS, NEARBY_MAX_RADIUS, find_nearby_users, latest_date_subquery
+)
+from app.serializers import USER_COLUMNS, WATER_RECORD_COLUMNS, nearby_user_dict, user_dict, water_record_dict
+
+home_bp = Blueprint('home', __name__)
+
+# HOME_CONCURRENT_QUERIES が有効な場合にプロフィールの取得を並行して行うスレッド
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='home')
+
+
+# プロフィール・今日の合計・未返信スタンプ数をスカラーサブクエリで1回のクエリで取得
+def _load_profile(user_id, today):
+    today_total = db.select(DailyWaterTotal.total_amount).where(
+        DailyWaterTotal.user_id == user_id, DailyWaterTotal.day == today
+    ).scalar_subquery()
+    today_count = db.select(DailyWaterTotal.record_count).where(
+        DailyWaterTotal.user_id == user_id, DailyWaterTotal.day == today
+    ).scalar_subquery()
+    unreplied = db.select(db.func.count(UserStamp.user_stamp_id)).where(
+        UserStamp.receiver_id == user_id, UserStamp.after_stamp.isnot(True)
+    ).scalar_subquery()
+
+    return db.session.execute(
+        db.select(
+            *USER_COLUMNS,
+            today_total.label('today_total'),
+            today_count.label('today_count'),
+            unreplied.label('unreplied')
+        ).where(User.user_id == user_id)
+    ).first()
+
+
+def _load_profile_in_context(app, user_id, today):
+    with app.app_context():
+        return _load_profile(user_id, today)
+
+
+# 最新の記録とその位置からの近くのユーザー
+def _load_latest_and_nearby(user_id, radius):
+    latest = db.session.execute(
+        db.select(*WATER_RECORD_COLUMNS).where(
+            WaterRecord.user_id == user_id,
+            WaterRecord.water_date >= latest_date_subquery(user_id)
+        ).order_by(WaterRecord.water_date.desc()).limit(1)
+    ).first()
+    if not latest:
+        return None, []
+    return latest, find_nearby_users(latest.lat, latest.lon, radius, NEARBY_DEFAULT_LIMIT, exclude_user_id=user_id)
+
+
+# GET /api/v1/home/<user_id>?radius=1000
+# ホーム画面に必要な情報（プロフィール・今日の合計・最新の記録・未返信スタンプ数・近くのユーザー）をまとめて取得
+@home_bp.route('/<int:user_id>', methods=['GET'])
+@coalesced
+def get_home(user_id):
+    radius = request.args.get('radius', NEARBY_DEFAULT_RADIUS, type=float)
+    if radius <= 0 or radius > NEARBY_MAX_RADIUS:
+        return jsonify({'error': f'radius must be between 0 and {NEARBY_MAX_RADIUS}'}), 400
+
+    today = date.today()
+    if current_app.config.get('HOME_CONCURRENT_QUERIES'):
+        # プロフィールの取得は別スレッド（別セッション）で並行して行う
+        future = _executor.submit(_load_profile_in_context, current_app._get_current_object(), user_id, today)
+        latest, nearby = _load_latest_and_nearby(user_id, radius)
+        profile = future.result()
+    else:
+        profile = _load_profile(user_id, today)
+        latest, nearby = _load_latest_and_nearby(user_id, radius) if profile else (None, [])
+
+    if not profile:
+        return jsonify({'error': 'User not found'}), 404
+
+    return jsonify({
+        'user': user_dict(profile),
+        'today': {
+            'day': today.isoformat(),
+            'total_amount': profile.today_total or 0,
+            'record_count': profile.today_count or 0
+        },
+        'latest_record': water_record_dict(latest) if latest else None,
+        'unreplied_stamps': profile.unreplied,
+        'nearby_users': [nearby_user_dict(distance, info) for distance, info in nearby]
+    })
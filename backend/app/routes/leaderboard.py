@@ -0,0 +1,72 @@
+from flask import Blueprint, jsonify, request
+from app.models import User
+from app import db
+from app.coalescing import coalesced
+from app.leaderboard import LEADERBOARD_PERIODS, current_board, get_leaderboard
+from app.nearby import NEARBY_DEFAULT_RADIUS, NEARBY_MAX_LIMIT, NEARBY_MAX_RADIUS, find_nearby_users, latest_position
+
+leaderboard_bp = Blueprint('leaderboard', __name__)
+
+# ランキングで返す件数のデフォルト値と上限
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+
+
+# GET /api/v1/leaderboard/<user_id>?period=day&limit=10&nearby=true&radius=1000
+# 今日（period=day）・今週（period=week）の水分補給量のランキングと、指定されたユーザー自身の順位を取得
+# nearby=true の場合は近くのユーザーと自分の中での順位
+@leaderboard_bp.route('/<int:user_id>', methods=['GET'])
+@coalesced
+def get_ranking(user_id):
+    period = request.args.get('period', 'day')
+    if period not in LEADERBOARD_PERIODS:
+        return jsonify({'error': f'period must be one of: {", ".join(LEADERBOARD_PERIODS)}'}), 400
+    limit = request.args.get('limit', LEADERBOARD_DEFAULT_LIMIT, type=int)
+    if limit <= 0 or limit > LEADERBOARD_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {LEADERBOARD_MAX_LIMIT}'}), 400
+
+    board = current_board(period)
+    leaderboard = get_leaderboard()
+
+    if request.args.get('nearby', '').lower() in ('1', 'true'):
+        radius = request.args.get('radius', NEARBY_DEFAULT_RADIUS, type=float)
+        if radius <= 0 or radius > NEARBY_MAX_RADIUS:
+            return jsonify({'error': f'radius must be between 0 and {NEARBY_MAX_RADIUS}'}), 400
+        position = latest_position(user_id)
+        if not position:
+            return jsonify({'error': 'No water record found for this user'}), 404
+
+        # 近くのユーザー（最大 NEARBY_MAX_LIMIT 人）と自分のスコアだけを並べる
+        nearby = find_nearby_users(position.lat, position.lon, radius, NEARBY_MAX_LIMIT, exclude_user_id=user_id)
+        scores = leaderboard.scores(board, [info.user_id for _, info in nearby] + [user_id])
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        top = ranked[:limit]
+        my_rank = next((i for i, (ranked_id, _) in enumerate(ranked) if ranked_id == user_id), None)
+        my_score = scores.get(user_id, 0)
+    else:
+        top = leaderboard.top(board, limit)
+        my_rank, my_score = leaderboard.rank(board, user_id)
+
+    # 表示名はまとめて1回のINクエリで取得
+    users = {row.user_id: row for row in db.session.execute(
+        db.select(User.user_id, User.user_name, User.photo_url)
+        .where(User.user_id.in_([ranked_id for ranked_id, _ in top] + [user_id]))
+    )}
+    if user_id not in users:
+        return jsonify({'error': 'User not found'}), 404
+
+    return jsonify({
+        'period': period,
+        'start': board.split(':', 1)[1],
+        'top': [{
+            'rank': rank + 1,
+            'user_id': ranked_id,
+            'user_name': users[ranked_id].user_name if ranked_id in users else None,
+            'photo_url': users[ranked_id].photo_url if ranked_id in users else None,
+            'total_amount': score
+        } for rank, (ranked_id, score) in enumerate(top)],
+        'me': {
+            'rank': my_rank + 1 if my_rank is not None else None,
+            'total_amount': my_score
+        }
+    })
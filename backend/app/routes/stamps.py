@@ -1,64 +1,144 @@
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, abort, current_app, jsonify, request
 from app.models import Stamp, User, UserStamp
 from app import db
+from app.cache import STAMPS_TAG, cached
+from app.coalescing import coalesced
+from app.nearby import NEARBY_DEFAULT_RADIUS, NEARBY_MAX_RADIUS, find_nearby_users, latest_position
+from app.pagination import PaginationError, paginate, page_response
+from app.pubsub import get_broker, get_poll_waiters, notify
+from app.serializers import STAMP_COLUMNS, received_stamp_dict, stamp_dict, user_stamp_dict
 
 stamps_bp = Blueprint('stamps', __name__)
 
+# 一斉送信で1回に送れる受信者数の上限
+BROADCAST_MAX_RECEIVERS = 100
+
+# ロングポーリングの待ち時間（秒）のデフォルト値と上限
+POLL_DEFAULT_TIMEOUT = 25
+POLL_MAX_TIMEOUT = 30
+
+
+# スタンプの受信・返信を通知するイベント
+def _stamp_event(event_type, user_stamp):
+    return {'type': event_type, **user_stamp_dict(user_stamp)}
+
+# JSONで受け取ったIDが整数か（true/false もPythonではintなので除く）
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# ロングポーリングの応答（retry_after を指定すると、その秒数だけ空けて再接続させる）
+def _poll_response(events, latest, reset, retry_after=None):
+    body = {
+        'events': [payload for _, payload in events],
+        'cursor': max([latest] + [seq for seq, _ in events]),
+        'reset': reset
+    }
+    if retry_after is None:
+        return jsonify(body)
+    response = jsonify({**body, 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 # GET /api/v1/stamps
 # 利用可能なスタンプ一覧を取得
 @stamps_bp.route('/', methods=['GET'])
+@cached(lambda: STAMPS_TAG)
 def get_stamps():
-    stamps = Stamp.query.all()
-    
-    stamps_list = []
-    for stamp in stamps:
-        stamps_list.append({
-            'stamp_id': stamp.stamp_id,
-            'message': stamp.message,
-            'image_url': stamp.image_url
-        })
-    
-    return jsonify(stamps_list)
+    stamps = Stamp.query.with_entities(*STAMP_COLUMNS).all()
+    return jsonify([stamp_dict(stamp) for stamp in stamps])
 
 # GET /api/v1/stamps/<stamp_id>
 # 指定されたstamp_idのスタンプの情報を取得
 @stamps_bp.route('/<int:stamp_id>', methods=['GET'])
+@cached(lambda stamp_id: STAMPS_TAG)
 def get_stamp(stamp_id):
-    stamp = Stamp.query.get_or_404(stamp_id)
+    stamp = Stamp.query.with_entities(*STAMP_COLUMNS).filter_by(stamp_id=stamp_id).first()
+    if stamp is None:
+        abort(404)
 
-    return jsonify({
-        'stamp_id': stamp.stamp_id,
-        'message': stamp.message,
-        'image_url': stamp.image_url
-    })
+    return jsonify(stamp_dict(stamp))
 
-# GET api/v1/stamps/send/<user_id>
-# 指定されたuser_idのユーザーに送られたスタンプの一覧を取得
+# GET api/v1/stamps/send/<user_id>?unreplied=true&limit=50&cursor=<next_cursor>
+# 指定されたuser_idのユーザーに送られたスタンプの一覧を取得（新しい順、キーセットページネーション）
+# unreplied=true の場合は未返信（after_stampがFalse）のスタンプのみ
 @stamps_bp.route('/send/<int:user_id>', methods=['GET'])
+@coalesced
 def get_send_stamps(user_id):
-    # ユーザーの存在確認
-    user = User.query.get_or_404(user_id)
-    
+    # スタンプ・送信者の情報を結合し、必要なカラムだけを1回のクエリで取得
+    query = db.session.query(
+        UserStamp.user_stamp_id,
+        UserStamp.sender_id,
+        UserStamp.receiver_id,
+        UserStamp.stamp_id,
+        Stamp.message.label('stamp_message'),
+        Stamp.image_url.label('stamp_image_url'),
+        UserStamp.after_stamp,
+        UserStamp.created_at,
+        UserStamp.updated_at,
+        User.user_name.label('sender_name')
+    ).join(
+        Stamp, Stamp.stamp_id == UserStamp.stamp_id
+    ).join(
+        User, User.user_id == UserStamp.sender_id
+    ).filter(
+        UserStamp.receiver_id == user_id
+    )
+
+    if request.args.get('unreplied', '').lower() in ('1', 'true'):
+        query = query.filter(UserStamp.after_stamp.isnot(True))
+
     # そのユーザーが受信したスタンプを取得
-    received_stamps = UserStamp.query.filter_by(receiver_id=user_id).order_by(UserStamp.created_at.desc()).all()
-    
-    stamps_list = []
-    for user_stamp in received_stamps:
-        stamps_list.append({
-            'user_stamp_id': user_stamp.user_stamp_id,
-            'sender_id': user_stamp.sender_id,
-            'receiver_id': user_stamp.receiver_id,
-            'stamp_id': user_stamp.stamp_id,
-            'stamp_message': user_stamp.stamp_info.message,
-            'stamp_image_url': user_stamp.stamp_info.image_url,
-            'after_stamp': user_stamp.after_stamp,
-            'created_at': user_stamp.created_at.isoformat(),
-            'updated_at': user_stamp.updated_at.isoformat(),
-            'sender_name': user_stamp.sender.user_name
-        })
+    try:
+        received_stamps, limit, next_cursor = paginate(
+            query,
+            [UserStamp.created_at, UserStamp.user_stamp_id],
+            descending=True
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 受信スタンプがないときだけユーザーの存在確認
+    if not received_stamps and not request.args.get('cursor'):
+        if not db.session.query(User.user_id).filter_by(user_id=user_id).first():
+            return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(stamps_list)
+    stamps_list = [received_stamp_dict(user_stamp) for user_stamp in received_stamps]
+    return jsonify(page_response(stamps_list, limit, next_cursor))
+
+# GET /api/v1/stamps/events/<user_id>?since=<cursor>&timeout=25
+# スタンプの受信・返信イベントをロングポーリングで取得（DBへのアクセスはユーザーの存在確認の1回だけ）
+# since を省略すると現在のカーソルだけをすぐに返す。以降は返されたcursorを次のsinceに渡す
+# reset が true の場合はイベントを取りこぼしているので、受信一覧を取得し直すこと
+# （イベントは最後のイベントから PUBSUB_EVENT_TTL 秒で捨てるので、それより長く間が空いた場合も取得し直すこと）
+# 待っているリクエストがワーカーごとの上限（POLL_MAX_WAITERS）に達している場合は待たずに返す。
+# そのときは retry_after（秒）とRetry-Afterヘッダーが付くので、その秒数だけ空けて再接続すること
+@stamps_bp.route('/events/<int:user_id>', methods=['GET'])
+def poll_stamp_events(user_id):
+    # 存在しないユーザーのイベントを待たない（待ち合わせのための状態を作らせない）
+    if not db.session.scalar(db.select(User.user_id).where(User.user_id == user_id)):
+        return jsonify({'error': 'User not found'}), 404
+    # 待っている間に接続を持ち続けないよう返しておく
+    db.session.close()
+
+    broker = get_broker()
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'events': [], 'cursor': broker.latest(), 'reset': False})
+
+    timeout = request.args.get('timeout', POLL_DEFAULT_TIMEOUT, type=float)
+    timeout = min(max(timeout, 0), POLL_MAX_TIMEOUT)
+
+    waiters = get_poll_waiters()
+    if not waiters.acquire(blocking=False):
+        # 待っている間はワーカーのスレッドを使い続けるので、上限を超えた分は今あるイベントだけを返す
+        events, latest, reset = broker.wait(user_id, since, 0)
+        return _poll_response(events, latest, reset, current_app.config['POLL_RETRY_AFTER'])
+    try:
+        events, latest, reset = broker.wait(user_id, since, timeout)
+    finally:
+        waiters.release()
+    return _poll_response(events, latest, reset)
 
 # POST /api/v1/stamps/send
 # スタンプを送信
@@ -103,20 +183,107 @@ def send_stamp():
 
     try:
       db.session.add(new_stamp)
+      db.session.flush()
+      # 受信者へコミット後に通知
+      notify(db.session, receiver_id, _stamp_event('stamp', new_stamp))
       db.session.commit()
-      return jsonify({
-        'user_stamp_id': new_stamp.user_stamp_id,
-        'sender_id': new_stamp.sender_id,
-        'receiver_id': new_stamp.receiver_id,
-        'stamp_id': new_stamp.stamp_id,
-        'created_at': new_stamp.created_at.isoformat(),
-        'updated_at': new_stamp.updated_at.isoformat()
-      }), 201
+      return jsonify(user_stamp_dict(new_stamp)), 201
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to send stamp'}), 500
   
+# POST /api/v1/stamps/send/broadcast
+# 複数のユーザーにスタンプを一斉送信
+# 送信するデータの例：{ "sender_id": 1, "stamp_id": 1, "receiver_ids": [2, 3, 4] }
+# 近くのユーザー全員に送る場合：{ "sender_id": 1, "stamp_id": 1, "nearby": true, "radius": 1000 }
+@stamps_bp.route('/send/broadcast', methods=['POST'])
+def broadcast_stamp():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    sender_id = data.get('sender_id')
+    stamp_id = data.get('stamp_id')
+    if not sender_id or not stamp_id:
+        return jsonify({'error': 'Missing required fields'}), 400
+    if not _is_id(sender_id) or not _is_id(stamp_id):
+        return jsonify({'error': 'sender_id and stamp_id must be integers'}), 400
+
+    if data.get('nearby'):
+        # 送信者の最新の位置から近くのユーザーを受信者にする
+        radius = data.get('radius', NEARBY_DEFAULT_RADIUS)
+        if not isinstance(radius, (int, float)) or isinstance(radius, bool) or radius <= 0 or radius > NEARBY_MAX_RADIUS:
+            return jsonify({'error': f'radius must be between 0 and {NEARBY_MAX_RADIUS}'}), 400
+        position = latest_position(sender_id)
+        if not position:
+            return jsonify({'error': 'No water record found for the sender'}), 404
+        nearby = find_nearby_users(position.lat, position.lon, radius, BROADCAST_MAX_RECEIVERS, exclude_user_id=sender_id)
+        receiver_ids = [info.user_id for _, info in nearby]
+    else:
+        receiver_ids = data.get('receiver_ids')
+        if not isinstance(receiver_ids, list) or not all(_is_id(i) for i in receiver_ids):
+            return jsonify({'error': 'receiver_ids must be an array of user IDs'}), 400
+        # 重複と自分自身を除く（順序は保持）
+        receiver_ids = [i for i in dict.fromkeys(receiver_ids) if i != sender_id]
+
+    if not receiver_ids:
+        return jsonify({'error': 'No receivers'}), 404
+    if len(receiver_ids) > BROADCAST_MAX_RECEIVERS:
+        return jsonify({'error': f'At most {BROADCAST_MAX_RECEIVERS} receivers can be specified'}), 400
+
+    # 送信者・受信者の存在確認をまとめて1回のINクエリで行う
+    found = set(db.session.scalars(
+        db.select(User.user_id).where(User.user_id.in_([sender_id] + receiver_ids))
+    ))
+    if sender_id not in found:
+        return jsonify({'error': 'Sender not found'}), 404
+
+    # スタンプの存在確認
+    if not db.session.scalar(db.select(Stamp.stamp_id).where(Stamp.stamp_id == stamp_id)):
+        return jsonify({'error': 'Stamp not found'}), 404
+
+    not_found = [i for i in receiver_ids if i not in found]
+    receiver_ids = [i for i in receiver_ids if i in found]
+    if not receiver_ids:
+        return jsonify({'error': 'Receivers not found', 'not_found': not_found}), 404
+
+    now = datetime.now()
+    rows = [{
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'stamp_id': stamp_id,
+        'after_stamp': False,
+        'created_at': now,
+        'updated_at': now
+    } for receiver_id in receiver_ids]
+
+    try:
+        # まとめて1回の複数行INSERT
+        # RETURNINGの行の順序はDBによって保証されないので、入力の順に並べて返させる
+        user_stamp_ids = db.session.scalars(
+            db.insert(UserStamp).returning(UserStamp.user_stamp_id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        # 各受信者へコミット後に通知
+        for user_stamp_id, row in zip(user_stamp_ids, rows):
+            notify(db.session, row['receiver_id'], _stamp_event('stamp', UserStamp(user_stamp_id=user_stamp_id, **row)))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to send stamp'}), 500
+
+    return jsonify({
+        'sender_id': sender_id,
+        'stamp_id': stamp_id,
+        'created_at': now.isoformat(),
+        'sent': [
+            {'user_stamp_id': user_stamp_id, 'receiver_id': receiver_id}
+            for user_stamp_id, receiver_id in zip(user_stamp_ids, receiver_ids)
+        ],
+        'not_found': not_found
+    }), 201
+
 # PUT api/v1/stamps/reply/<user_stamp_id>
 # 指定されたuser_stamp_idのスタンプに返信する(after_stampフラグを更新)
 @stamps_bp.route('/reply/<int:user_stamp_id>', methods=['PUT'])
@@ -132,16 +299,10 @@ def reply_stamp(user_stamp_id):
       user_stamp.updated_at = datetime.now()
 
     try:
+      # 元の送信者へコミット後に通知
+      notify(db.session, user_stamp.sender_id, _stamp_event('reply', user_stamp))
       db.session.commit()
-      return jsonify({
-        'user_stamp_id': user_stamp.user_stamp_id,
-        'sender_id': user_stamp.sender_id,
-        'receiver_id': user_stamp.receiver_id,
-        'after_stamp': user_stamp.after_stamp,
-        'stamp_id': user_stamp.stamp_id,
-        'created_at': user_stamp.created_at.isoformat(),
-        'updated_at': user_stamp.updated_at.isoformat()
-      }), 200
+      return jsonify(user_stamp_dict(user_stamp)), 200
     except Exception as e:
       db.session.rollback()
       return jsonify({'error': 'Failed to reply stamp'}), 500
\ No newline at end of file
@@ -1,25 +1,30 @@
-from flask import Blueprint, jsonify, request
-from app.models import User,WaterRecord
+from flask import Blueprint, abort, jsonify, request
+from app.models import User
 from app import db
+from app.cache import cached, user_tag
+from app.coalescing import coalesced
+from app.nearby import (
+  NEARBY_DEFAULT_LIMIT, NEARBY_DEFAULT_RADIUS, NEARBY_MAX_LIMIT, NEARBY_MAX_RADIUS,
+  find_nearby_users, latest_position
+)
+from app.pagination import PaginationError, paginate, page_response
+from app.serializers import USER_COLUMNS, nearby_user_dict, updated_user_dict, user_dict
 
 users_bp = Blueprint('users', __name__)
 
 # GET /api/v1/users/<user_id>
 # ユーザー情報を取得
 @users_bp.route('/<int:user_id>', methods=['GET'])
+@cached(lambda user_id: user_tag(user_id))
 def get_user(user_id):
-  # user_id を使ってデータベースからユーザーを1人探す
-  # もし見つからなければ自動で404エラーを返す
-  user = User.query.get_or_404(user_id)
+  # user_id を使ってデータベースからユーザーを1人探す（必要なカラムだけ取得）
+  # もし見つからなければ404エラーを返す
+  user = User.query.with_entities(*USER_COLUMNS).filter_by(user_id=user_id).first()
+  if user is None:
+    abort(404)
   
   # ユーザー情報をJSON形式で返す
-  return jsonify({
-      'user_id': user.user_id,
-      'user_name': user.user_name,
-      'bio': user.bio,
-      'X': user.X,
-      'photo_url': user.photo_url
-  })
+  return jsonify(user_dict(user))
 
 # PUT /api/v1/users/<user_id>
 # ユーザー情報の更新
@@ -46,63 +51,49 @@ def update_user(user_id):
 
   return jsonify({
     'message' : 'User information updated successfully',
-    'user_ID' : user.user_id,
-    'user_name' : user.user_name,
-    'bio' : user.bio,
-    'X' : user.X,
-    'photo_url' : user.photo_url
+    **updated_user_dict(user)
   })
 
-# GET /api/v1/users/nearby/<user_id>
-#　近くのユーザーのIDと位置情報を取得
+# GET /api/v1/users/nearby/<user_id>?radius=1000&limit=50
+#　近くのユーザーのIDと位置情報を取得（ユーザーごとに最新の位置を距離順で返す）
 @users_bp.route('/nearby/<int:user_id>', methods=['GET'])
+@coalesced
 def get_nearby_users(user_id):
 
-  #IDからWaterRecordを取得
-  record = WaterRecord.query.filter_by(user_id=user_id).order_by(WaterRecord.water_date.desc()).first()
+  # 検索半径(m)と最大件数
+  radius = request.args.get('radius', NEARBY_DEFAULT_RADIUS, type=float)
+  limit = request.args.get('limit', NEARBY_DEFAULT_LIMIT, type=int)
+  if radius <= 0 or radius > NEARBY_MAX_RADIUS:
+    return jsonify({'error': f'radius must be between 0 and {NEARBY_MAX_RADIUS}'}), 400
+  if limit <= 0 or limit > NEARBY_MAX_LIMIT:
+    return jsonify({'error': f'limit must be between 1 and {NEARBY_MAX_LIMIT}'}), 400
+
+  #IDから最新の位置を取得
+  record = latest_position(user_id)
 
   if not record:
     return jsonify({'message': 'No water record found for this user', 'user_id': user_id}), 404
-  
-  # WaterRecordから緯度経度を取得
-  lat = record.lat
-  lon = record.lon
-
-  # 近くの記録を検索
-  nearby_records = WaterRecord.query.filter(
-      WaterRecord.lat.between(lat - 0.01, lat + 0.01),
-      WaterRecord.lon.between(lon - 0.01, lon + 0.01),
-      WaterRecord.user_id != user_id
-  ).distinct(WaterRecord.user_id, WaterRecord.water_id).all()
-
-  if not nearby_records:
+
+  # 近くのユーザーを距離順に検索
+  users = find_nearby_users(record.lat, record.lon, radius, limit, exclude_user_id=user_id)
+
+  if not users:
     return jsonify({'message': 'No nearby water records found', 'user_id': user_id}), 404
   
   # ユーザー情報をJSON形式で返す
-  records = []
-  for info in nearby_records:
-    info_data = {
-      'user_id': info.user_id,
-      'lat': info.lat,
-      'lon': info.lon
-    }
-    records.append(info_data)
-
-  return jsonify(records)
+  return jsonify([nearby_user_dict(distance, info) for distance, info in users])
 
+# GET /api/v1/users?limit=50&cursor=<next_cursor>
+# ユーザー一覧を取得（user_id順、キーセットページネーション）
 @users_bp.route('/', methods=['GET'])
+@coalesced
 def get_all_users():
-    users = User.query.all()
+    try:
+        users, limit, next_cursor = paginate(User.query.with_entities(*USER_COLUMNS), [User.user_id])
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     if not users:
         return jsonify({'message': 'No users found'}), 404
 
-    users_list = []
-    for user in users:
-        users_list.append({
-            'user_id': user.user_id,
-            'user_name': user.user_name,
-            'bio': user.bio,
-            'X': user.X,
-            'photo_url': user.photo_url
-        })
-    return jsonify(users_list)
+    users_list = [user_dict(user) for user in users]
+    return jsonify(page_response(users_list, limit, next_cursor))
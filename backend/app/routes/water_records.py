@@ -1,76 +1,154 @@
-from datetime import datetime, date
-from flask import Blueprint, jsonify, request
-from app.models import WaterRecord, User
+from datetime import datetime, date, time, timedelta
+from types import SimpleNamespace
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from app.models import DailyWaterTotal, WaterRecord, User
 from app import db
+from app.cache import cached, water_records_tag
+from app.coalescing import coalesced
+from app.daily_totals import add_to_daily_total
+from app.nearby import latest_date_subquery, refresh_latest_position, update_latest_position
+from app.pagination import PaginationError, paginate, page_response
+from app.serializers import WATER_RECORD_COLUMNS, daily_total_dict, dumps, parse_datetime, water_record_dict
+from app.stats import STATS_BUCKETS, bucket_start, water_stats
+from app.write_buffer import WriteBufferError, get_write_buffer, insert_water_records
 
 water_records_bp = Blueprint('water_records', __name__)
 
-# GET /api/v1/water_records/<user_id>
-# ユーザーの水分補給記録一覧を取得
+# エクスポート時にサーバーサイドカーソルから一度に取り出す行数
+EXPORT_BATCH_SIZE = 1000
+
+# 一括登録で1リクエストに含められる記録数の上限
+BATCH_MAX_RECORDS = 100
+
+# 確定したバケットだけの集計をクライアントがキャッシュしてよい秒数
+# （オフライン記録の同期で過去のバケットが変わることもあるので、期限後はETagで再検証する）
+STATS_CLOSED_MAX_AGE = 3600
+
+# GET /api/v1/water_records/<user_id>?limit=50&cursor=<next_cursor>
+# ユーザーの水分補給記録一覧を取得（新しい順、キーセットページネーション）
 @water_records_bp.route('/<int:user_id>', methods=['GET'])
+@cached(lambda user_id: water_records_tag(user_id))
 def get_water_records(user_id):
-    water_records = WaterRecord.query.filter_by(user_id=user_id).order_by(WaterRecord.water_date.desc()).all()
-    
-    records = []
-    for record in water_records:
-        records.append({
-            'water_id': record.water_id,
-            'water_date': record.water_date.isoformat(),
-            'water_type': record.water_type,
-            'water_amount': record.water_amount,
-            'lat': record.lat,
-            'lon': record.lon,
-            'comment': record.comment,
-            'user_id': record.user_id
-        })
-    
-    return jsonify(records)
+    try:
+        water_records, limit, next_cursor = paginate(
+            WaterRecord.query.with_entities(*WATER_RECORD_COLUMNS).filter_by(user_id=user_id),
+            [WaterRecord.water_date, WaterRecord.water_id],
+            descending=True
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    records = [water_record_dict(record) for record in water_records]
+    return jsonify(page_response(records, limit, next_cursor))
 
 # GET /api/v1/water_records/today/<user_id>
 # 指定されたuser_idのユーザーの今日の水分補給量の取得
 @water_records_bp.route('/today/<int:user_id>', methods=['GET'])
+@cached(lambda user_id: water_records_tag(user_id))
 def get_today_water_records(user_id):
-    today = date.today()
-    water_records = WaterRecord.query.filter(
+    # date()で絞り込むとインデックスが使えないので日時の範囲で検索する
+    start = datetime.combine(date.today(), time.min)
+    water_records = WaterRecord.query.with_entities(*WATER_RECORD_COLUMNS).filter(
         WaterRecord.user_id == user_id,
-        db.func.date(WaterRecord.water_date) == today
+        WaterRecord.water_date >= start,
+        WaterRecord.water_date < start + timedelta(days=1)
     ).all()
-    
-    records = []
-    for record in water_records:
-        record_data = {
-            'water_id': record.water_id,
-            'water_date': record.water_date.isoformat(),
-            'water_type': record.water_type,
-            'water_amount': record.water_amount,
-            'lat': record.lat,
-            'lon': record.lon,
-            'comment': record.comment,
-            'user_id': record.user_id
-        }
-        records.append(record_data)
-    
-    return jsonify(records)
+
+    return jsonify([water_record_dict(record) for record in water_records])
+
+# GET /api/v1/water_records/today/total/<user_id>
+# 指定されたuser_idのユーザーの今日の水分補給量の合計を取得（日ごとの集計から1行を参照）
+@water_records_bp.route('/today/total/<int:user_id>', methods=['GET'])
+@coalesced
+def get_today_water_total(user_id):
+    today = date.today()
+    total = db.session.get(DailyWaterTotal, (user_id, today))
+
+    return jsonify({
+        'user_id': user_id,
+        'day': today.isoformat(),
+        'total_amount': total.total_amount if total else 0,
+        'record_count': total.record_count if total else 0
+    })
+
+# GET /api/v1/water_records/totals/<user_id>?from=2025-08-01&to=2025-08-31
+# 指定されたuser_idのユーザーの日ごとの水分補給量の合計を取得（from, to を含む）
+@water_records_bp.route('/totals/<int:user_id>', methods=['GET'])
+@coalesced
+def get_water_totals(user_id):
+    try:
+        start = date.fromisoformat(request.args['from'])
+        end = date.fromisoformat(request.args.get('to', date.today().isoformat()))
+    except KeyError:
+        return jsonify({'error': 'Missing required parameter: from'}), 400
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO 8601 dates'}), 400
+
+    totals = db.session.execute(
+        db.select(DailyWaterTotal.day, DailyWaterTotal.total_amount, DailyWaterTotal.record_count)
+        .where(
+            DailyWaterTotal.user_id == user_id,
+            DailyWaterTotal.day.between(start, end),
+            DailyWaterTotal.record_count > 0
+        )
+        .order_by(DailyWaterTotal.day)
+    ).all()
+
+    return jsonify([daily_total_dict(total) for total in totals])
+
+def _parse_stats_args():
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in STATS_BUCKETS:
+        raise ValueError(f'bucket must be one of: {", ".join(STATS_BUCKETS)}')
+    if not request.args.get('from'):
+        raise ValueError('Missing required parameter: from')
+    try:
+        start = parse_datetime(request.args['from'])
+        end = parse_datetime(request.args['to']) if request.args.get('to') else datetime.now()
+    except ValueError:
+        raise ValueError('from/to must be ISO 8601 dates')
+    return bucket, start, end
+
+@cached(lambda user_id: water_records_tag(user_id))
+def _get_water_stats(user_id):
+    bucket, start, end = _parse_stats_args()
+    return jsonify({
+        'user_id': user_id,
+        'bucket': bucket,
+        'series': water_stats(user_id, bucket, start, end)
+    })
+
+# GET /api/v1/water_records/stats/<user_id>?bucket=week&from=2025-01-01&to=2026-01-01
+# 指定されたuser_idのユーザーの水分補給量をバケット（hour/day/week/month）ごとに集計して取得
+# from はバケットの開始に切り下げて含む、to は含まない（省略時は現在時刻）。飲み物の種類ごとの内訳も返す
+@water_records_bp.route('/stats/<int:user_id>', methods=['GET'])
+def get_water_stats(user_id):
+    try:
+        bucket, start, end = _parse_stats_args()
+        response = current_app.make_response(_get_water_stats(user_id=user_id))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 過去の確定したバケットだけの範囲ならクライアント側でもキャッシュさせる
+    if response.status_code == 200 and end <= bucket_start(bucket, datetime.now()):
+        response.cache_control.private = True
+        response.cache_control.max_age = STATS_CLOSED_MAX_AGE
+    return response
 
 # GET /api/v1/water_records/now/<user_id>
 # 指定されたuser_idのユーザーの最新の水分補給量の取得
 @water_records_bp.route('/now/<int:user_id>', methods=['GET'])
+@cached(lambda user_id: water_records_tag(user_id))
 def get_now_water_records(user_id):
-    latest_record = WaterRecord.query.filter_by(user_id=user_id).order_by(WaterRecord.water_date.desc()).first()
+    latest_record = WaterRecord.query.with_entities(*WATER_RECORD_COLUMNS).filter(
+        WaterRecord.user_id == user_id,
+        WaterRecord.water_date >= latest_date_subquery(user_id)
+    ).order_by(WaterRecord.water_date.desc()).first()
     
     if not latest_record:
         return jsonify({'message': 'No water records found', 'user_id': user_id}), 404
     
-    return jsonify({
-        'water_id': latest_record.water_id,
-        'water_date': latest_record.water_date.isoformat(),
-        'water_type': latest_record.water_type,
-        'water_amount': latest_record.water_amount,
-        'lat': latest_record.lat,
-        'lon': latest_record.lon,
-        'comment': latest_record.comment,
-        'user_id': latest_record.user_id
-    })
+    return jsonify(water_record_dict(latest_record))
 
 # POST /api/v1/water_records/<user_id>
 # 新規水分補給記録の作成
@@ -88,7 +166,23 @@ def create_water_record(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
-    
+
+    # WRITE_BUFFER_ENABLED の場合は他のリクエストの記録とまとめてコミットし、コミット後に応答する
+    write_buffer = get_write_buffer()
+    if write_buffer is not None:
+        row, error = _parse_batch_record(user_id, {**data, 'water_date': None})
+        if error:
+            return jsonify({'error': error}), 400
+        # 待っている間に接続（読み取りのトランザクション）を持ち続けないよう返しておく
+        db.session.close()
+        try:
+            water_id = write_buffer.submit(row, current_app.config['WRITE_BUFFER_TIMEOUT'])
+        except WriteBufferError as e:
+            return jsonify({'error': str(e)}), 500
+        # 書き込みは別のセッションで行われるので、しばらくプライマリから読むCookieを付けるために記録する
+        db.session.info['wrote'] = True
+        return jsonify(water_record_dict(SimpleNamespace(water_id=water_id, **row))), 201
+
     # 新しい水分記録を作成
     new_record = WaterRecord(
         user_id=user_id,
@@ -102,23 +196,112 @@ def create_water_record(user_id):
     
     try:
         db.session.add(new_record)
+        # 日ごとの集計とユーザーの最新の位置も同じトランザクションで更新
+        add_to_daily_total(user_id, new_record.water_date, new_record.water_amount)
+        update_latest_position(user_id, new_record.water_date, new_record.lat, new_record.lon)
         db.session.commit()
         
-        return jsonify({
-            'water_id': new_record.water_id,
-            'water_date': new_record.water_date.isoformat(),
-            'water_type': new_record.water_type,
-            'water_amount': new_record.water_amount,
-            'lat': new_record.lat,
-            'lon': new_record.lon,
-            'comment': new_record.comment,
-            'user_id': new_record.user_id
-        }), 201
+        return jsonify(water_record_dict(new_record)), 201
     
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create water record'}), 500
 
+# 一括登録用に1件分の入力を検証し、INSERTする値を返す
+def _parse_batch_record(user_id, item):
+    if not isinstance(item, dict):
+        return None, 'Record must be an object'
+
+    for field in ['water_amount', 'lat', 'lon']:
+        if field not in item:
+            return None, f'Missing required field: {field}'
+
+    water_amount = item['water_amount']
+    lat = item['lat']
+    lon = item['lon']
+    if not isinstance(water_amount, int) or isinstance(water_amount, bool):
+        return None, 'water_amount must be an integer'
+    if not isinstance(lat, (int, float)) or not -90 <= lat <= 90:
+        return None, 'lat must be a number between -90 and 90'
+    if not isinstance(lon, (int, float)) or not -180 <= lon <= 180:
+        return None, 'lon must be a number between -180 and 180'
+
+    # オフラインで記録した時刻を保持する（省略時は現在時刻）
+    water_date = datetime.now()
+    if item.get('water_date') is not None:
+        try:
+            water_date = parse_datetime(item['water_date'])
+        except (TypeError, ValueError):
+            return None, 'water_date must be an ISO 8601 datetime'
+
+    return {
+        'user_id': user_id,
+        'water_amount': water_amount,
+        'lat': lat,
+        'lon': lon,
+        'water_type': item.get('water_type'),
+        'comment': item.get('comment'),
+        'water_date': water_date
+    }, None
+
+# POST /api/v1/water_records/<user_id>/batch
+# 水分補給記録の一括登録（オフライン時の記録の同期用）
+# 送信するデータの例：{ "records": [{ "water_amount": 200, "lat": 35.6, "lon": 139.6, "water_date": "2025-08-20T08:00:00" }, ...] }
+# 正しい記録だけを1トランザクション・1回の複数行INSERTで登録し、記録ごとの結果を返す
+@water_records_bp.route('/<int:user_id>/batch', methods=['POST'])
+def create_water_records_batch(user_id):
+    data = request.get_json(silent=True)
+    items = data.get('records') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'records must be a non-empty array'}), 400
+    if len(items) > BATCH_MAX_RECORDS:
+        return jsonify({'error': f'At most {BATCH_MAX_RECORDS} records can be sent at once'}), 400
+
+    # ユーザーの存在確認
+    if not db.session.query(User.user_id).filter_by(user_id=user_id).first():
+        return jsonify({'error': 'User not found'}), 404
+
+    results = [None] * len(items)
+    rows = []
+    indexes = []
+    for index, item in enumerate(items):
+        row, error = _parse_batch_record(user_id, item)
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+        else:
+            rows.append(row)
+            indexes.append(index)
+
+    if rows:
+        try:
+            # 1回の複数行INSERTで登録し、日ごとの集計も同じトランザクションで更新
+            water_ids = insert_water_records(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': 'Failed to create water records'}), 500
+
+        for index, row, water_id in zip(indexes, rows, water_ids):
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'water_id': water_id,
+                'water_date': row['water_date'].isoformat()
+            }
+
+    if not rows:
+        status = 400
+    elif len(rows) < len(items):
+        status = 207
+    else:
+        status = 201
+    return jsonify({
+        'user_id': user_id,
+        'created': len(rows),
+        'failed': len(items) - len(rows),
+        'results': results
+    }), status
+
 # PUT /api/v1/water_records/<water_id>
 #　水分補給記録の更新
 @water_records_bp.route('/<int:water_id>', methods=['PUT'])
@@ -136,9 +319,21 @@ def update_water_record(water_id):
 
     data = request.get_json()
 
+    water_date = record.water_date
+    if 'water_date' in data:
+        try:
+            water_date = parse_datetime(data['water_date'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'water_date must be an ISO 8601 datetime'}), 400
+
+    # 集計から差し引くために更新前の値を保持
+    old_user_id = record.user_id
+    old_water_date = record.water_date
+    old_water_amount = record.water_amount
+
     # 値があれば更新（なければ元の値を保持）
     record.water_id = data.get('water_id', record.water_id)
-    record.water_date = data.get('water_date', record.water_date)
+    record.water_date = water_date
     record.water_type = data.get('water_type', record.water_type)
     record.water_amount = data.get('water_amount', record.water_amount)
     record.lat = data.get('lat', record.lat)
@@ -146,38 +341,66 @@ def update_water_record(water_id):
     record.comment = data.get('comment', record.comment)
     record.user_id = data.get('user_id', record.user_id)
 
-    db.session.commit()
+    try:
+        # 日ごとの集計を更新（日付やユーザーが変わった場合は移し替える）
+        add_to_daily_total(old_user_id, old_water_date, -(old_water_amount or 0), -1)
+        add_to_daily_total(record.user_id, record.water_date, record.water_amount)
+        # 最新の位置も求め直す（ユーザーが変わった場合は両方）
+        for location_user_id in {old_user_id, record.user_id}:
+            refresh_latest_position(location_user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update water record'}), 500
 
     return jsonify({
         'message' : 'Water record updated successfully',
-        'water_id': record.water_id,
-        'water_date': record.water_date.isoformat() if record.water_date else None,
-        'water_type': record.water_type,
-        'water_amount': record.water_amount,
-        'lat': record.lat,
-        'lon': record.lon,
-        'comment': record.comment,
-        'user_id': record.user_id
+        **water_record_dict(record)
     })
 
-# GET /api/v1/water_records
+# GET /api/v1/water_records?limit=50&cursor=<next_cursor>
+# 全ユーザーの水分補給記録一覧を取得（新しい順、キーセットページネーション）
 @water_records_bp.route('/', methods=['GET'])
+@coalesced
 def get_all_water_records():
 
-    records = WaterRecord.query.all()
+    try:
+        records, limit, next_cursor = paginate(
+            WaterRecord.query.with_entities(*WATER_RECORD_COLUMNS),
+            [WaterRecord.water_date, WaterRecord.water_id],
+            descending=True
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     if not records:
         return jsonify({'message': 'No water records found'}), 404
-    
-    records_list = []
-    for record in records:
-        records_list.append({
-            'water_id': record.water_id,
-            'water_date': record.water_date.isoformat(),
-            'water_type': record.water_type,
-            'water_amount': record.water_amount,
-            'lat': record.lat,
-            'lon': record.lon,
-            'comment': record.comment,
-            'user_id': record.user_id
-        })
-    return jsonify(records_list)
+
+    records_list = [water_record_dict(record) for record in records]
+    return jsonify(page_response(records_list, limit, next_cursor))
+
+# GET /api/v1/water_records/export?user_id=1&from=2025-08-01&to=2025-09-01
+# 水分補給記録をNDJSON（1行1レコード）でストリーミング出力
+# from は含む、to は含まない。いずれも省略可能
+@water_records_bp.route('/export', methods=['GET'])
+def export_water_records():
+    query = db.select(*WATER_RECORD_COLUMNS).order_by(WaterRecord.water_id)
+
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        query = query.where(WaterRecord.user_id == user_id)
+
+    try:
+        if request.args.get('from'):
+            query = query.where(WaterRecord.water_date >= parse_datetime(request.args['from']))
+        if request.args.get('to'):
+            query = query.where(WaterRecord.water_date < parse_datetime(request.args['to']))
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO 8601 dates'}), 400
+
+    def generate():
+        # yield_per でサーバーサイドカーソルを使い、全件をメモリに載せない
+        result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for row in result:
+            yield dumps(water_record_dict(row)) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
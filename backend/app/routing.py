@@ -0,0 +1,60 @@
+import time
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+# SQLALCHEMY_BINDS に設定するレプリカのバインド名
+REPLICA_BIND = 'replica'
+
+# GETをレプリカに振り分けるBlueprint
+REPLICA_BLUEPRINTS = {'users', 'water_records', 'stamps', 'home', 'leaderboard'}
+
+# 書き込み直後の読み取りをプライマリに向ける期限（UNIX時刻）を持つCookie
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+
+
+# 読み取りをレプリカ、書き込みをプライマリに振り分けるセッション
+# 同じセッション（リクエスト）で書き込んだ後の読み取りと、書き込みから
+# REPLICA_STICKY_SECONDS 秒以内の同じクライアントからの読み取りはプライマリに送る
+# session.info['primary'] を設定すると、そのセッションの読み取りはすべてプライマリに送る
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            elif self._use_replica():
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self):
+        if self.info.get('wrote') or self.info.get('primary') or REPLICA_BIND not in self._db.engines:
+            return False
+        if not has_request_context():
+            return False
+        if request.method != 'GET' or request.blueprint not in REPLICA_BLUEPRINTS:
+            return False
+        return not in_primary_window()
+
+
+# 書き込みから REPLICA_STICKY_SECONDS 秒以内のクライアントからのリクエストか
+def in_primary_window():
+    try:
+        primary_until = float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+    except ValueError:
+        primary_until = 0
+    return primary_until >= time.time()
+
+
+def init_routing(app):
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+    app.after_request(_mark_primary_window)
+
+
+# 書き込んだリクエストのレスポンスに、しばらくプライマリから読むためのCookieを付ける
+def _mark_primary_window(response):
+    from app import db
+    if request.method != 'GET' and db.session.info.get('wrote'):
+        seconds = current_app.config['REPLICA_STICKY_SECONDS']
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+    return response
@@ -0,0 +1,174 @@
+import json
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from app.models import Stamp, User, WaterRecord
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# レスポンスに必要なカラムだけを取得するための射影
+# query.with_entities(*WATER_RECORD_COLUMNS) や db.select(*WATER_RECORD_COLUMNS) で使い、
+# ORMオブジェクトを生成せずにタプル（Row）として受け取る
+WATER_RECORD_COLUMNS = (
+    WaterRecord.water_id,
+    WaterRecord.water_date,
+    WaterRecord.water_type,
+    WaterRecord.water_amount,
+    WaterRecord.lat,
+    WaterRecord.lon,
+    WaterRecord.comment,
+    WaterRecord.user_id,
+)
+
+USER_COLUMNS = (
+    User.user_id,
+    User.user_name,
+    User.bio,
+    User.X,
+    User.photo_url,
+)
+
+STAMP_COLUMNS = (
+    Stamp.stamp_id,
+    Stamp.message,
+    Stamp.image_url,
+)
+
+
+# 以下はRowでもORMオブジェクトでも同じように変換できる
+# ISO 8601 の日時を解析する
+# タイムゾーン付きの場合は保存している形式（サーバーのローカル時刻、タイムゾーンなし）に変換する
+def parse_datetime(value):
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def water_record_dict(record):
+    return {
+        'water_id': record.water_id,
+        'water_date': record.water_date.isoformat(),
+        'water_type': record.water_type,
+        'water_amount': record.water_amount,
+        'lat': record.lat,
+        'lon': record.lon,
+        'comment': record.comment,
+        'user_id': record.user_id
+    }
+
+
+def user_dict(user):
+    return {
+        'user_id': user.user_id,
+        'user_name': user.user_name,
+        'bio': user.bio,
+        'X': user.X,
+        'photo_url': user.photo_url
+    }
+
+
+def stamp_dict(stamp):
+    return {
+        'stamp_id': stamp.stamp_id,
+        'message': stamp.message,
+        'image_url': stamp.image_url
+    }
+
+
+def user_stamp_dict(user_stamp):
+    return {
+        'user_stamp_id': user_stamp.user_stamp_id,
+        'sender_id': user_stamp.sender_id,
+        'receiver_id': user_stamp.receiver_id,
+        'stamp_id': user_stamp.stamp_id,
+        'after_stamp': bool(user_stamp.after_stamp),
+        'created_at': user_stamp.created_at.isoformat(),
+        'updated_at': user_stamp.updated_at.isoformat()
+    }
+
+
+# 受信したスタンプの一覧の1件（スタンプ・送信者の情報を結合した行）を変換する
+def received_stamp_dict(row):
+    return {
+        'user_stamp_id': row.user_stamp_id,
+        'sender_id': row.sender_id,
+        'receiver_id': row.receiver_id,
+        'stamp_id': row.stamp_id,
+        'stamp_message': row.stamp_message,
+        'stamp_image_url': row.stamp_image_url,
+        'after_stamp': row.after_stamp,
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat(),
+        'sender_name': row.sender_name
+    }
+
+
+# ユーザー情報の更新のレスポンス（IDのキーは既存のクライアントに合わせて user_ID）
+def updated_user_dict(user):
+    return {
+        'user_ID': user.user_id,
+        'user_name': user.user_name,
+        'bio': user.bio,
+        'X': user.X,
+        'photo_url': user.photo_url
+    }
+
+
+# 日ごとの集計の1行を変換する
+def daily_total_dict(total):
+    return {
+        'day': total.day.isoformat(),
+        'total_amount': total.total_amount,
+        'record_count': total.record_count
+    }
+
+
+# find_nearby_users の (距離, 記録) を変換する
+def nearby_user_dict(distance, info):
+    return {
+        'user_id': info.user_id,
+        'lat': info.lat,
+        'lon': info.lon,
+        'distance': round(distance, 1)
+    }
+
+
+# JSONをUTF-8のバイト列にエンコードする（orjson があれば使う）
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default)
+    return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+# jsonify / request.get_json で使うJSONプロバイダー
+# orjson があればエンコード・デコードを任せ、文字列を経由せずにバイト列のままレスポンスにする
+# キーのソートとASCIIエスケープは行わない（大きな一覧レスポンスでのコストを避ける）
+class FastJSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_serializers(app):
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import WaterRecord
+
+# 集計の単位（PostgreSQLの date_trunc と同じ名前。週は月曜始まり）
+STATS_BUCKETS = ('hour', 'day', 'week', 'month')
+
+# 1回の集計で返すバケット数の上限
+STATS_MAX_BUCKETS = 1000
+
+# SQLiteでバケットの開始日時を求める式
+_SQLITE_BUCKETS = {
+    'hour': lambda column: db.func.strftime('%Y-%m-%d %H:00:00', column),
+    'day': lambda column: db.func.date(column),
+    'week': lambda column: db.func.date(column, 'weekday 0', '-6 days'),
+    'month': lambda column: db.func.strftime('%Y-%m-01', column),
+}
+
+
+# dt を含むバケットの開始日時
+def bucket_start(bucket, dt):
+    if bucket == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(bucket, start):
+    if bucket == 'hour':
+        return start + timedelta(hours=1)
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(weeks=1)
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def _bucket_expr(bucket, column):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return db.func.date_trunc(bucket, column)
+    if dialect == 'sqlite':
+        return _SQLITE_BUCKETS[bucket](column)
+    raise RuntimeError(f'Unsupported database for stats: {dialect}')
+
+
+# [start, end) の範囲をバケットごとに集計する（記録のないバケットも0で返す）
+# GROUP BY はデータベースで行い、受け取るのはバケット×飲み物の種類ごとの1行だけ
+def water_stats(user_id, bucket, start, end):
+    buckets = []
+    current = bucket_start(bucket, start)
+    while current < end:
+        buckets.append(current)
+        if len(buckets) > STATS_MAX_BUCKETS:
+            raise ValueError(f'Range must contain at most {STATS_MAX_BUCKETS} {bucket} buckets')
+        current = next_bucket(bucket, current)
+    if not buckets:
+        return []
+
+    bucket_column = _bucket_expr(bucket, WaterRecord.water_date).label('bucket')
+    rows = db.session.execute(
+        db.select(
+            bucket_column,
+            WaterRecord.water_type,
+            db.func.coalesce(db.func.sum(WaterRecord.water_amount), 0).label('total_amount'),
+            db.func.count(WaterRecord.water_id).label('record_count')
+        ).where(
+            WaterRecord.user_id == user_id,
+            WaterRecord.water_date >= buckets[0],
+            WaterRecord.water_date < end
+        ).group_by(bucket_column, WaterRecord.water_type)
+    ).all()
+
+    series = {
+        bucket_at: {'start': bucket_at.isoformat(), 'total_amount': 0, 'record_count': 0, 'by_type': []}
+        for bucket_at in buckets
+    }
+    for row in rows:
+        # SQLiteでは文字列で返ってくる
+        key = datetime.fromisoformat(row.bucket) if isinstance(row.bucket, str) else row.bucket
+        item = series.get(key)
+        if item is None:
+            continue
+        item['total_amount'] += row.total_amount
+        item['record_count'] += row.record_count
+        item['by_type'].append({
+            'water_type': row.water_type,
+            'total_amount': row.total_amount,
+            'record_count': row.record_count
+        })
+
+    for item in series.values():
+        item['by_type'].sort(key=lambda t: t['total_amount'], reverse=True)
+    return list(series.values())
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from app import db
+from app.cache import invalidate, water_records_tag
+from app.daily_totals import add_to_daily_total
+from app.models import WaterRecord
+from app.nearby import update_latest_position
+
+logger = logging.getLogger(__name__)
+
+
+# 検証済みの水分記録（INSERTする値の辞書）をまとめて登録し、入力の順に採番されたIDを返す
+# 日ごとの集計・ユーザーの最新の位置の更新とキャッシュの無効化も同じトランザクションで行い、コミットは呼び出し側で行う
+def insert_water_records(rows):
+    # 複数行INSERT（RETURNINGで採番されたIDを受け取る）
+    # RETURNINGの行の順序はDBによって保証されないので、入力の順に並べて返させる
+    water_ids = db.session.scalars(
+        db.insert(WaterRecord).returning(WaterRecord.water_id, sort_by_parameter_order=True),
+        rows
+    ).all()
+
+    daily = {}
+    for row in rows:
+        key = (row['user_id'], row['water_date'].date())
+        amount, count = daily.get(key, (0, 0))
+        daily[key] = (amount + (row['water_amount'] or 0), count + 1)
+    for (user_id, day), (amount, count) in daily.items():
+        add_to_daily_total(user_id, day, amount, count)
+
+    # ユーザーごとに最も新しい記録で最新の位置を更新
+    latest = {}
+    for row in rows:
+        if row['user_id'] not in latest or latest[row['user_id']]['water_date'] <= row['water_date']:
+            latest[row['user_id']] = row
+    for row in latest.values():
+        update_latest_position(row['user_id'], row['water_date'], row['lat'], row['lon'])
+
+    invalidate(db.session, *{water_records_tag(row['user_id']) for row in rows})
+    return water_ids
+
+
+class WriteBufferError(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ('row', 'done', 'water_id', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.water_id = None
+        self.error = None
+
+
+# 水分記録のINSERTをワーカー内でまとめてコミットする（グループコミット）
+# リクエストのスレッドは記録をキューに入れ、コミットされるまで待つ
+# 書き込み用のスレッドは最初の記録から max_delay 秒たつか max_rows 件たまると1トランザクションで登録する
+# コミット中に来た記録は次のバッチにたまるので、負荷が高いほどバッチが大きくなる
+class WriteBuffer:
+
+    def __init__(self, app, max_rows=100, max_delay=0.005):
+        self.app = app
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._queue = []
+        self._pid = None
+
+    # 記録を登録し、コミットされたら採番されたIDを返す
+    def submit(self, row, timeout):
+        pending = _Pending(row)
+        with self._condition:
+            self._ensure_thread()
+            self._queue.append(pending)
+            self._condition.notify()
+        if not pending.done.wait(timeout):
+            # 書き込み中の可能性があるので結果は不明として扱う
+            raise WriteBufferError('Timed out waiting for the write to be committed')
+        if pending.error is not None:
+            raise pending.error
+        return pending.water_id
+
+    # ワーカーのプロセスごとに書き込み用のスレッドを1つ起動する（fork後は作り直す）
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue = []
+            threading.Thread(target=self._run, name='water-record-writer', daemon=True).start()
+
+    def _take(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._queue) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.max_rows]
+            del self._queue[:self.max_rows]
+            return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._take()
+                try:
+                    with self.app.app_context():
+                        try:
+                            self._flush(batch)
+                        finally:
+                            db.session.remove()
+                except Exception:
+                    logger.exception('water record writer failed')
+                finally:
+                    # 結果が決まらなかった記録は失敗として返す（スレッドは次のバッチを続ける）
+                    for pending in batch:
+                        if pending.water_id is None and pending.error is None:
+                            pending.error = WriteBufferError('Failed to create water record')
+                        pending.done.set()
+        finally:
+            # それでもスレッドが終了した場合は、次の submit で起動し直す
+            with self._condition:
+                self._pid = None
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            water_ids = insert_water_records([pending.row for pending in batch])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if len(batch) == 1:
+                logger.exception('failed to insert buffered water record')
+                batch[0].error = WriteBufferError('Failed to create water record')
+                return
+            # 1件の不正な記録でバッチ全体が失敗しないよう、1件ずつ登録し直す
+            logger.warning('buffered batch of %d water records failed, retrying one by one', len(batch))
+            for pending in batch:
+                self._flush([pending])
+            return
+
+        for pending, water_id in zip(batch, water_ids):
+            pending.water_id = water_id
+        metrics = current_app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.write_batch_rows.observe((), len(batch))
+            metrics.write_batch_duration.observe((), time.perf_counter() - start)
+
+
+def init_write_buffer(app):
+    app.config.setdefault('WRITE_BUFFER_ENABLED', False)
+    app.config.setdefault('WRITE_BUFFER_MAX_ROWS', 100)
+    app.config.setdefault('WRITE_BUFFER_MAX_DELAY_MS', 5)
+    app.config.setdefault('WRITE_BUFFER_TIMEOUT', 10)
+    if app.config['WRITE_BUFFER_ENABLED']:
+        app.extensions['write_buffer'] = WriteBuffer(
+            app, app.config['WRITE_BUFFER_MAX_ROWS'], app.config['WRITE_BUFFER_MAX_DELAY_MS'] / 1000
+        )
+    else:
+        app.extensions['write_buffer'] = None
+
+
+def get_write_buffer():
+    return current_app.extensions.get('write_buffer')
@@ -6,6 +6,56 @@ load_dotenv()
 class Config:
   SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
   SQLALCHEMY_TRACK_MODIFICATIONS = False
+  # 読み取り用レプリカ（設定した場合、GETのクエリをレプリカに振り分ける）
+  REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+  SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+  # 書き込みからこの秒数の間は、同じクライアントの読み取りもプライマリに送る
+  REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+  # 1リクエスト内で同じ形のSQLがこの回数以上実行されたらN+1として警告する
+  QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 3))
+  # この時間(ms)を超えたSQLをログに出す（SAMPLE_RATEの割合だけ。PostgreSQLでは文の形ごとに1回EXPLAINも出す）
+  SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+  SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 1.0))
+  SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+  # 読み取りキャッシュ（local: ワーカー内LRU / redis: CACHE_URLのRedisを共有 / none: 無効）
+  # local の無効化は書き込んだワーカーにしか効かないので、複数ワーカーでは redis を使う（CACHE_URLを設定すると redis になる）
+  CACHE_URL = os.environ.get('CACHE_URL')
+  CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if CACHE_URL else 'local')
+  CACHE_TTL = int(os.environ.get('CACHE_TTL', 60))
+  CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+  # 同じエンドポイント・同じ引数の同時GETを1回の計算にまとめる（待つ最大秒数を超えたら自分で計算する）
+  COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'true').lower() == 'true'
+  COALESCE_TIMEOUT = float(os.environ.get('COALESCE_TIMEOUT', 10))
+  # スタンプ通知の配信（local: ワーカー内 / redis: PUBSUB_URLのRedisで複数ワーカーに配信）
+  PUBSUB_BACKEND = os.environ.get('PUBSUB_BACKEND', 'local')
+  PUBSUB_URL = os.environ.get('PUBSUB_URL', os.environ.get('CACHE_URL'))
+  PUBSUB_BUFFER_SIZE = int(os.environ.get('PUBSUB_BUFFER_SIZE', 100))
+  # 最後のイベントからこの秒数たったユーザーのイベントは捨てる（それより長く間が空いたクライアントは受信一覧を取得し直す）
+  PUBSUB_EVENT_TTL = int(os.environ.get('PUBSUB_EVENT_TTL', 600))
+  # ロングポーリングで同時に待つリクエスト数の上限（ワーカーごと）。超えた分は待たずに返し、RETRY_AFTER秒後に再接続させる
+  # 待っている間はワーカーのスレッドを1つ使うので、スレッド数より小さくすること
+  POLL_MAX_WAITERS = int(os.environ.get('POLL_MAX_WAITERS', 8))
+  POLL_RETRY_AFTER = int(os.environ.get('POLL_RETRY_AFTER', 5))
+  # ランキング（local: ワーカー内、LEADERBOARD_REFRESH_SECONDSごとにDBから作り直す / redis: ソート済みセットを共有）
+  LEADERBOARD_BACKEND = os.environ.get('LEADERBOARD_BACKEND', 'local')
+  LEADERBOARD_URL = os.environ.get('LEADERBOARD_URL', os.environ.get('CACHE_URL'))
+  LEADERBOARD_REFRESH_SECONDS = int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 60))
+  # water_record の月別パーティション（PostgreSQL）。flask partitions create で作成する先の月数とアーカイブの保存先
+  PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+  PARTITION_ARCHIVE_DIR = os.environ.get('PARTITION_ARCHIVE_DIR', 'archive')
+  # 水分記録の作成をワーカー内でまとめてコミットする（最初の記録から MAX_DELAY_MS か MAX_ROWS 件でコミット、コミット後に応答）
+  WRITE_BUFFER_ENABLED = os.environ.get('WRITE_BUFFER_ENABLED', 'false').lower() == 'true'
+  WRITE_BUFFER_MAX_ROWS = int(os.environ.get('WRITE_BUFFER_MAX_ROWS', 100))
+  WRITE_BUFFER_MAX_DELAY_MS = float(os.environ.get('WRITE_BUFFER_MAX_DELAY_MS', 5))
+  WRITE_BUFFER_TIMEOUT = float(os.environ.get('WRITE_BUFFER_TIMEOUT', 10))
+  # ホーム画面のAPIで独立したクエリを並行して実行する
+  HOME_CONCURRENT_QUERIES = os.environ.get('HOME_CONCURRENT_QUERIES', 'false').lower() == 'true'
+  # レスポンスの圧縮（このバイト数未満は圧縮しない。brotliはbrotliパッケージがある場合のみ）
+  COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+  COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+  COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+  # ストリーミング（NDJSONのエクスポート）はこのバイト数たまるごとに圧縮して送り出す
+  COMPRESS_STREAM_BUFFER_SIZE = int(os.environ.get('COMPRESS_STREAM_BUFFER_SIZE', 16384))
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -1,5 +1,7 @@
 from app import create_app, db
 from app.models import User, WaterRecord, Stamp, UserStamp
+from app.daily_totals import rebuild_daily_totals
+from app.nearby import rebuild_latest_positions
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 
@@ -78,6 +80,11 @@ def init_database():
         db.session.add(water_record1)
         db.session.add(water_record2)
         db.session.commit()
+
+        # 日ごとの集計とユーザーごとの最新の位置を作成
+        rebuild_daily_totals()
+        rebuild_latest_positions()
+        db.session.commit()
         
         # サンプルのスタンプ送信記録を作成
         print("Creating sample stamp records...")
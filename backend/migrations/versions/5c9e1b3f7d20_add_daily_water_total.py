@@ -0,0 +1,38 @@
+"""Add daily_water_total
+
+Revision ID: 5c9e1b3f7d20
+Revises: b7e2d4c81a3f
+Create Date: 2025-08-22 14:27:05.913442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c9e1b3f7d20'
+down_revision = 'b7e2d4c81a3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_water_total',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_amount', sa.Integer(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # 既存の水分記録から集計を作成
+    op.execute(
+        'INSERT INTO daily_water_total (user_id, day, total_amount, record_count) '
+        'SELECT user_id, date(water_date), COALESCE(SUM(water_amount), 0), COUNT(water_id) '
+        'FROM water_record GROUP BY user_id, date(water_date)'
+    )
+
+
+def downgrade():
+    op.drop_table('daily_water_total')
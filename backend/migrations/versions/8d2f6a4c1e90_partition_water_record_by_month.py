@@ -0,0 +1,102 @@
+"""Partition water_record by month
+
+Revision ID: 8d2f6a4c1e90
+Revises: 5c9e1b3f7d20
+Create Date: 2025-08-24 11:06:52.374120
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f6a4c1e90'
+down_revision = '5c9e1b3f7d20'
+branch_labels = None
+depends_on = None
+
+# マイグレーション時に作成しておく先の月数
+MONTHS_AHEAD = 3
+
+COLUMNS = 'water_id, water_date, water_type, water_amount, lat, lon, comment, user_id, geohash'
+
+COLUMN_DEFINITIONS = '''
+    water_id INTEGER NOT NULL DEFAULT nextval('water_record_water_id_seq'),
+    water_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    water_type VARCHAR(50),
+    water_amount INTEGER,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL,
+    comment VARCHAR(200),
+    user_id INTEGER NOT NULL REFERENCES users (user_id),
+    geohash VARCHAR(12)
+'''
+
+
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes():
+    op.execute('CREATE INDEX ix_water_record_geohash ON water_record (geohash)')
+    op.execute('CREATE INDEX ix_water_record_user_id_water_date ON water_record (user_id, water_date DESC)')
+
+
+def upgrade():
+    # 宣言的パーティショニングはPostgreSQLのみ（開発用のSQLiteでは何もしない）
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # 既存のテーブルを退避（インデックスと主キーの名前を空ける）
+    op.execute('ALTER TABLE water_record RENAME TO water_record_unpartitioned')
+    op.execute('ALTER TABLE water_record_unpartitioned RENAME CONSTRAINT water_record_pkey TO water_record_unpartitioned_pkey')
+    op.execute('DROP INDEX ix_water_record_geohash')
+    op.execute('DROP INDEX ix_water_record_user_id_water_date')
+    op.execute('ALTER SEQUENCE water_record_water_id_seq OWNED BY NONE')
+
+    # パーティションキーは主キーに含める必要がある（water_id は引き続きシーケンスで一意に採番）
+    op.execute(
+        f'CREATE TABLE water_record ({COLUMN_DEFINITIONS}, PRIMARY KEY (water_id, water_date)) '
+        'PARTITION BY RANGE (water_date)'
+    )
+    op.execute('ALTER SEQUENCE water_record_water_id_seq OWNED BY water_record.water_id')
+    # どの月のパーティションにも入らない記録の受け皿
+    op.execute('CREATE TABLE water_record_default PARTITION OF water_record DEFAULT')
+
+    # 既存の最古の月から MONTHS_AHEAD か月先までの月別パーティション
+    oldest = op.get_bind().execute(sa.text('SELECT min(water_date) FROM water_record_unpartitioned')).scalar()
+    current = date.today().replace(day=1)
+    month = oldest.date().replace(day=1) if oldest else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        next_month = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE water_record_p{month.year:04d}_{month.month:02d} PARTITION OF water_record "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        )
+        month = next_month
+
+    op.execute(f'INSERT INTO water_record ({COLUMNS}) SELECT {COLUMNS} FROM water_record_unpartitioned')
+    op.execute('DROP TABLE water_record_unpartitioned')
+    # インデックスはデータを移してから作る（親に作ると全パーティションに作られる）
+    _create_indexes()
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # アーカイブ済み（切り離し済み）のパーティションの記録は戻らないので、先に restore しておくこと
+    op.execute('ALTER TABLE water_record RENAME TO water_record_partitioned')
+    op.execute('ALTER TABLE water_record_partitioned RENAME CONSTRAINT water_record_pkey TO water_record_partitioned_pkey')
+    op.execute('DROP INDEX ix_water_record_geohash')
+    op.execute('DROP INDEX ix_water_record_user_id_water_date')
+    op.execute('ALTER SEQUENCE water_record_water_id_seq OWNED BY NONE')
+
+    op.execute(f'CREATE TABLE water_record ({COLUMN_DEFINITIONS}, PRIMARY KEY (water_id))')
+    op.execute('ALTER SEQUENCE water_record_water_id_seq OWNED BY water_record.water_id')
+    op.execute(f'INSERT INTO water_record ({COLUMNS}) SELECT {COLUMNS} FROM water_record_partitioned')
+    op.execute('DROP TABLE water_record_partitioned CASCADE')
+    _create_indexes()
@@ -0,0 +1,49 @@
+"""Drop water_record geohash
+
+Revision ID: a6e3f0c4d852
+Revises: f1b6e9d04a37
+Create Date: 2025-08-27 09:41:18.552031
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import geo
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e3f0c4d852'
+down_revision = 'f1b6e9d04a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 近傍検索は user_location.geohash を使うので、水分記録ごとのgeohashとインデックスは書き込みのコストにしかならない
+    with op.batch_alter_table('water_record', schema=None) as batch_op:
+        batch_op.drop_index('ix_water_record_geohash')
+        batch_op.drop_column('geohash')
+
+
+def downgrade():
+    with op.batch_alter_table('water_record', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+
+    # 既存の記録のgeohashを埋める
+    conn = op.get_bind()
+    water_record = sa.table(
+        'water_record',
+        sa.column('water_id', sa.Integer),
+        sa.column('lat', sa.Float),
+        sa.column('lon', sa.Float),
+        sa.column('geohash', sa.String),
+    )
+    rows = conn.execute(sa.select(water_record.c.water_id, water_record.c.lat, water_record.c.lon)).fetchall()
+    if rows:
+        conn.execute(
+            water_record.update().where(water_record.c.water_id == sa.bindparam('b_water_id')),
+            [{'b_water_id': row.water_id, 'geohash': geo.encode(row.lat, row.lon)} for row in rows]
+        )
+
+    with op.batch_alter_table('water_record', schema=None) as batch_op:
+        batch_op.create_index('ix_water_record_geohash', ['geohash'], unique=False)
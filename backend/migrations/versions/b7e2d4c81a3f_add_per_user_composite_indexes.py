@@ -0,0 +1,26 @@
+"""Add per-user composite indexes
+
+Revision ID: b7e2d4c81a3f
+Revises: 3f1c7a9d2b64
+Create Date: 2025-08-21 09:03:17.552904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4c81a3f'
+down_revision = '3f1c7a9d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_water_record_user_id_water_date', 'water_record', ['user_id', sa.text('water_date DESC')], unique=False)
+    op.create_index('ix_user_stamp_receiver_id_created_at', 'user_stamp', ['receiver_id', sa.text('created_at DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_stamp_receiver_id_created_at', table_name='user_stamp')
+    op.drop_index('ix_water_record_user_id_water_date', table_name='water_record')
@@ -0,0 +1,29 @@
+"""Add water_record (water_date, water_id) index
+
+Revision ID: c3d8f1a5b270
+Revises: e4a7c2b9d613
+Create Date: 2025-08-26 10:18:44.902153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8f1a5b270'
+down_revision = 'e4a7c2b9d613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 全ユーザーの記録一覧（新しい順のキーセットページネーション）用
+    # PostgreSQLではパーティション分割した親に作ると、既存と今後作るすべてのパーティションに作られる
+    op.create_index(
+        'ix_water_record_water_date_water_id', 'water_record',
+        [sa.text('water_date DESC'), sa.text('water_id DESC')], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_water_record_water_date_water_id', table_name='water_record')
@@ -0,0 +1,43 @@
+"""Add user_location
+
+Revision ID: e4a7c2b9d613
+Revises: 8d2f6a4c1e90
+Create Date: 2025-08-25 09:41:17.530862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2b9d613'
+down_revision = '8d2f6a4c1e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_location',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('water_date', sa.DateTime(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=False),
+    sa.Column('lon', sa.Float(), nullable=False),
+    sa.Column('geohash', sa.String(length=12), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_user_location_geohash', 'user_location', ['geohash'], unique=False)
+
+    # 既存の水分記録からユーザーごとの最新の位置を作成（ユーザーごとに複合インデックスで1行引く）
+    op.execute(
+        'INSERT INTO user_location (user_id, water_date, lat, lon, geohash) '
+        'SELECT u.user_id, w.water_date, w.lat, w.lon, w.geohash FROM users u '
+        'JOIN water_record w ON w.water_id = ('
+        'SELECT w2.water_id FROM water_record w2 WHERE w2.user_id = u.user_id '
+        'ORDER BY w2.water_date DESC, w2.water_id DESC LIMIT 1)'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_user_location_geohash', table_name='user_location')
+    op.drop_table('user_location')
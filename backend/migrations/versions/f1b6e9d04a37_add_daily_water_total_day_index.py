@@ -0,0 +1,25 @@
+"""Add daily_water_total (day, user_id) index
+
+Revision ID: f1b6e9d04a37
+Revises: c3d8f1a5b270
+Create Date: 2025-08-26 11:02:35.118470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6e9d04a37'
+down_revision = 'c3d8f1a5b270'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ランキングの読み込み（期間内の全ユーザーの集計）用。主キー (user_id, day) では日で絞り込めない
+    op.create_index('ix_daily_water_total_day_user_id', 'daily_water_total', ['day', 'user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_daily_water_total_day_user_id', table_name='daily_water_total')
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+from flask_migrate import downgrade, upgrade
+
+from app import create_app, db
+from app.benchmark import bench_cli
+from app.commands import sample_routes
+from config import Config
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# テスト用のDBに投入するデータ（flask bench seed と同じ分布で小さくしたもの）
+SEED_ARGS = ['seed', '--users', '60', '--records-per-user', '30', '--days', '30', '--stamps-per-user', '5', '--seed', '1']
+# PostgreSQLは小さなテーブルをインデックスで引かないので、プランを本番に近づけるため多めに投入して統計を取る
+POSTGRES_SEED_ARGS = ['seed', '--users', '2000', '--records-per-user', '30', '--days', '30', '--stamps-per-user', '5', '--seed', '1']
+
+
+# テスト用の設定（キャッシュ・書き込みバッファは無効、配信・ランキングはワーカー内）
+def make_config(database_url, **overrides):
+    return type('TestConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_BINDS': {},
+        'CACHE_BACKEND': 'none',
+        'PUBSUB_BACKEND': 'local',
+        'LEADERBOARD_BACKEND': 'local',
+        'WRITE_BUFFER_ENABLED': False,
+        **overrides,
+    })
+
+
+# TEST_DATABASE_URL を設定するとそのDB（PostgreSQLなど）で実行する
+# マイグレーションを適用して最後に戻すので、テスト専用の空のDBを指定すること
+@pytest.fixture(scope='session')
+def database_url(tmp_path_factory):
+    return os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+
+
+@pytest.fixture(scope='session')
+def app(database_url):
+    app = create_app(make_config(database_url))
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        postgres = db.engine.dialect.name == 'postgresql'
+        result = app.test_cli_runner().invoke(bench_cli, POSTGRES_SEED_ARGS if postgres else SEED_ARGS)
+        assert result.exit_code == 0, result.output
+        if postgres:
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('ANALYZE')
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        if db.engine.dialect.name != 'sqlite':
+            downgrade(directory=MIGRATIONS_DIR, revision='base')
+        db.engine.dispose()
+
+
+# 設定を変えたアプリ（同じDBを使う）
+@pytest.fixture
+def make_app(app, database_url):
+    def factory(**overrides):
+        return create_app(make_config(database_url, **overrides))
+    return factory
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# シード済みのデータから作ったチェック対象のルート {エンドポイント名: (URL, 許容クエリ数)}
+@pytest.fixture(scope='session')
+def routes(app):
+    with app.app_context():
+        return {endpoint: (url, max_queries) for endpoint, url, max_queries in sample_routes()}
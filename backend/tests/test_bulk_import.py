@@ -0,0 +1,91 @@
+import json
+
+import pytest
+from sqlalchemy import inspect
+
+from app import db
+from app.bulk_import import import_water_records
+from app.models import WaterRecord
+
+USER_ID = 16
+OTHER_USER_ID = 17
+
+CSV_HEADER = 'user_id,water_date,water_type,water_amount,lat,lon,comment\n'
+
+
+def _import(app, path, *args):
+    with app.app_context():
+        return app.test_cli_runner().invoke(import_water_records, [str(path), *args])
+
+
+def _count(app, user_id):
+    with app.app_context():
+        return db.session.scalar(db.select(db.func.count(WaterRecord.water_id)).where(WaterRecord.user_id == user_id))
+
+
+def _totals(client, user_id, start, end):
+    response = client.get(f'/api/v1/water_records/totals/{user_id}', query_string={'from': start, 'to': end})
+    return {total['day']: (total['total_amount'], total['record_count']) for total in response.get_json()}
+
+
+def test_import_csv_in_batches(app, client, tmp_path):
+    path = tmp_path / 'records.csv'
+    path.write_text(CSV_HEADER + ''.join([
+        f'{USER_ID},2020-01-01T08:00:00,water,200,35.0,135.0,\n',
+        f'{USER_ID},2020-01-01T12:00:00,tea,300,35.0,135.0,lunch\n',
+        f'{USER_ID},2020-01-02T08:00:00,,150,35.1,135.1,\n',
+        f'{OTHER_USER_ID},2020-01-01T09:00:00,water,,35.2,135.2,\n',
+    ]))
+    before = _count(app, USER_ID)
+
+    result = _import(app, path, '--batch-size', '2')
+    assert result.exit_code == 0, result.output
+    assert 'imported 4 rows' in result.output
+
+    assert _count(app, USER_ID) == before + 3
+    assert _totals(client, USER_ID, '2020-01-01', '2020-01-02') == {'2020-01-01': (500, 2), '2020-01-02': (150, 1)}
+    assert _totals(client, OTHER_USER_ID, '2020-01-01', '2020-01-02') == {'2020-01-01': (0, 1)}
+
+
+def test_import_ndjson(app, client, tmp_path):
+    path = tmp_path / 'records.ndjson'
+    path.write_text(''.join(json.dumps(item) + '\n' for item in [
+        {'user_id': USER_ID, 'water_date': '2020-02-01T08:00:00', 'water_amount': 250, 'lat': 35.0, 'lon': 135.0},
+        {'user_id': USER_ID, 'water_date': '2020-02-01T18:00:00', 'water_amount': 100, 'lat': 35.0, 'lon': 135.0,
+         'water_type': 'coffee', 'comment': 'after work'},
+    ]))
+
+    result = _import(app, path)
+    assert result.exit_code == 0, result.output
+    assert _totals(client, USER_ID, '2020-02-01', '2020-02-01') == {'2020-02-01': (350, 2)}
+
+
+# 不正な行があれば何も取り込まずに失敗する
+@pytest.mark.parametrize('bad_row, message', [
+    (f'{USER_ID},2020-03-01T08:00:00,water,200,95.0,135.0,\n', 'lat/lon out of range'),
+    (f'{USER_ID},yesterday,water,200,35.0,135.0,\n', 'line 3'),
+    ('999999,2020-03-01T08:00:00,water,200,35.0,135.0,\n', 'unknown user_id: 999999'),
+])
+def test_invalid_file_imports_nothing(app, tmp_path, bad_row, message):
+    path = tmp_path / 'records.csv'
+    path.write_text(CSV_HEADER + f'{USER_ID},2020-03-01T07:00:00,water,200,35.0,135.0,\n' + bad_row)
+    before = _count(app, USER_ID)
+
+    result = _import(app, path)
+    assert result.exit_code != 0
+    assert message in result.output
+    assert _count(app, USER_ID) == before
+
+
+def test_defer_indexes_rebuilds_them(app, client, tmp_path):
+    path = tmp_path / 'records.csv'
+    path.write_text(CSV_HEADER + f'{USER_ID},2020-04-01T08:00:00,water,200,35.0,135.0,\n')
+
+    result = _import(app, path, '--defer-indexes')
+    assert result.exit_code == 0, result.output
+    assert 'rebuilt' in result.output
+
+    with app.app_context():
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes(WaterRecord.__tablename__)}
+    assert {index.name for index in WaterRecord.__table__.indexes} <= indexes
+    assert _totals(client, USER_ID, '2020-04-01', '2020-04-01') == {'2020-04-01': (200, 1)}
@@ -0,0 +1,84 @@
+import pytest
+
+from app import db
+from app.cache import get_cache, water_records_tag
+from app.instrumentation import assert_max_queries
+from app.models import WaterRecord
+
+USER_ID = 10
+OTHER_USER_ID = 11
+
+
+# ワーカー内のキャッシュを使うアプリ（テストごとに空のキャッシュ）
+@pytest.fixture
+def cached_app(make_app):
+    return make_app(CACHE_BACKEND='local')
+
+
+def _water_ids(client, user_id):
+    response = client.get(f'/api/v1/water_records/{user_id}?limit=100')
+    if response.status_code == 404:
+        return set()
+    assert response.status_code == 200
+    return {record['water_id'] for record in response.get_json()['items']}
+
+
+def _create(client, user_id):
+    response = client.post(f'/api/v1/water_records/{user_id}', json={'water_amount': 200, 'lat': 35.0, 'lon': 135.0})
+    assert response.status_code == 201
+    return response.get_json()['water_id']
+
+
+def test_second_get_is_served_from_cache(cached_app):
+    client = cached_app.test_client()
+    first = client.get(f'/api/v1/users/{USER_ID}')
+    assert first.status_code == 200
+
+    with assert_max_queries(0):
+        second = client.get(f'/api/v1/users/{USER_ID}')
+    assert second.status_code == 200
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+# 書き込んだのとは別のクライアント（プライマリから読むCookieがない）にも、コミット後は新しい値が返る
+def test_write_from_another_client_invalidates(cached_app):
+    reader = cached_app.test_client()
+    writer = cached_app.test_client()
+    before = _water_ids(reader, USER_ID)
+
+    water_id = _create(writer, USER_ID)
+
+    assert _water_ids(reader, USER_ID) == before | {water_id}
+
+
+def test_rollback_does_not_invalidate(cached_app):
+    client = cached_app.test_client()
+    _water_ids(client, USER_ID)
+
+    with cached_app.app_context():
+        cache = get_cache()
+        version = cache.get_version(water_records_tag(USER_ID))
+        record = db.session.scalars(db.select(WaterRecord).where(WaterRecord.user_id == USER_ID).limit(1)).first()
+        record.water_amount = (record.water_amount or 0) + 1
+        db.session.flush()
+        db.session.rollback()
+        assert cache.get_version(water_records_tag(USER_ID)) == version
+
+    with assert_max_queries(0):
+        _water_ids(client, USER_ID)
+
+
+# 記録のユーザーを変えると、変更前と変更後の両方のユーザーのキャッシュが無効化される
+def test_changing_user_invalidates_both_users(cached_app):
+    reader = cached_app.test_client()
+    writer = cached_app.test_client()
+    water_id = _create(writer, USER_ID)
+    assert water_id in _water_ids(reader, USER_ID)
+    assert water_id not in _water_ids(reader, OTHER_USER_ID)
+
+    response = writer.put(f'/api/v1/water_records/{water_id}', json={'user_id': OTHER_USER_ID})
+    assert response.status_code == 200
+
+    assert water_id not in _water_ids(reader, USER_ID)
+    assert water_id in _water_ids(reader, OTHER_USER_ID)
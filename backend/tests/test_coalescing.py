@@ -0,0 +1,61 @@
+import threading
+import time
+
+from flask import jsonify
+
+from app.coalescing import coalesce
+from app.routing import PRIMARY_UNTIL_COOKIE
+
+URL = '/api/v1/water_records/today/total/1'
+CLIENTS = 8
+
+
+# 同じURLへの同時リクエストを CLIENTS 個のスレッドで coalesce に通し、(計算の回数, レスポンス) を返す
+def _run_concurrently(app, headers=None):
+    calls = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(CLIENTS)
+    responses = [None] * CLIENTS
+
+    def compute():
+        with lock:
+            calls.append(1)
+            n = len(calls)
+        # 他のリクエストが相乗りできるよう計算に時間をかける
+        time.sleep(0.2)
+        return jsonify({'call': n})
+
+    def worker(i):
+        with app.test_request_context(URL, headers=headers):
+            barrier.wait()
+            response = coalesce(compute)
+            responses[i] = (response.status_code, response.get_json())
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(calls), responses
+
+
+def test_concurrent_requests_compute_once(app):
+    calls, responses = _run_concurrently(app)
+    assert calls == 1
+    assert responses == [(200, {'call': 1})] * CLIENTS
+
+
+def test_primary_window_bypasses_coalescing(app):
+    headers = {'Cookie': f'{PRIMARY_UNTIL_COOKIE}={time.time() + 60}'}
+    calls, responses = _run_concurrently(app, headers)
+    assert calls == CLIENTS
+    assert sorted(body['call'] for _, body in responses) == list(range(1, CLIENTS + 1))
+
+
+# 終わった計算の結果は後のリクエストに使わない
+def test_finished_requests_are_not_shared(app):
+    def request_once():
+        with app.test_request_context(URL):
+            return coalesce(lambda: jsonify({'at': time.perf_counter()})).get_json()
+
+    assert request_once() != request_once()
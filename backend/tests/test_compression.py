@@ -0,0 +1,59 @@
+import gzip
+import zlib
+
+import pytest
+
+USER_ID = 12
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_large_json_is_compressed_with_weak_etag(client):
+    response = client.get(f'/api/v1/water_records/{USER_ID}?limit=100', headers=GZIP)
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert response.headers['ETag'].startswith('W/"')
+
+    plain = client.get(f'/api/v1/water_records/{USER_ID}?limit=100')
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+
+# 304は200と同じ Vary・弱いETagを返す（サイズが小さく圧縮しなかったレスポンスも同じ）
+@pytest.mark.parametrize('url', [f'/api/v1/water_records/{USER_ID}?limit=100', f'/api/v1/users/{USER_ID}'])
+def test_not_modified_matches_compressed_response(client, url):
+    response = client.get(url, headers=GZIP)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/"')
+
+    not_modified = client.get(url, headers={**GZIP, 'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert 'Accept-Encoding' in not_modified.vary
+    assert 'Content-Encoding' not in not_modified.headers
+
+
+# ストリーミングは行ごとではなく COMPRESS_STREAM_BUFFER_SIZE ごとにフラッシュし、
+# 送り出したチャンクまでで行の区切りまで展開できる
+def test_stream_flushes_once_per_buffered_chunk(make_app):
+    app = make_app(COMPRESS_STREAM_BUFFER_SIZE=4096)
+    client = app.test_client()
+    plain = client.get('/api/v1/water_records/export').get_data()
+    rows = plain.count(b'\n')
+
+    response = client.get('/api/v1/water_records/export', headers=GZIP, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    chunks = [chunk for chunk in response.response if chunk]
+    response.close()
+
+    assert len(chunks) <= len(plain) // 4096 + 2
+    assert len(chunks) < rows
+    decompressor = zlib.decompressobj(31)
+    body = b''
+    for chunk in chunks[:-1]:
+        body += decompressor.decompress(chunk)
+        assert body.endswith(b'\n')
+    body += decompressor.decompress(chunks[-1]) + decompressor.flush()
+    assert body == plain
@@ -0,0 +1,42 @@
+USER_ID = 2
+
+
+def test_etag_and_not_modified(client):
+    url = f'/api/v1/users/{USER_ID}'
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    response = client.get(url, headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+
+
+def test_etag_changes_after_write(client):
+    url = f'/api/v1/water_records/{USER_ID}'
+    etag = client.get(url).headers['ETag']
+
+    created = client.post(url, json={'water_amount': 150, 'lat': 35.68, 'lon': 139.76})
+    assert created.status_code == 201
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['items'][0]['water_id'] == created.get_json()['water_id']
+
+
+def test_no_etag_on_errors(client):
+    response = client.get('/api/v1/users/999999')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_no_etag_on_long_poll(client):
+    cursor = client.get('/api/v1/stamps/events/1').get_json()['cursor']
+    response = client.get(f'/api/v1/stamps/events/1?since={cursor}&timeout=0')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
@@ -0,0 +1,103 @@
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.daily_totals import rebuild_daily_totals
+from app.models import DailyWaterTotal
+
+USER_ID = 8
+OTHER_USER_ID = 9
+
+
+# シードデータ（過去30日）と重ならない日（テストごとに別の日を使う）
+def _days(offset):
+    day = date.today() - timedelta(days=400 + offset * 10)
+    return day, day + timedelta(days=1)
+
+
+def _at(day, hour=12):
+    return datetime.combine(day, datetime.min.time()).replace(hour=hour).isoformat()
+
+
+# 日時を指定できる一括登録（オフライン記録の同期）で1件登録する
+def _create(client, user_id, day, amount):
+    response = client.post(f'/api/v1/water_records/{user_id}/batch',
+                           json={'records': [{'water_amount': amount, 'lat': 35.0, 'lon': 135.0, 'water_date': _at(day)}]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()['results'][0]['water_id']
+
+
+# 日ごとの合計 {日: (合計, 件数)}
+def _totals(client, user_id, start, end):
+    response = client.get(f'/api/v1/water_records/totals/{user_id}',
+                          query_string={'from': start.isoformat(), 'to': end.isoformat()})
+    assert response.status_code == 200
+    return {total['day']: (total['total_amount'], total['record_count']) for total in response.get_json()}
+
+
+def _update(client, water_id, **values):
+    response = client.put(f'/api/v1/water_records/{water_id}', json=values)
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def test_totals_sum_records_per_day(client):
+    day, next_day = _days(0)
+    _create(client, USER_ID, day, 200)
+    _create(client, USER_ID, day, 300)
+    _create(client, USER_ID, next_day, 150)
+
+    assert _totals(client, USER_ID, day, next_day) == {day.isoformat(): (500, 2), next_day.isoformat(): (150, 1)}
+    # to を含む・範囲外の日は含まない
+    assert _totals(client, USER_ID, day, day) == {day.isoformat(): (500, 2)}
+
+
+def test_totals_requires_from(client):
+    assert client.get(f'/api/v1/water_records/totals/{USER_ID}').status_code == 400
+    assert client.get(f'/api/v1/water_records/totals/{USER_ID}?from=yesterday').status_code == 400
+
+
+def test_moving_record_to_another_day(client):
+    day, next_day = _days(1)
+    _create(client, USER_ID, day, 100)
+    moved = _create(client, USER_ID, day, 250)
+
+    _update(client, moved, water_date=_at(next_day, 9))
+    assert _totals(client, USER_ID, day, next_day) == {day.isoformat(): (100, 1), next_day.isoformat(): (250, 1)}
+
+
+def test_moving_record_to_another_user(client):
+    day, next_day = _days(2)
+    water_id = _create(client, USER_ID, day, 400)
+
+    _update(client, water_id, user_id=OTHER_USER_ID)
+    assert _totals(client, USER_ID, day, next_day) == {}
+    assert _totals(client, OTHER_USER_ID, day, next_day) == {day.isoformat(): (400, 1)}
+
+
+def test_changing_amount(client):
+    day, next_day = _days(3)
+    water_id = _create(client, USER_ID, day, 200)
+    _create(client, USER_ID, day, 50)
+
+    _update(client, water_id, water_amount=350)
+    assert _totals(client, USER_ID, day, next_day) == {day.isoformat(): (400, 2)}
+
+
+# 日・ユーザー・量をまとめて変えた後の集計が、水分記録から作り直した集計と一致する
+def test_totals_match_rebuild(app, client):
+    day, next_day = _days(4)
+    water_id = _create(client, USER_ID, day, 120)
+    _update(client, water_id, water_amount=180, user_id=OTHER_USER_ID, water_date=_at(next_day))
+    assert _totals(client, USER_ID, day, next_day) == {}
+    assert _totals(client, OTHER_USER_ID, day, next_day) == {next_day.isoformat(): (180, 1)}
+
+    def snapshot():
+        return set(db.session.execute(
+            db.select(DailyWaterTotal.user_id, DailyWaterTotal.day, DailyWaterTotal.total_amount, DailyWaterTotal.record_count)
+            .where(DailyWaterTotal.record_count > 0)
+        ).all())
+
+    with app.app_context():
+        incremental = snapshot()
+        rebuild_daily_totals()
+        db.session.commit()
+        assert snapshot() == incremental
@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+
+from app import db
+from app.geo import (
+    COVER_MAX_CELLS, EARTH_RADIUS_M, GEOHASH_PRECISION, covering_cells, decode_bounds, distance_m, encode, prefix_range
+)
+from app.models import UserLocation, WaterRecord
+from app.nearby import rebuild_latest_positions
+
+
+def test_encode_known_values():
+    assert encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert encode(35.681236, 139.767125, 5) == 'xn76u'
+
+
+def test_decode_bounds_contains_point():
+    lat, lon = 35.681236, 139.767125
+    min_lat, max_lat, min_lon, max_lon = decode_bounds(encode(lat, lon))
+    assert min_lat <= lat <= max_lat
+    assert min_lon <= lon <= max_lon
+
+
+def test_prefix_range_covers_longer_hashes():
+    low, high = prefix_range('xn76')
+    assert low <= encode(35.681236, 139.767125) <= high
+    assert not low <= encode(34.702485, 135.495951) <= high
+
+
+def _point_at(lat, lon, distance, bearing):
+    # (lat, lon) から方位 bearing に distance メートル進んだ点
+    delta = distance / EARTH_RADIUS_M
+    phi1, lambda1 = math.radians(lat), math.radians(lon)
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(bearing))
+    lambda2 = lambda1 + math.atan2(
+        math.sin(bearing) * math.sin(delta) * math.cos(phi1),
+        math.cos(delta) - math.sin(phi1) * math.sin(phi2)
+    )
+    return math.degrees(phi2), (math.degrees(lambda2) + 540.0) % 360.0 - 180.0
+
+
+@pytest.mark.parametrize('lat, lon, radius', [
+    (35.681236, 139.767125, 1000),
+    (35.681236, 139.767125, 50),
+    (-33.8688, 151.2093, 5000),
+    (64.1466, -21.9426, 2000),
+    (0.0, 179.999, 3000),
+])
+def test_covering_cells_cover_every_point_within_radius(lat, lon, radius):
+    cells = covering_cells(lat, lon, radius)
+    assert 0 < len(cells) <= COVER_MAX_CELLS
+
+    rng = random.Random(1)
+    for _ in range(2000):
+        point = _point_at(lat, lon, radius * math.sqrt(rng.random()), rng.uniform(0, 2 * math.pi))
+        assert distance_m(lat, lon, *point) <= radius + 1e-6
+        geohash = encode(*point)
+        assert any(geohash.startswith(cell) for cell in cells), point
+
+
+def test_covering_cells_are_fine_for_small_radius():
+    # 1km以内なら1辺1km程度のセル（6桁）で調べる
+    cells = covering_cells(35.681236, 139.767125, 1000)
+    assert {len(cell) for cell in cells} == {6}
+
+
+def test_distance_m():
+    # 東京駅から大阪駅までおよそ400km
+    assert distance_m(35.681236, 139.767125, 34.702485, 135.495951) == pytest.approx(403000, rel=0.01)
+
+
+# 最新の位置を作り直すと、各ユーザーの最新の記録の位置からgeohashが計算される
+def test_rebuild_latest_positions_computes_geohash(app):
+    with app.app_context():
+        before = {location.user_id: (location.water_date, location.lat, location.lon)
+                  for location in db.session.scalars(db.select(UserLocation))}
+        rebuild_latest_positions()
+        db.session.commit()
+        locations = db.session.scalars(db.select(UserLocation)).all()
+
+        assert {location.user_id: (location.water_date, location.lat, location.lon) for location in locations} == before
+        for location in locations:
+            assert location.geohash == encode(location.lat, location.lon, GEOHASH_PRECISION)
+        assert 'geohash' not in WaterRecord.__table__.columns
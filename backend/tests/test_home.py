@@ -0,0 +1,64 @@
+import pytest
+
+from app.instrumentation import assert_max_queries
+
+USER_ID = 14
+
+
+def _expected(client, user_id):
+    total = client.get(f'/api/v1/water_records/today/total/{user_id}').get_json()
+    latest = client.get(f'/api/v1/water_records/now/{user_id}')
+    nearby = client.get(f'/api/v1/users/nearby/{user_id}')
+    unreplied = client.get(f'/api/v1/stamps/send/{user_id}?unreplied=true&limit=200').get_json()['items']
+    return {
+        'user': client.get(f'/api/v1/users/{user_id}').get_json(),
+        'today': {'day': total['day'], 'total_amount': total['total_amount'], 'record_count': total['record_count']},
+        'latest_record': latest.get_json() if latest.status_code == 200 else None,
+        'unreplied_stamps': len(unreplied),
+        'nearby_users': nearby.get_json() if nearby.status_code == 200 else [],
+    }
+
+
+# ホームのレスポンスは個別のエンドポイントを組み合わせた結果と同じ
+def test_home_matches_individual_endpoints(client):
+    created = client.post(f'/api/v1/water_records/{USER_ID}', json={'water_amount': 250, 'lat': 35.68, 'lon': 139.76})
+    assert created.status_code == 201
+
+    response = client.get(f'/api/v1/home/{USER_ID}')
+    assert response.status_code == 200
+    home = response.get_json()
+    assert home == _expected(client, USER_ID)
+    assert home['latest_record']['water_id'] == created.get_json()['water_id']
+    assert home['today']['record_count'] >= 1
+
+
+# 近くにユーザーがいる位置（シードの記録のあるユーザーの最新の位置）でも同じ
+def test_home_nearby_users_match(client):
+    neighbour = client.get('/api/v1/water_records/now/1').get_json()
+    created = client.post(f'/api/v1/water_records/{USER_ID}',
+                          json={'water_amount': 100, 'lat': neighbour['lat'], 'lon': neighbour['lon']})
+    assert created.status_code == 201
+
+    home = client.get(f'/api/v1/home/{USER_ID}').get_json()
+    assert home['nearby_users']
+    assert home == _expected(client, USER_ID)
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_home_query_count(make_app, concurrent):
+    client = make_app(HOME_CONCURRENT_QUERIES=concurrent).test_client()
+    with assert_max_queries(3):
+        response = client.get(f'/api/v1/home/{USER_ID}')
+    assert response.status_code == 200
+    assert response.get_json() == _expected(client, USER_ID)
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_home_unknown_user(make_app, concurrent):
+    client = make_app(HOME_CONCURRENT_QUERIES=concurrent).test_client()
+    response = client.get('/api/v1/home/999999')
+    assert response.status_code == 404
+
+
+def test_home_rejects_invalid_radius(client):
+    assert client.get(f'/api/v1/home/{USER_ID}?radius=0').status_code == 400
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from app.leaderboard import LocalLeaderboard, RankedSet
+
+
+def test_ranked_set_matches_sorted_list():
+    rng = random.Random(1)
+    ranked = RankedSet()
+    reference = []
+    for _ in range(3000):
+        if reference and rng.random() < 0.4:
+            key = rng.choice(reference)
+            ranked.remove(key)
+            reference.remove(key)
+        else:
+            key = (rng.randint(-1000, 0), rng.randint(1, 10 ** 6))
+            if key in reference:
+                continue
+            ranked.add(key)
+            reference.append(key)
+        reference.sort()
+
+        assert len(ranked) == len(reference)
+        assert ranked.head(10) == reference[:10]
+        if reference:
+            key = rng.choice(reference)
+            assert ranked.index(key) == reference.index(key)
+
+    assert ranked.head(len(reference) + 1) == reference
+
+
+def test_ranked_set_missing_key():
+    ranked = RankedSet()
+    ranked.add((1, 1))
+    assert ranked.index((2, 2)) is None
+    with pytest.raises(KeyError):
+        ranked.remove((2, 2))
+
+
+def test_local_leaderboard_ranks_by_score():
+    board = LocalLeaderboard()
+    board.load('day:2025-08-01', {1: 300, 2: 500, 3: 0})
+    board.add('day:2025-08-01', 3, 400)
+    board.add('day:2025-08-01', 1, 300)
+
+    assert board.top('day:2025-08-01', 3) == [(1, 600), (2, 500), (3, 400)]
+    assert board.rank('day:2025-08-01', 2) == (1, 500)
+    assert board.rank('day:2025-08-01', 4) == (None, 0)
+
+    # 合計が0以下になったユーザーはランキングから外れる
+    board.add('day:2025-08-01', 3, -400)
+    assert board.top('day:2025-08-01', 3) == [(1, 600), (2, 500)]
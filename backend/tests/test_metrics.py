@@ -0,0 +1,62 @@
+import re
+
+from app.metrics import Histogram
+
+USER_ID = 18
+
+
+def _samples(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_server_timing_header(client):
+    response = client.get(f'/api/v1/users/{USER_ID}')
+    assert response.status_code == 200
+    match = re.fullmatch(r'app;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries"', response.headers['Server-Timing'])
+    assert match, response.headers['Server-Timing']
+    app_ms, db_ms, queries = float(match.group(1)), float(match.group(2)), int(match.group(3))
+    assert queries == 1
+    assert db_ms <= app_ms
+
+
+# アプリごとに集計されるので、新しいアプリで数える
+def test_metrics_count_requests_per_endpoint(make_app):
+    client = make_app().test_client()
+    client.get(f'/api/v1/users/{USER_ID}')
+    client.get(f'/api/v1/users/{USER_ID}')
+    client.get('/api/v1/users/999999')
+    client.get('/no-such-route')
+
+    samples = _samples(client)
+    assert samples['http_requests_total{endpoint="users.get_user",method="GET",status="200"}'] == 2
+    assert samples['http_requests_total{endpoint="users.get_user",method="GET",status="404"}'] == 1
+    assert samples['http_requests_total{endpoint="unmatched",method="GET",status="404"}'] == 1
+    assert samples['http_request_duration_seconds_count{endpoint="users.get_user",method="GET"}'] == 3
+    assert samples['http_request_duration_seconds_bucket{endpoint="users.get_user",method="GET",le="+Inf"}'] == 3
+    assert samples['http_request_db_queries_sum{endpoint="users.get_user"}'] == 3
+    # /metrics 自体のリクエストだけが処理中
+    assert samples['http_requests_in_progress{endpoint="users.get_user"}'] == 0
+    assert samples['http_requests_in_progress{endpoint="metrics"}'] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('h', 'Test.', ('endpoint',), (1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(('e',), value)
+
+    samples = {name + labels: value for name, labels, value in histogram.samples()}
+    assert samples == {
+        'h_bucket{endpoint="e",le="1"}': 2,
+        'h_bucket{endpoint="e",le="5"}': 3,
+        'h_bucket{endpoint="e",le="+Inf"}': 4,
+        'h_sum{endpoint="e"}': 14.5,
+        'h_count{endpoint="e"}': 4,
+    }
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.commands import capture_statements
+from app.models import WaterRecord
+from app.pagination import PaginationError, decode_cursor, encode_cursor
+
+USER_ID = 1
+
+
+def test_cursor_round_trip():
+    keys = [WaterRecord.water_date, WaterRecord.water_id]
+    values = [datetime(2025, 8, 1, 12, 30, 15, 123456), 42]
+    assert decode_cursor(encode_cursor(values), keys) == values
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', encode_cursor([1]), encode_cursor(['yesterday', 1])])
+def test_decode_cursor_rejects_invalid(cursor):
+    with pytest.raises(PaginationError):
+        decode_cursor(cursor, [WaterRecord.water_date, WaterRecord.water_id])
+
+
+def test_walk_all_pages(app, client):
+    with app.app_context():
+        expected = [
+            water_id for water_id, in WaterRecord.query.with_entities(WaterRecord.water_id)
+            .filter_by(user_id=USER_ID)
+            .order_by(WaterRecord.water_date.desc(), WaterRecord.water_id.desc())
+        ]
+    assert len(expected) > 7
+
+    seen = []
+    url = f'/api/v1/water_records/{USER_ID}?limit=7'
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert page['limit'] == 7
+        assert len(page['items']) <= 7
+        seen.extend(item['water_id'] for item in page['items'])
+        if page['next_cursor'] is None:
+            break
+        url = f"/api/v1/water_records/{USER_ID}?limit=7&cursor={page['next_cursor']}"
+
+    assert seen == expected
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=201', 'cursor=not-a-cursor'])
+def test_invalid_page_arguments(client, query):
+    response = client.get(f'/api/v1/water_records/{USER_ID}?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def _walk(client, url):
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        ids.extend(item['water_id'] for item in page['items'])
+        url = page['next_cursor'] and f"/api/v1/water_records/?limit=200&cursor={page['next_cursor']}"
+    return ids
+
+
+def test_walk_all_users_pages(app, client):
+    with app.app_context():
+        expected = [
+            water_id for water_id, in WaterRecord.query.with_entities(WaterRecord.water_id)
+            .order_by(WaterRecord.water_date.desc(), WaterRecord.water_id.desc())
+        ]
+    assert _walk(client, '/api/v1/water_records/?limit=200') == expected
+
+
+# 全ユーザーの一覧は (water_date DESC, water_id DESC) のインデックスの順に読み、並べ替えない
+def test_all_users_pages_are_not_sorted(app, client):
+    cursor = client.get('/api/v1/water_records/?limit=5').get_json()['next_cursor']
+    for url in ['/api/v1/water_records/?limit=5', f'/api/v1/water_records/?limit=5&cursor={cursor}']:
+        with app.app_context():
+            _, statements = capture_statements(client, url)
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    if conn.dialect.name == 'postgresql':
+                        plan = [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+                        assert not any(line.lstrip(' ->').startswith('Sort') for line in plan), plan
+                    else:
+                        plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                        assert not any('TEMP B-TREE' in line for line in plan), plan
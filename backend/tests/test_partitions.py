@@ -0,0 +1,91 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import WaterRecord
+from app.partitions import (
+    DEFAULT_PARTITION, TABLE, add_months, attached_partitions, create_partition, month_start, partition_name,
+    partitions_cli
+)
+
+# 月別パーティションはPostgreSQLのみ（TEST_DATABASE_URL にPostgreSQLを指定したときに実行する）
+pytestmark = pytest.mark.usefixtures('require_postgresql')
+
+ARCHIVE_MONTH = date(2020, 1, 1)
+
+
+@pytest.fixture
+def require_postgresql(app):
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('partitioning requires PostgreSQL (set TEST_DATABASE_URL)')
+
+
+def _count(sql, *params):
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql(sql, params).scalar()
+
+
+def test_migration_partitions_water_record(app):
+    with app.app_context():
+        assert _count(
+            'SELECT count(*) FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+            TABLE
+        ) == 1
+        with db.engine.connect() as conn:
+            assert month_start(date.today()) in attached_partitions(conn)
+
+
+def test_create_partitions_ahead(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(partitions_cli, ['create', '--ahead', '5'])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            partitions = attached_partitions(conn)
+    current = month_start(date.today())
+    assert all(add_months(current, i) in partitions for i in range(6))
+
+    # 2回目は何も作らない
+    result = runner.invoke(partitions_cli, ['create', '--ahead', '5'])
+    assert result.exit_code == 0 and result.output == ''
+
+
+def test_archive_and_restore(app, tmp_path):
+    runner = app.test_cli_runner()
+    with app.app_context():
+        record = WaterRecord(user_id=1, water_date=datetime(2020, 1, 15, 9, 0), water_type='water',
+                             water_amount=200, lat=35.68, lon=139.76)
+        db.session.add(record)
+        db.session.commit()
+        water_id = record.water_id
+        # デフォルトパーティションに入った記録は月のパーティションを作ると移される
+        with db.engine.begin() as conn:
+            assert create_partition(conn, ARCHIVE_MONTH) == 1
+
+    try:
+        result = runner.invoke(partitions_cli, ['archive', '--before', '2020-02', '--dir', str(tmp_path)])
+        assert result.exit_code == 0, result.output
+        assert (tmp_path / f'{partition_name(ARCHIVE_MONTH)}.csv.gz').exists()
+        with app.app_context():
+            assert _count('SELECT count(*) FROM water_record WHERE water_id = %s', water_id) == 0
+            with db.engine.connect() as conn:
+                assert ARCHIVE_MONTH not in attached_partitions(conn)
+
+        result = runner.invoke(partitions_cli, ['list'])
+        assert result.exit_code == 0, result.output
+        assert partition_name(ARCHIVE_MONTH) not in result.output
+        assert DEFAULT_PARTITION in result.output
+
+        result = runner.invoke(partitions_cli, ['restore', '2020-01', '--dir', str(tmp_path)])
+        assert result.exit_code == 0, result.output
+        assert 'restored' in result.output
+        with app.app_context():
+            assert _count('SELECT water_amount FROM water_record WHERE water_id = %s', water_id) == 200
+    finally:
+        with app.app_context():
+            db.session.remove()
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('DELETE FROM water_record WHERE water_id = %s', (water_id,))
@@ -0,0 +1,40 @@
+import threading
+import time
+
+from app.pubsub import LocalBroker
+
+
+def test_waiters_are_removed_when_the_last_one_leaves():
+    broker = LocalBroker()
+    threads = [threading.Thread(target=broker.wait, args=(user_id, 0, 0.1)) for user_id in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert broker._waiters == {}
+
+
+def test_publish_wakes_waiter():
+    broker = LocalBroker()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(broker.wait(1, 0, 5)))
+    thread.start()
+    time.sleep(0.1)
+    broker.publish(1, {'type': 'stamp'})
+    thread.join(1)
+    assert results == [([(1, {'type': 'stamp'})], 1, False)]
+    assert broker._waiters == {}
+
+
+def test_idle_users_are_pruned_and_reset():
+    broker = LocalBroker(ttl=0.2)
+    for user_id in range(100):
+        broker.publish(user_id, {'n': user_id})
+    time.sleep(0.25)
+    broker.publish(1000, {'n': 1000})
+
+    assert list(broker._events) == [1000]
+    # 捨てたイベントより前から待っていたクライアントにはリセットを通知する
+    assert broker.wait(5, 0, 0) == ([], 101, True)
+    # 最新のカーソルを持っているクライアントには通知しない
+    assert broker.wait(5, 101, 0) == ([], 101, False)
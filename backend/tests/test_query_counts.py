@@ -0,0 +1,53 @@
+import pytest
+
+from app import db
+from app.instrumentation import assert_max_queries
+from app.models import User
+
+# クエリ数を確認するルート（sample_routes のすべて）
+COUNT_ENDPOINTS = [
+    'users.get_user',
+    'users.get_all_users',
+    'users.get_nearby_users',
+    'water_records.get_water_records',
+    'water_records.get_all_water_records',
+    'water_records.get_today_water_records',
+    'water_records.get_today_water_total',
+    'water_records.get_now_water_records',
+    'water_records.get_water_stats',
+    'stamps.get_stamps',
+    'stamps.get_stamp',
+    'stamps.get_send_stamps',
+    'home.get_home',
+    'leaderboard.get_ranking',
+]
+
+
+def test_count_endpoints_cover_sample_routes(routes):
+    assert set(COUNT_ENDPOINTS) == set(routes)
+
+
+@pytest.mark.parametrize('endpoint', COUNT_ENDPOINTS)
+def test_query_count(app, client, routes, endpoint):
+    url, max_queries = routes[endpoint]
+    # ランキングは初回にDBから読み込むので、読み込み済みの状態で数える
+    client.get(url)
+    with assert_max_queries(max_queries, repeat_threshold=app.config['QUERY_REPEAT_THRESHOLD']):
+        response = client.get(url)
+    assert response.status_code < 500, response.get_data(as_text=True)
+
+
+def test_assert_max_queries_reports_too_many_queries(app):
+    with app.app_context():
+        with pytest.raises(AssertionError, match='2 queries executed, expected at most 1'):
+            with assert_max_queries(1):
+                db.session.get(User, 1)
+                db.session.get(User, 2)
+
+
+def test_assert_max_queries_reports_repeated_statements(app):
+    with app.app_context():
+        with pytest.raises(AssertionError, match='statement executed 3 times'):
+            with assert_max_queries(10, repeat_threshold=3):
+                for user_id in (1, 2, 3):
+                    User.query.filter_by(user_id=user_id).first()
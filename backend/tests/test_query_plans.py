@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.commands import FULL_LIST_ENDPOINTS, explain_full_scans, find_full_scans
+from app.leaderboard import LEADERBOARD_PERIODS, _load_scores, period_start
+
+# 全件走査にならないことを確認するルート（一覧全体を返すルート以外のすべて）
+PLAN_ENDPOINTS = [
+    'users.get_user',
+    'users.get_nearby_users',
+    'water_records.get_water_records',
+    'water_records.get_all_water_records',
+    'water_records.get_today_water_records',
+    'water_records.get_today_water_total',
+    'water_records.get_now_water_records',
+    'water_records.get_water_stats',
+    'stamps.get_stamp',
+    'stamps.get_send_stamps',
+    'home.get_home',
+    'leaderboard.get_ranking',
+]
+
+
+def test_plan_endpoints_cover_sample_routes(routes):
+    assert set(PLAN_ENDPOINTS) == set(routes) - FULL_LIST_ENDPOINTS
+
+
+@pytest.mark.parametrize('endpoint', PLAN_ENDPOINTS)
+def test_no_full_scans(app, client, routes, endpoint):
+    url, _ = routes[endpoint]
+    with app.app_context():
+        response, statements, full_scans = find_full_scans(client, endpoint, url)
+
+    # 近くにユーザーがいない場合などの404はそのままでよい（クエリは実行されている）
+    assert response.status_code < 500, response.get_data(as_text=True)
+    assert statements
+    assert [(scan.detail, ' '.join(statement.split())) for scan, statement in full_scans] == []
+
+
+# ランキングの読み込み（ワーカーごとに LEADERBOARD_REFRESH_SECONDS ごとに実行される）
+@pytest.mark.parametrize('period', LEADERBOARD_PERIODS)
+def test_leaderboard_reload_uses_index(app, period):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            _load_scores(period, period_start(period, date.today()))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        assert statements
+        with db.engine.begin() as conn:
+            for statement, parameters in statements:
+                assert [scan.detail for scan in explain_full_scans(conn, statement, parameters)] == []
+
+
+# インデックスのない列での絞り込みは全件走査として検出される（許可リストの対象にもならない）
+def test_full_scan_is_detected(app):
+    with app.app_context(), db.engine.begin() as conn:
+        placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+        scans = explain_full_scans(conn, f'SELECT * FROM water_record WHERE comment = {placeholder}', ('x',))
+
+    assert [scan.table for scan in scans] and {scan.table for scan in scans} == {'water_record'}
+    assert not any(scan.index_order for scan in scans)
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.routing import PRIMARY_UNTIL_COOKIE, REPLICA_BIND
+
+USER_ID = 15
+
+
+# 同じDBをレプリカとしても設定したアプリ（どちらのエンジンで実行されたかで振り分けを確認する）
+@pytest.fixture
+def replica_app(make_app, database_url):
+    return make_app(SQLALCHEMY_BINDS={REPLICA_BIND: database_url})
+
+
+# ブロック内でエンジンごとに実行された文の数を数える {'primary': n, 'replica': n}
+@contextmanager
+def count_by_engine(app):
+    counts = {'primary': 0, 'replica': 0}
+    with app.app_context():
+        engines = {'primary': db.engine, 'replica': db.engines[REPLICA_BIND]}
+    listeners = {}
+    for name, engine in engines.items():
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany, name=name):
+            counts[name] += 1
+        listeners[name] = before_cursor_execute
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counts
+    finally:
+        for name, engine in engines.items():
+            event.remove(engine, 'before_cursor_execute', listeners[name])
+
+
+def test_get_reads_from_replica(replica_app):
+    client = replica_app.test_client()
+    with count_by_engine(replica_app) as counts:
+        response = client.get(f'/api/v1/water_records/{USER_ID}')
+    assert response.status_code == 200
+    assert counts['primary'] == 0
+    assert counts['replica'] > 0
+
+
+# 書き込んだクライアントには REPLICA_STICKY_SECONDS の間プライマリから読むCookieが付く
+def test_reads_after_write_go_to_primary(replica_app):
+    client = replica_app.test_client()
+    with count_by_engine(replica_app) as counts:
+        created = client.post(f'/api/v1/water_records/{USER_ID}', json={'water_amount': 200, 'lat': 35.0, 'lon': 135.0})
+    assert created.status_code == 201
+    assert counts['replica'] == 0
+    assert client.get_cookie(PRIMARY_UNTIL_COOKIE) is not None
+
+    with count_by_engine(replica_app) as counts:
+        response = client.get(f'/api/v1/water_records/{USER_ID}')
+    assert counts['primary'] > 0
+    assert counts['replica'] == 0
+    assert response.get_json()['items'][0]['water_id'] == created.get_json()['water_id']
+
+    # 他のクライアントはレプリカから読む
+    with count_by_engine(replica_app) as counts:
+        replica_app.test_client().get(f'/api/v1/water_records/{USER_ID}')
+    assert counts['primary'] == 0
+
+
+def test_get_without_write_sets_no_cookie(replica_app):
+    client = replica_app.test_client()
+    client.get(f'/api/v1/users/{USER_ID}')
+    assert client.get_cookie(PRIMARY_UNTIL_COOKIE) is None
+
+
+def test_invalid_cookie_reads_from_replica(replica_app):
+    client = replica_app.test_client()
+    client.set_cookie(PRIMARY_UNTIL_COOKIE, 'not-a-number')
+    with count_by_engine(replica_app) as counts:
+        assert client.get(f'/api/v1/users/{USER_ID}').status_code == 200
+    assert counts['primary'] == 0
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+USER_ID = 13
+
+
+def test_update_user_response(client):
+    user = client.get(f'/api/v1/users/{USER_ID}').get_json()
+
+    response = client.put(f'/api/v1/users/{USER_ID}', json={'bio': 'updated'})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'message': 'User information updated successfully',
+        'user_ID': USER_ID,
+        'user_name': user['user_name'],
+        'bio': 'updated',
+        'X': user['X'],
+        'photo_url': user['photo_url'],
+    }
+
+
+def test_send_stamps_items(client):
+    response = client.get(f'/api/v1/stamps/send/{USER_ID}')
+    assert response.status_code == 200
+    items = response.get_json()['items']
+    assert items
+    assert set(items[0]) == {
+        'user_stamp_id', 'sender_id', 'receiver_id', 'stamp_id', 'stamp_message', 'stamp_image_url',
+        'after_stamp', 'created_at', 'updated_at', 'sender_name',
+    }
+    assert all(item['receiver_id'] == USER_ID for item in items)
+
+
+def test_water_totals_items(client):
+    start = date.today() - timedelta(days=40)
+    response = client.get(f'/api/v1/water_records/totals/{USER_ID}', query_string={'from': start.isoformat()})
+    assert response.status_code == 200
+    totals = response.get_json()
+    assert totals
+    assert all(set(total) == {'day', 'total_amount', 'record_count'} for total in totals)
+    assert [total['day'] for total in totals] == sorted(total['day'] for total in totals)
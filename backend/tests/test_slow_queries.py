@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+
+from app import db
+from app.instrumentation import normalize_sql
+
+USER_ID = 19
+LOGGER = 'app.instrumentation'
+
+
+def _slow_query_logs(caplog):
+    return [record.getMessage() for record in caplog.records
+            if record.name == LOGGER and record.getMessage().startswith('slow query')]
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM users WHERE user_id = 12 AND bio = 'it''s'") == \
+        'SELECT * FROM users WHERE user_id = ? AND bio = ?'
+    assert normalize_sql('SELECT * FROM users WHERE user_id IN (1, 2, 3)') == \
+        normalize_sql('SELECT * FROM users WHERE user_id IN (4, 5)')
+    assert normalize_sql('INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)') == 'INSERT INTO t (a, b) VALUES (?, ?), ...'
+
+
+# しきい値を0にするとすべての文が、正規化したSQL・パラメータ・エンドポイント名とともにログに出る
+def test_slow_queries_are_logged(make_app, caplog):
+    client = make_app(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_SAMPLE_RATE=1.0).test_client()
+    with caplog.at_level(logging.WARNING, logger=LOGGER):
+        assert client.get(f'/api/v1/users/{USER_ID}').status_code == 200
+
+    logs = _slow_query_logs(caplog)
+    assert len(logs) == 1
+    assert ' in users.get_user: SELECT ' in logs[0]
+    assert str(USER_ID) in logs[0].split('params=')[1]
+
+
+@pytest.mark.parametrize('overrides', [
+    {'SLOW_QUERY_THRESHOLD_MS': 60000, 'SLOW_QUERY_SAMPLE_RATE': 1.0},
+    {'SLOW_QUERY_THRESHOLD_MS': 0, 'SLOW_QUERY_SAMPLE_RATE': 0.0},
+])
+def test_fast_or_unsampled_queries_are_not_logged(make_app, caplog, overrides):
+    client = make_app(**overrides).test_client()
+    with caplog.at_level(logging.WARNING, logger=LOGGER):
+        assert client.get(f'/api/v1/users/{USER_ID}').status_code == 200
+    assert _slow_query_logs(caplog) == []
+
+
+# PostgreSQLでは文の形ごとに1回だけ実行計画もログに出す
+def test_slow_query_plan_is_logged_once_per_shape(make_app, caplog):
+    app = make_app(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_SAMPLE_RATE=1.0)
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('plans are only captured on PostgreSQL (set TEST_DATABASE_URL)')
+
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING, logger=LOGGER):
+        client.get(f'/api/v1/users/{USER_ID}')
+        client.get(f'/api/v1/users/{USER_ID + 1}')
+
+    plans = [record.getMessage() for record in caplog.records if record.getMessage().startswith('plan for slow query')]
+    assert len(plans) <= 1
+    assert len(_slow_query_logs(caplog)) == 2
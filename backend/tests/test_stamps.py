@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.models import UserStamp
+
+BROADCAST_URL = '/api/v1/stamps/send/broadcast'
+
+
+def test_broadcast_returns_ids_for_each_receiver(app, client):
+    receiver_ids = [6, 4, 5, 9999]
+    response = client.post(BROADCAST_URL, json={'sender_id': 1, 'stamp_id': 1, 'receiver_ids': receiver_ids})
+    assert response.status_code == 201
+    body = response.get_json()
+    assert [sent['receiver_id'] for sent in body['sent']] == [6, 4, 5]
+    assert body['not_found'] == [9999]
+
+    with app.app_context():
+        for sent in body['sent']:
+            user_stamp = db.session.get(UserStamp, sent['user_stamp_id'])
+            assert (user_stamp.sender_id, user_stamp.receiver_id) == (1, sent['receiver_id'])
+
+
+def test_poll_returns_immediately_when_waiters_are_at_capacity(make_app):
+    app = make_app(POLL_MAX_WAITERS=1, POLL_RETRY_AFTER=3)
+    url = '/api/v1/stamps/events/1'
+    cursor = app.test_client().get(url).get_json()['cursor']
+
+    waiting = threading.Event()
+    responses = []
+
+    def wait_for_events():
+        waiting.set()
+        responses.append(app.test_client().get(f'{url}?since={cursor}&timeout=1'))
+
+    thread = threading.Thread(target=wait_for_events)
+    thread.start()
+    waiting.wait()
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    response = app.test_client().get(f'{url}?since={cursor}&timeout=1')
+    assert time.monotonic() - start < 0.5
+    assert response.status_code == 200
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json() == {'events': [], 'cursor': cursor, 'reset': False, 'retry_after': 3}
+
+    thread.join()
+    assert 'retry_after' not in responses[0].get_json()
+
+    # 待っていたリクエストが終われば再び待てる
+    start = time.monotonic()
+    response = app.test_client().get(f'{url}?since={cursor}&timeout=0.3')
+    assert time.monotonic() - start >= 0.3
+    assert 'Retry-After' not in response.headers
+
+
+@pytest.mark.parametrize('body', [
+    {'sender_id': True, 'stamp_id': 1, 'receiver_ids': [2]},
+    {'sender_id': '1', 'stamp_id': 1, 'receiver_ids': [2]},
+    {'sender_id': 1, 'stamp_id': 1.5, 'receiver_ids': [2]},
+    {'sender_id': 1, 'stamp_id': 1, 'receiver_ids': [True, 2]},
+    {'sender_id': 1, 'stamp_id': 1, 'receiver_ids': '2'},
+    {'sender_id': 1, 'stamp_id': 1, 'nearby': True, 'radius': True},
+])
+def test_broadcast_rejects_non_integer_ids(client, body):
+    response = client.post(BROADCAST_URL, json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_poll_unknown_user(client):
+    response = client.get('/api/v1/stamps/events/999999?since=0&timeout=0')
+    assert response.status_code == 404
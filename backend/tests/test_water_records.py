@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+USER_ID = 7
+
+
+def test_now_returns_latest_record(client):
+    created = client.post(f'/api/v1/water_records/{USER_ID}', json={'water_amount': 330, 'lat': 35.0, 'lon': 135.0})
+    assert created.status_code == 201
+
+    response = client.get(f'/api/v1/water_records/now/{USER_ID}')
+    assert response.status_code == 200
+    assert response.get_json()['water_id'] == created.get_json()['water_id']
+
+
+def test_now_without_records(client):
+    response = client.get('/api/v1/water_records/now/999999')
+    assert response.status_code == 404
+
+
+def test_stats_accepts_timezone_aware_range(client):
+    start = datetime.now() - timedelta(days=7)
+    end = datetime.now() + timedelta(days=1)
+    naive = client.get(f'/api/v1/water_records/stats/{USER_ID}',
+                       query_string={'from': start.isoformat(), 'to': end.isoformat()})
+    aware = client.get(f'/api/v1/water_records/stats/{USER_ID}',
+                       query_string={'from': start.astimezone(timezone.utc).isoformat(),
+                                     'to': end.astimezone(timezone.utc).isoformat()})
+    assert naive.status_code == 200
+    assert aware.status_code == 200
+    assert aware.get_json() == naive.get_json()
+
+
+def test_stats_rejects_invalid_range(client):
+    response = client.get(f'/api/v1/water_records/stats/{USER_ID}?from=yesterday')
+    assert response.status_code == 400
+
+
+def test_export_streams_ndjson(client):
+    listed = client.get(f'/api/v1/water_records/{USER_ID}?limit=200').get_json()['items']
+
+    response = client.get(f'/api/v1/water_records/export?user_id={USER_ID}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['water_id'] for row in rows] == sorted(record['water_id'] for record in listed)
+    assert rows == sorted(listed, key=lambda record: record['water_id'])
+
+
+def test_export_filters_by_date(client):
+    start = datetime.now() - timedelta(days=7)
+    response = client.get('/api/v1/water_records/export',
+                          query_string={'user_id': USER_ID, 'from': start.isoformat(), 'to': datetime.now().isoformat()})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert rows
+    assert all(start <= datetime.fromisoformat(row['water_date']) < datetime.now() for row in rows)
+
+
+def test_export_rejects_invalid_date(client):
+    assert client.get('/api/v1/water_records/export?from=yesterday').status_code == 400
@@ -0,0 +1,97 @@
+import threading
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models import DailyWaterTotal, UserLocation, WaterRecord
+from app.write_buffer import WriteBuffer, insert_water_records
+
+USER_ID = 3
+CLIENTS = 12
+
+
+def _batch_count(app):
+    histogram = app.extensions['metrics'].write_batch_rows
+    return sum(value for name, _, value in histogram.samples() if name.endswith('_count'))
+
+
+def test_insert_returns_ids_in_input_order(app):
+    now = datetime.now()
+    rows = [
+        {'user_id': USER_ID, 'water_date': now - timedelta(minutes=i), 'water_type': 'water',
+         'water_amount': 1000 + i, 'lat': 35.0 + i / 100, 'lon': 139.0, 'comment': None}
+        for i in range(20)
+    ]
+    with app.app_context():
+        water_ids = insert_water_records(rows)
+        db.session.commit()
+
+        assert len(water_ids) == len(rows)
+        for water_id, row in zip(water_ids, rows):
+            assert db.session.get(WaterRecord, water_id).water_amount == row['water_amount']
+        # 最新の位置は一番新しい記録（先頭の行）になる
+        assert db.session.get(UserLocation, USER_ID).lat == rows[0]['lat']
+
+
+def test_concurrent_posts_are_committed_in_batches(make_app):
+    app = make_app(WRITE_BUFFER_ENABLED=True, WRITE_BUFFER_MAX_DELAY_MS=50)
+    with app.app_context():
+        before = db.session.get(DailyWaterTotal, (USER_ID, date.today()))
+        before_amount = before.total_amount if before else 0
+        before_count = before.record_count if before else 0
+
+    barrier = threading.Barrier(CLIENTS)
+    responses = [None] * CLIENTS
+
+    def post(i):
+        client = app.test_client()
+        barrier.wait()
+        response = client.post(f'/api/v1/water_records/{USER_ID}',
+                               json={'water_amount': 10 + i, 'lat': 35.6 + i / 1000, 'lon': 139.7})
+        responses[i] = (response.status_code, response.get_json())
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _ in responses] == [201] * CLIENTS
+    water_ids = [body['water_id'] for _, body in responses]
+    assert len(set(water_ids)) == CLIENTS
+    # 1回のコミットで複数の記録が登録されている
+    assert _batch_count(app) < CLIENTS
+
+    with app.app_context():
+        for i, water_id in enumerate(water_ids):
+            record = db.session.get(WaterRecord, water_id)
+            assert (record.user_id, record.water_amount) == (USER_ID, 10 + i)
+        total = db.session.get(DailyWaterTotal, (USER_ID, date.today()))
+        assert total.total_amount == before_amount + sum(10 + i for i in range(CLIENTS))
+        assert total.record_count == before_count + CLIENTS
+
+
+def test_writer_survives_a_failed_batch(make_app, monkeypatch):
+    app = make_app(WRITE_BUFFER_ENABLED=True)
+    flush = WriteBuffer._flush
+    calls = []
+
+    def failing_once(self, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError('connection lost')
+        return flush(self, batch)
+
+    monkeypatch.setattr(WriteBuffer, '_flush', failing_once)
+    client = app.test_client()
+    url = f'/api/v1/water_records/{USER_ID}'
+
+    # 失敗したバッチの記録は water_id なしの201ではなく500になる
+    response = client.post(url, json={'water_amount': 100, 'lat': 35.6, 'lon': 139.7})
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'Failed to create water record'}
+
+    # 書き込み用のスレッドは動き続けている
+    response = client.post(url, json={'water_amount': 120, 'lat': 35.6, 'lon': 139.7})
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.get(WaterRecord, response.get_json()['water_id']).water_amount == 120
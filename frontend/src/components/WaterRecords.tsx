@@ -9,7 +9,7 @@ export default function WaterRecords({ user_id }: { user_id: UserId }) {
 
   useEffect(() => {
     getWaterRecords(user_id).then((value) => {
-      setWaterRecords(value);
+      setWaterRecords(value.items);
       setLoading(false);
     });
   }, [user_id]);
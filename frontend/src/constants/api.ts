@@ -19,28 +19,45 @@ export const API_ENDPOINTS = {
   BASE_URL: API_BASE_URL,
 
   // GET Endpoints
+  /** Get everything the home screen needs in one request */
+  HOME: (userId: UserId) => `${API_BASE_URL}/home/${userId}`,
+  /** Get today's or this week's hydration ranking and the user's own rank */
+  LEADERBOARD: (userId: UserId, period: LeaderboardPeriod, nearby?: boolean) =>
+    `${API_BASE_URL}/leaderboard/${userId}?period=${period}${nearby ? "&nearby=true" : ""}`,
   /** Get user information by ID */
   USER_INFO: (userId: UserId) => `${API_BASE_URL}/users/${userId}`,
   /** Get nearby users information */
   NEAR_USERS_INFO: (userId: UserId) => `${API_BASE_URL}/users/nearby/${userId}`,
-  /** Get all water records for a user */
-  WATER_RECORDS: (userId: UserId) => `${API_BASE_URL}/water_records/${userId}`,
+  /** Get a page of water records for a user (newest first) */
+  WATER_RECORDS: (userId: UserId, cursor?: string) =>
+    `${API_BASE_URL}/water_records/${userId}${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`,
   /** Get today's water records for a user */
   WATER_RECORDS_TODAY: (userId: UserId) => `${API_BASE_URL}/water_records/today/${userId}`,
+  /** Get hydration totals per hour/day/week/month for a user */
+  WATER_STATS: (userId: UserId, bucket: StatsBucket, from: string, to?: string) =>
+    `${API_BASE_URL}/water_records/stats/${userId}?bucket=${bucket}&from=${encodeURIComponent(from)}` +
+    (to ? `&to=${encodeURIComponent(to)}` : ""),
   /** Get latest water records for a user */
   WATER_RECORDS_LATEST: (userId: UserId) => `${API_BASE_URL}/water_records/now/${userId}`,
   /** Get all available stamps */
   STAMPS: () => `${API_BASE_URL}/stamps`,
   /** Get specific stamp information */
   STAMP_INFO: (stampId: StampId) => `${API_BASE_URL}/stamps/${stampId}`,
-  /** Get stamps sent by a user */
-  STAMPS_SENT_INFO: (userId: UserId) => `${API_BASE_URL}/stamps/send/${userId}`,
+  /** Get a page of stamps sent to a user (newest first) */
+  STAMPS_SENT_INFO: (userId: UserId, cursor?: string) =>
+    `${API_BASE_URL}/stamps/send/${userId}${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`,
+  /** Long-poll incoming stamp and reply events for a user */
+  STAMP_EVENTS: (userId: UserId, since?: number, timeoutSec?: number) =>
+    `${API_BASE_URL}/stamps/events/${userId}` +
+    (since !== undefined ? `?since=${since}${timeoutSec !== undefined ? `&timeout=${timeoutSec}` : ""}` : ""),
 
   // POST Endpoints
   /** Create a new user */
   CREATE_USER: () => `${API_BASE_URL}/users`,
   /** Create a new water record for a user */
   CREATE_WATER_RECORD: (userId: UserId) => `${API_BASE_URL}/water_records/${userId}`,
+  /** Create many water records for a user at once (offline sync) */
+  CREATE_WATER_RECORDS_BATCH: (userId: UserId) => `${API_BASE_URL}/water_records/${userId}/batch`,
   /** Send a stamp between users */
   SEND_STAMP: (_sender_id: UserId, _receiver_id: UserId, _stamp_id: StampId) => `${API_BASE_URL}/stamps/send`,
 
@@ -110,6 +127,120 @@ export type WaterRecord = {
   user_id: UserId
 }
 
+/**
+ * Per-record result of a batch water record upload
+ */
+export type WaterRecordBatchResult = {
+  /** Position of the record in the uploaded array */
+  index: number,
+  /** Whether the record was stored */
+  status: "created" | "error",
+  /** ID of the stored record */
+  water_id?: number,
+  /** Stored consumption time */
+  water_date?: string,
+  /** Validation error for rejected records */
+  error?: string
+}
+
+/**
+ * Response of a batch water record upload
+ */
+export type WaterRecordBatchResponse = {
+  /** ID of the user the records belong to */
+  user_id: UserId,
+  /** Number of stored records */
+  created: number,
+  /** Number of rejected records */
+  failed: number,
+  /** Results in the same order as the uploaded records */
+  results: WaterRecordBatchResult[]
+}
+
+/** Bucket size of the hydration statistics */
+export type StatsBucket = "hour" | "day" | "week" | "month";
+
+/**
+ * Hydration totals for one bucket
+ */
+export type WaterStatsBucket = {
+  /** Start of the bucket (weeks start on Monday) */
+  start: string,
+  /** Total amount consumed in milliliters */
+  total_amount: number,
+  /** Number of records */
+  record_count: number,
+  /** Breakdown by beverage type, largest first */
+  by_type: {
+    water_type: string | null,
+    total_amount: number,
+    record_count: number
+  }[]
+}
+
+/**
+ * Response of the hydration statistics endpoint
+ */
+export type WaterStats = {
+  /** ID of the user the statistics belong to */
+  user_id: UserId,
+  /** Bucket size of the series */
+  bucket: StatsBucket,
+  /** One entry per bucket in the range, including empty buckets */
+  series: WaterStatsBucket[]
+}
+
+/** Period of the hydration ranking */
+export type LeaderboardPeriod = "day" | "week";
+
+/**
+ * Hydration ranking for today or this week
+ */
+export type Leaderboard = {
+  /** Period of the ranking */
+  period: LeaderboardPeriod,
+  /** First day of the period in YYYY-MM-DD format */
+  start: string,
+  /** Top users, best first */
+  top: {
+    /** 1-based rank */
+    rank: number,
+    user_id: UserId,
+    user_name: string | null,
+    photo_url: string | null,
+    /** Total amount consumed in the period in milliliters */
+    total_amount: number
+  }[],
+  /** Rank of the requesting user (null when nothing recorded yet) */
+  me: {
+    rank: number | null,
+    total_amount: number
+  }
+}
+
+/**
+ * Aggregated data for the home screen
+ */
+export type HomeData = {
+  /** Profile of the user */
+  user: Omit<User, "password_hash">,
+  /** Today's hydration total */
+  today: {
+    /** Day in YYYY-MM-DD format */
+    day: string,
+    /** Total amount consumed today in milliliters */
+    total_amount: number,
+    /** Number of records today */
+    record_count: number
+  },
+  /** Latest water record, or null when the user has none */
+  latest_record: WaterRecord | null,
+  /** Number of received stamps not replied to yet */
+  unreplied_stamps: number,
+  /** Nearby users sorted by distance */
+  nearby_users: (NearUser & { distance: number })[]
+}
+
 /**
  * User stamp interaction record
  */
@@ -130,6 +261,42 @@ export type UserStamp = {
   updated_at: Date
 }
 
+/**
+ * Event pushed when a stamp is received or a sent stamp is replied to
+ */
+export type StampEvent = {
+  /** "stamp" for a received stamp, "reply" for a reply to a sent stamp */
+  type: "stamp" | "reply",
+  /** Unique user stamp interaction identifier */
+  user_stamp_id: number,
+  /** ID of the user sending the stamp */
+  sender_id: UserId,
+  /** ID of the user receiving the stamp */
+  receiver_id: UserId,
+  /** ID of the stamp being sent */
+  stamp_id: StampId,
+  /** Whether the stamp has been replied to */
+  after_stamp: boolean,
+  /** Timestamp when the record was created */
+  created_at: string,
+  /** Timestamp when the record was last updated */
+  updated_at: string
+}
+
+/**
+ * Response of the stamp event long-poll endpoint
+ */
+export type StampEventsResponse = {
+  /** Events newer than the given cursor */
+  events: StampEvent[],
+  /** Cursor to pass as `since` on the next poll */
+  cursor: number,
+  /** True when events were missed and the inbox should be reloaded */
+  reset: boolean,
+  /** Set when the server is too busy to wait: seconds to wait before polling again */
+  retry_after?: number
+}
+
 /**
  * Stamp entity representing an encouragement stamp
  */
@@ -142,6 +309,19 @@ export type Stamp = {
   image_url: string
 }
 
+/**
+ * One page of a cursor-paginated list endpoint
+ * @template T - Type of the listed items
+ */
+export type Page<T> = {
+  /** Items on this page */
+  items: T[],
+  /** Maximum number of items per page */
+  limit: number,
+  /** Opaque cursor for the next page, or null on the last page */
+  next_cursor: string | null
+}
+
 /**
  * Custom error class for API-related errors
  * Extends the standard Error class with additional API-specific information
@@ -190,6 +370,44 @@ type RequestOptions = {
   guard?: TypeGuard<any>;
 };
 
+/** Maximum number of URLs kept in the ETag cache */
+const ETAG_CACHE_MAX_ENTRIES = 100;
+
+/**
+ * Last GET response body per URL together with its ETag
+ * Used to revalidate with If-None-Match and reuse the body on 304 Not Modified
+ * Kept in least-recently-used order (Map iteration order) and bounded by ETAG_CACHE_MAX_ENTRIES
+ */
+const etagCache = new Map<string, { etag: string, data: unknown }>();
+
+/**
+ * Looks up a cached response and marks it as most recently used
+ * @param url - The requested URL
+ * @returns The cached ETag and body, or undefined
+ */
+const getCachedResponse = (url: string) => {
+  const entry = etagCache.get(url);
+  if (entry) {
+    etagCache.delete(url);
+    etagCache.set(url, entry);
+  }
+  return entry;
+};
+
+/**
+ * Stores a response, evicting the least recently used entries beyond the limit
+ * @param url - The requested URL
+ * @param etag - ETag header of the response
+ * @param data - Parsed response body
+ */
+const setCachedResponse = (url: string, etag: string, data: unknown) => {
+  etagCache.delete(url);
+  etagCache.set(url, { etag, data });
+  while (etagCache.size > ETAG_CACHE_MAX_ENTRIES) {
+    etagCache.delete(etagCache.keys().next().value as string);
+  }
+};
+
 /**
  * Core HTTP request helper function with error handling and optional type validation
  * @template T - Expected response type
@@ -218,16 +436,24 @@ async function request<T>(
       timeoutId = setTimeout(() => controller.abort(), timeoutMs);
     }
 
+    const cached = method === "GET" ? getCachedResponse(url) : undefined;
+
     const res = await fetch(url, {
       method,
       headers: {
         "Content-Type": "application/json",
+        ...(cached ? { "If-None-Match": cached.etag } : {}),
         ...(headers ?? {})
       },
       body: body !== undefined ? JSON.stringify(body) : undefined,
       signal: abortSignal
     });
 
+    // 304 => reuse the previously received body
+    if (res.status === 304 && cached) {
+      return cached.data as T;
+    }
+
     // Non-2xx => throw
     if (!res.ok) {
       let errBody: unknown = undefined;
@@ -248,6 +474,12 @@ async function request<T>(
       throw new ApiError(`Response validation failed for ${method} ${url}`, res.status, data);
     }
 
+    // Only responses that carry an ETag can be revalidated (long-poll responses have none)
+    const etag = res.headers.get("ETag");
+    if (method === "GET" && etag) {
+      setCachedResponse(url, etag, data);
+    }
+
     return data as T;
   } catch (e: any) {
     if (e?.name === "AbortError") {
@@ -328,6 +560,27 @@ const getUserInfo = async (userId: UserId): Promise<User> => {
   return await api.get<User>(API_ENDPOINTS.USER_INFO(userId));
 };
 
+/**
+ * Retrieves the profile, today's total, latest record, unreplied stamp count
+ * and nearby users in a single request
+ * @param userId - The ID of the user opening the home screen
+ * @returns Promise resolving to the aggregated home screen data
+ */
+const getHome = async (userId: UserId): Promise<HomeData> => {
+  return await api.get<HomeData>(API_ENDPOINTS.HOME(userId));
+};
+
+/**
+ * Retrieves the hydration ranking and the user's own rank
+ * @param userId - The ID of the requesting user
+ * @param period - "day" for today or "week" for this week
+ * @param nearby - Rank only among users near the requesting user
+ * @returns Promise resolving to the ranking
+ */
+const getLeaderboard = async (userId: UserId, period: LeaderboardPeriod = "day", nearby = false): Promise<Leaderboard> => {
+  return await api.get<Leaderboard>(API_ENDPOINTS.LEADERBOARD(userId, period, nearby));
+};
+
 /**
  * Retrieves information about nearby users
  * @param userId - The ID of the user to retrieve nearby users for
@@ -338,12 +591,13 @@ const getNearUsersInfo = async (userId: UserId): Promise<NearUser[]> => {
 };
 
 /**
- * Retrieves all water consumption records for a specific user
+ * Retrieves a page of water consumption records for a specific user
  * @param userId - The ID of the user whose records to retrieve
- * @returns Promise resolving to array of water records
+ * @param cursor - Cursor returned by the previous page, omitted for the first page
+ * @returns Promise resolving to a page of water records
  */
-const getWaterRecords = async (userId: UserId): Promise<WaterRecord[]> => {
-  return await api.get<WaterRecord[]>(API_ENDPOINTS.WATER_RECORDS(userId));
+const getWaterRecords = async (userId: UserId, cursor?: string): Promise<Page<WaterRecord>> => {
+  return await api.get<Page<WaterRecord>>(API_ENDPOINTS.WATER_RECORDS(userId, cursor));
 };
 
 /**
@@ -364,6 +618,18 @@ const getLatestWaterRecords = async (userId: UserId): Promise<WaterRecord[]> =>
   return await api.get<WaterRecord[]>(API_ENDPOINTS.WATER_RECORDS_LATEST(userId));
 };
 
+/**
+ * Retrieves hydration totals aggregated per bucket for charts
+ * @param userId - The ID of the user whose records to aggregate
+ * @param bucket - Bucket size (hour, day, week or month)
+ * @param from - Start of the range (ISO 8601), rounded down to the bucket start
+ * @param to - End of the range (ISO 8601, exclusive), defaults to now
+ * @returns Promise resolving to the aggregated series
+ */
+const getWaterStats = async (userId: UserId, bucket: StatsBucket, from: string, to?: string): Promise<WaterStats> => {
+  return await api.get<WaterStats>(API_ENDPOINTS.WATER_STATS(userId, bucket, from, to));
+};
+
 /**
  * Retrieves all available stamps
  * @returns Promise resolving to array of stamps
@@ -382,12 +648,26 @@ const getStampInfo = async (stampId: StampId): Promise<Stamp> => {
 };
 
 /**
- * Retrieves stamps sent by a specific user
- * @param userId - The ID of the user whose sent stamps to retrieve
- * @returns Promise resolving to array of user stamp interactions
+ * Retrieves a page of stamps sent to a specific user
+ * @param userId - The ID of the user whose received stamps to retrieve
+ * @param cursor - Cursor returned by the previous page, omitted for the first page
+ * @returns Promise resolving to a page of user stamp interactions
  */
-const getStampsSentInfo = async (userId: UserId): Promise<UserStamp[]> => {
-  return await api.get<UserStamp[]>(API_ENDPOINTS.STAMPS_SENT_INFO(userId));
+const getStampsSentInfo = async (userId: UserId, cursor?: string): Promise<Page<UserStamp>> => {
+  return await api.get<Page<UserStamp>>(API_ENDPOINTS.STAMPS_SENT_INFO(userId, cursor));
+};
+
+/**
+ * Waits for stamp events newer than the cursor (long polling)
+ * Call without `since` first to obtain the current cursor
+ * When the response has `retry_after`, wait that many seconds before the next poll
+ * @param userId - The ID of the user to receive events for
+ * @param since - Cursor returned by the previous call
+ * @param timeoutSec - Maximum seconds the server waits before answering with no events
+ * @returns Promise resolving to the new events and the next cursor
+ */
+const pollStampEvents = async (userId: UserId, since?: number, timeoutSec?: number): Promise<StampEventsResponse> => {
+  return await api.get<StampEventsResponse>(API_ENDPOINTS.STAMP_EVENTS(userId, since, timeoutSec));
 };
 
 /**
@@ -409,6 +689,19 @@ const createWaterRecord = async (userId: UserId, record: WaterRecord): Promise<W
   return await api.post<WaterRecord>(API_ENDPOINTS.CREATE_WATER_RECORD(userId), record);
 };
 
+/**
+ * Uploads water consumption records recorded while offline in one request
+ * @param userId - The ID of the user creating the records
+ * @param records - Water consumption records to store (at most 100)
+ * @returns Promise resolving to per-record results
+ */
+const createWaterRecordsBatch = async (
+  userId: UserId,
+  records: Partial<WaterRecord>[]
+): Promise<WaterRecordBatchResponse> => {
+  return await api.post<WaterRecordBatchResponse>(API_ENDPOINTS.CREATE_WATER_RECORDS_BATCH(userId), { records });
+};
+
 /**
  * Updates user information
  * @param userId - The ID of the user to update
@@ -435,7 +728,7 @@ const updateWaterRecord = async (waterId: number, record: WaterRecord): Promise<
  */
 export {
   createUser,
-  createWaterRecord, getLatestWaterRecords, getStampInfo, getStamps, getStampsSentInfo, getTodayWaterRecords, getUserInfo,
-  getWaterRecords, updateUserInfo,
+  createWaterRecord, createWaterRecordsBatch, getHome, getLatestWaterRecords, getLeaderboard, getStampInfo, getStamps, getStampsSentInfo, getTodayWaterRecords, getUserInfo,
+  getWaterRecords, getWaterStats, pollStampEvents, updateUserInfo,
   updateWaterRecord, getNearUsersInfo
 };